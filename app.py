@@ -1,141 +1,294 @@
 import streamlit as st
 import pandas as pd
 from modules.extract_tables import extraer_tablas
-from modules.compare_oei import comparar_oei, comparar_oei_ind
-from modules.compare_aei import comparar_aei, comparar_aei_ind
-from io import BytesIO
+from modules.comparador import COMPARACIONES, iterar_tablas, precargar_estandar
+from modules.motor import estilizar_resultado
+from modules.modelo import calentar_modelo
+from modules.cache_resultados import clave_resultados, leer_cache, guardar_cache
+from modules.reporte import exportar_excel, resumen_resultados
+from modules.diferencias import completar_diferencias
+from modules.versiones import comparar_version
+from modules.trazas import iniciar_traza, tramo
 
 RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+UMBRAL = 0.75
+MAX_PROCESADOS_SESION = 3  # archivos cuyos resultados se conservan en la sesión
 
 st.set_page_config(page_title="Comparador PEI-GL", layout="wide")
 st.title("📊 Comparador de elementos PEI de los Gobiernos Locales")
 
+
+# ===============================
+# Recursos y datos en caché
+# ===============================
+# Streamlit vuelve a ejecutar este script ante cualquier interacción; todo lo
+# costoso se calcula una sola vez y se reutiliza en las siguientes ejecuciones.
+
+# El modelo se carga y se calienta una sola vez por proceso del servidor
+@st.cache_resource(show_spinner="Cargando modelo de lenguaje...")
+def cargar_modelo():
+    return calentar_modelo()
+
+
+# Hojas y embeddings del estándar, una sola vez por proceso
+@st.cache_resource(show_spinner="Cargando matriz estándar...")
+def cargar_estandar(ruta_estandar):
+    precargar_estandar(ruta_estandar)
+    return ruta_estandar
+
+
+# Extracción de tablas: una vez por archivo subido (file_id)
+@st.cache_data(show_spinner="Extrayendo tablas...", max_entries=20)
+def extraer_archivo(file_id, _archivo):
+    informe = {}
+    _archivo.seek(0)
+    tablas = extraer_tablas(_archivo, informe=informe)
+    return tablas, informe
+
+
+# Clave de la caché de resultados: una vez por archivo y parámetros
+@st.cache_data(show_spinner=False, max_entries=20)
+def clave_archivo(file_id, _archivo, umbral, num_candidatos, diferencias_diferidas):
+    return clave_resultados(_archivo, RUTA_ESTANDAR, umbral, num_candidatos, diferencias_diferidas)
+
+
+def recordar_procesado(clave, procesado):
+    """
+    Conserva (tablas, resultados, informe) en la sesión para las siguientes
+    ejecuciones del script (solo los últimos MAX_PROCESADOS_SESION archivos).
+    """
+    procesados = st.session_state.setdefault("procesados", {})
+    procesados.pop(clave, None)
+    procesados[clave] = procesado
+    while len(procesados) > MAX_PROCESADOS_SESION:
+        procesados.pop(next(iter(procesados)))
+
+
+def buscar_procesado(clave):
+    """
+    (tablas, resultados, informe) ya calculados en esta sesión o, si no, en la
+    caché en disco (archivos procesados en otras sesiones); None si no existen.
+    """
+    procesados = st.session_state.setdefault("procesados", {})
+    if clave not in procesados:
+        # Con municipalidad (clave (archivo, municipalidad)) los resultados dependen
+        # de la versión anterior: no se buscan en la caché en disco
+        en_cache = leer_cache(clave) if isinstance(clave, str) else None
+        if en_cache is None:
+            return None
+        tablas, resultados = en_cache
+        recordar_procesado(clave, (tablas, resultados, {"desde_cache": True}))
+    return procesados[clave]
+
+
+def mostrar_resultado(titulo, df_result, diferencias_diferidas):
+    """
+    Tabla de resultados de una comparación (con selección de filas para
+    calcular sus diferencias en el modo "Diferencias bajo demanda").
+    """
+    if not diferencias_diferidas:
+        st.dataframe(estilizar_resultado(df_result), use_container_width=True)
+        return
+
+    # Las diferencias se calculan solo para las filas seleccionadas
+    seleccion = st.dataframe(
+        estilizar_resultado(df_result), use_container_width=True,
+        on_select="rerun", selection_mode="multi-row", key=f"tabla_{titulo}",
+    )
+    filas = seleccion.selection.rows
+    if filas:
+        st.dataframe(
+            completar_diferencias(df_result, filas).iloc[filas],
+            use_container_width=True,
+        )
+    else:
+        st.caption("Selecciona filas para ver sus diferencias.")
+
+
+def tabla_diagnostico(registros):
+    """
+    Tramos medidos en esta ejecución del script, listos para mostrarse.
+    """
+    df = pd.DataFrame(registros)
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda v: "" if v is None or v != v else str(v))
+    return df
+
+
+# Tramos (tiempo, memoria, filas, caché) de esta ejecución del script
+registros_traza = iniciar_traza()
+
+# Si un tramo no tiene tramos hijos, el resultado vino de la caché de Streamlit
+with tramo("app.cargar_modelo") as traza:
+    cargar_modelo()
+    if not traza.hijos:
+        traza.anotar(cache="st.cache_resource")
+with tramo("app.cargar_estandar") as traza:
+    cargar_estandar(RUTA_ESTANDAR)
+    if not traza.hijos:
+        traza.anotar(cache="st.cache_resource")
+
 # ===============================
 # 1️⃣ Cargar archivo del usuario
 # ===============================
 uploaded_file = st.file_uploader("Sube tu archivo PEI (Word o PDF)", type=["docx", "pdf"])
 
+num_candidatos = st.sidebar.number_input(
+    "Candidatos del estándar por fila", min_value=1, max_value=5, value=1,
+    help="Con más de 1 se muestran también las coincidencias alternativas y su similitud."
+)
+
+diferencias_diferidas = st.sidebar.checkbox(
+    "Diferencias bajo demanda", value=False,
+    help="No calcula las diferencias de todas las filas; se calculan solo para las filas que selecciones."
+)
+
+municipio = st.sidebar.text_input(
+    "Municipalidad (historial de versiones)", value="",
+    help="Guarda cada archivo como una versión del PEI de la municipalidad y compara solo "
+         "las filas nuevas o modificadas respecto de la versión anterior."
+).strip()
+
 if uploaded_file:
-    tablas = extraer_tablas(uploaded_file)
-    st.success("✅ Tablas extraídas correctamente")
+    file_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}-{uploaded_file.size}"
 
     # ===============================
-    # 2️⃣ Ejecutar todas las comparaciones
+    # 2️⃣ Resultados ya calculados (sesión o caché en disco) o extracción
     # ===============================
-    with st.spinner("Comparando tablas..."):
-        df_oei_den = comparar_oei(RUTA_ESTANDAR, tablas.get("OEI"))
-        df_oei_ind = comparar_oei_ind(RUTA_ESTANDAR, tablas.get("OEI"))
-        df_aei_den = comparar_aei(RUTA_ESTANDAR, tablas.get("AEI"))
-        df_aei_ind = comparar_aei_ind(RUTA_ESTANDAR, tablas.get("AEI"))
-
-    # Guardar en session_state
-    st.session_state.update({
-        "df_result_oei_den": df_oei_den,
-        "df_result_oei_ind": df_oei_ind,
-        "df_result_aei_den": df_aei_den,
-        "df_result_aei_ind": df_aei_ind,
-    })
-
-    st.success("✅ Comparaciones completadas")
+    clave = clave_archivo(file_id, uploaded_file, UMBRAL, int(num_candidatos), diferencias_diferidas)
+    if municipio:
+        clave = (clave, municipio)
+    procesado = buscar_procesado(clave)
+    if procesado is not None:
+        tablas, resultados, informe_extraccion = procesado
+    else:
+        with tramo("app.extraer_archivo", archivo=uploaded_file.name) as traza:
+            tablas, informe_extraccion = extraer_archivo(file_id, uploaded_file)
+            if not traza.hijos:
+                traza.anotar(cache="st.cache_data")
+        resultados = None
+
+    if informe_extraccion.get("desde_cache"):
+        st.success("✅ Resultados recuperados de la caché (archivo ya procesado)")
+    else:
+        st.success("✅ Tablas extraídas correctamente")
+        if "paginas_analizadas" in informe_extraccion:
+            st.caption(f"Páginas del PDF analizadas: {informe_extraccion['paginas_analizadas']}")
+        if "aviso_paginas" in informe_extraccion:
+            st.warning(f"⚠️ {informe_extraccion['aviso_paginas']}")
 
     # ===============================
-    # 3️⃣ Mostrar resultados individuales
+    # 3️⃣ Resultados individuales y 4️⃣ resumen estadístico (sin promedio general)
     # ===============================
     st.header("📋 Resultados de comparaciones")
+    tabs = dict(zip(COMPARACIONES, st.tabs(list(COMPARACIONES))))
+    progreso = st.empty()
 
-    tabs = st.tabs([
-        "OEI (Denominación)",
-        "OEI (Indicador)",
-        "AEI (Denominación)",
-        "AEI (Indicador)"
-    ])
-
-    for tab, (titulo, key) in zip(
-        tabs,
-        [
-            ("OEI (Denominación)", "df_result_oei_den"),
-            ("OEI (Indicador)", "df_result_oei_ind"),
-            ("AEI (Denominación)", "df_result_aei_den"),
-            ("AEI (Indicador)", "df_result_aei_ind"),
-        ]
-    ):
-        with tab:
-            df_result = st.session_state[key]
- 
-            if isinstance(df_result, pd.io.formats.style.Styler):
-                st.dataframe(df_result, use_container_width=True)
-            else:
-                st.dataframe(df_result, use_container_width=True)
-   
-    # ===============================
-    # 4️⃣ Resumen estadístico (sin promedio general)
-    # ===============================
     st.header("📈 Resumen de Resultados")
+    espacio_resumen = st.empty()
+
+    if resultados is None and municipio:
+        # Solo las filas nuevas o modificadas respecto de la versión anterior pasan por el modelo
+        with tramo("app.comparar_version", municipio=municipio):
+            with st.spinner("Comparando con la versión anterior..."):
+                resultados, df_cambios, informe_version = comparar_version(
+                    RUTA_ESTANDAR, municipio, tablas, UMBRAL, int(num_candidatos), diferencias_diferidas,
+                    huella=clave[0], archivo=uploaded_file.name,
+                )
+        informe_extraccion = {**informe_extraccion, "version": {**informe_version, "cambios": df_cambios}}
+        recordar_procesado(clave, (tablas, resultados, informe_extraccion))
+        progreso.success("✅ Comparaciones completadas")
+
+    if resultados is None:
+        # Las comparaciones corren en paralelo; cada pestaña y el resumen se
+        # completan en cuanto termina su comparación
+        espacios = {nombre: tab.empty() for nombre, tab in tabs.items()}
+        for espacio in espacios.values():
+            espacio.info("⏳ Comparando...")
+        barra = progreso.progress(0.0, text=f"0/{len(COMPARACIONES)} comparaciones completadas")
 
-    def calcular_estadisticas(df):
-        if isinstance(df, pd.io.formats.style.Styler):
-            df = df.data
-        if df is None or df.empty:
-            return 0
-        total = len(df)
-        exactas = (df["Resultado"] == "Coincidencia exacta").sum()
-        parciales = (df["Resultado"] == "Coincidencia parcial").sum()
-        no_coincide = (df["Resultado"] == "No coincide").sum()
-        return {
-            "Total": total,
-            "Exactas": exactas,
-            "Parciales": parciales,
-            "No coincide": no_coincide,
-            "% Exactas": round(exactas / total * 100, 1) if total else 0,
-            "% Parciales": round(parciales / total * 100, 1) if total else 0,
-            "% No coincide": round(no_coincide / total * 100, 1) if total else 0,
-        }
-
-    resumen_data = []
-    comparaciones = {
-        "OEI (Denominación)": "df_result_oei_den",
-        "OEI (Indicador)": "df_result_oei_ind",
-        "AEI (Denominación)": "df_result_aei_den",
-        "AEI (Indicador)": "df_result_aei_ind"
-    }
-
-    for nombre, key in comparaciones.items():
-        df = st.session_state[key]
-        stats = calcular_estadisticas(df)
-        resumen_data.append({
-            "Comparación": nombre,
-            **stats
-        })
-
-    df_resumen = pd.DataFrame(resumen_data)
-    st.dataframe(df_resumen, use_container_width=True)
-    st.session_state["df_resumen"] = df_resumen
+        terminados = {}
+        with tramo("app.comparar_tablas"):
+            for titulo, df_result in iterar_tablas(
+                RUTA_ESTANDAR, tablas, UMBRAL, int(num_candidatos), diferencias_diferidas
+            ):
+                terminados[titulo] = df_result
+                with espacios[titulo].container():
+                    mostrar_resultado(titulo, df_result, diferencias_diferidas)
+                barra.progress(
+                    len(terminados) / len(COMPARACIONES),
+                    text=f"{len(terminados)}/{len(COMPARACIONES)} comparaciones completadas ({titulo})",
+                )
+                espacio_resumen.dataframe(resumen_resultados(
+                    {nombre: terminados[nombre] for nombre in COMPARACIONES if nombre in terminados}
+                ), use_container_width=True)
+
+        resultados = {nombre: terminados[nombre] for nombre in COMPARACIONES}
+        guardar_cache(clave, tablas, resultados)
+        recordar_procesado(clave, (tablas, resultados, informe_extraccion))
+        progreso.success("✅ Comparaciones completadas")
+    else:
+        # Incluye la aplicación de estilos (Styler) y el envío de las tablas al navegador
+        with tramo("app.mostrar_tablas", filas=sum(len(df) for df in resultados.values())):
+            for titulo, df_result in resultados.items():
+                with tabs[titulo]:
+                    mostrar_resultado(titulo, df_result, diferencias_diferidas)
+
+    df_resumen = resumen_resultados(resultados)
+    espacio_resumen.dataframe(df_resumen, use_container_width=True)
+
+    # ===============================
+    # 🔁 Cambios respecto de la versión anterior (con municipalidad)
+    # ===============================
+    informe_version = informe_extraccion.get("version")
+    df_cambios = None
+    if informe_version is not None:
+        df_cambios = informe_version["cambios"]
+        st.header("🔁 Cambios respecto de la versión anterior")
+        if informe_version["anterior"] is None:
+            st.info(f"Primera versión guardada de {municipio} (versión {informe_version['version']}).")
+        else:
+            st.caption(
+                f"Versión {informe_version['version']} comparada con la versión {informe_version['anterior']}: "
+                f"{informe_version['recalculadas']} filas comparadas, "
+                f"{informe_version['reutilizadas']} reutilizadas de la versión anterior."
+            )
+            if df_cambios.empty:
+                st.success("✅ Sin cambios en las tablas OEI / AEI.")
+            else:
+                st.dataframe(df_cambios, use_container_width=True)
 
     # ===============================
     # 5️⃣ Exportar a Excel consolidado
     # ===============================
     st.header("📤 Exportar Resultados")
 
-    def exportar_excel():
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-            df_resumen.to_excel(writer, sheet_name="Resumen", index=False)
-            for nombre, key in comparaciones.items():
-                df = st.session_state[key]
-                if isinstance(df, pd.io.formats.style.Styler):
-                    df = df.data
-                df.to_excel(writer, sheet_name=nombre.replace(" ", "_"), index=False)
-        output.seek(0)
-        return output
-
-    excel_bytes = exportar_excel()
-
-    st.download_button(
-        label="⬇️ Descargar Excel Consolidado",
-        data=excel_bytes,
-        file_name="Comparativo_PEIGL_Completo.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
+    # El Excel solo se genera cuando se solicita, no en cada interacción
+    clave_excel = (file_id, int(num_candidatos), diferencias_diferidas, municipio)
+    if st.session_state.get("excel_clave") != clave_excel:
+        if st.button("📄 Preparar Excel consolidado"):
+            with tramo("app.exportacion_excel"):
+                st.session_state["excel_bytes"] = exportar_excel(df_resumen, {
+                    nombre: completar_diferencias(df) if diferencias_diferidas else df
+                    for nombre, df in resultados.items()
+                }, df_cambios)
+            st.session_state["excel_clave"] = clave_excel
+
+    if st.session_state.get("excel_clave") == clave_excel:
+        st.download_button(
+            label="⬇️ Descargar Excel Consolidado",
+            data=st.session_state["excel_bytes"],
+            file_name="Comparativo_PEIGL_Completo.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
 
 else:
     st.info("📁 Sube un archivo Word o PDF para iniciar la comparación.")
+
+# ===============================
+# 🩺 Diagnóstico
+# ===============================
+if registros_traza:
+    with st.expander("🩺 Diagnóstico"):
+        st.caption("Tiempo, memoria máxima del proceso, filas y uso de caché de cada etapa de esta ejecución.")
+        st.dataframe(tabla_diagnostico(registros_traza), use_container_width=True)
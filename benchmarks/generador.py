@@ -0,0 +1,202 @@
+"""
+Generador de PEI sintéticos (Word y PDF) para las mediciones de rendimiento.
+
+Las filas de las tablas OEI y AEI se arman con el vocabulario real del libro
+estándar (textos originales y con pequeñas alteraciones), rodeadas de páginas
+de texto y de tablas de "ruido" que el extractor debe descartar.
+
+Uso:
+    python -m benchmarks.generador salida.docx [--oei 12] [--aei 40] [--paginas 30] [--ruido 5]
+    python -m benchmarks.generador salida.pdf  ...
+"""
+import os
+import random
+import argparse
+from xml.sax.saxutils import escape
+
+import pandas as pd
+
+try:
+    from docx import Document  # python-docx
+    from docx.enum.text import WD_BREAK
+except ImportError:
+    Document = None
+
+try:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, PageBreak
+except ImportError:
+    SimpleDocTemplate = None
+
+RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+COL_TEXTO = "Denominación de OEI / AEI / AO"
+COL_INDICADOR = "Nombre del indicador/ Unidad de medida"
+ENCABEZADO_OEI = ["Código", "Objetivos Estratégicos Institucionales", "Nombre del Indicador"]
+ENCABEZADO_AEI = ["Código", "Acciones Estratégicas Institucionales", "Nombre del Indicador"]
+PARRAFOS_POR_PAGINA = 6
+
+
+# === CONTENIDO ===
+def _alterar(texto, azar):
+    """
+    Deja el texto igual (≈ la mitad de las veces) o le quita / intercambia una palabra.
+    """
+    palabras = str(texto).split()
+    opcion = azar.random()
+    if opcion < 0.5 or len(palabras) < 4:
+        return str(texto)
+    i = azar.randrange(len(palabras) - 1)
+    if opcion < 0.75:
+        del palabras[i]
+    else:
+        palabras[i], palabras[i + 1] = palabras[i + 1], palabras[i]
+    return " ".join(palabras)
+
+
+def generar_contenido(num_oei=12, num_aei=40, paginas=30, tablas_ruido=5,
+                      ruta_estandar=RUTA_ESTANDAR, semilla=0):
+    """
+    Devuelve un diccionario con las filas de las tablas OEI y AEI, las tablas de
+    ruido y los párrafos de relleno. Mismo resultado para la misma semilla.
+    """
+    azar = random.Random(semilla)
+    oei = pd.read_excel(ruta_estandar, sheet_name="OEI")
+    aei = pd.read_excel(ruta_estandar, sheet_name="AEI")
+
+    filas_oei = []
+    for n in range(num_oei):
+        fila = oei.iloc[n % len(oei)]
+        filas_oei.append([f"OEI.{n + 1:02d}", _alterar(fila[COL_TEXTO], azar), _alterar(fila[COL_INDICADOR], azar)])
+
+    filas_aei = []
+    for n in range(num_aei):
+        fila = aei.iloc[n % len(aei)]
+        codigo = f"AEI.{n // 9 + 1:02d}.{n % 9 + 1:02d}"
+        filas_aei.append([codigo, _alterar(fila[COL_TEXTO], azar), _alterar(fila[COL_INDICADOR], azar)])
+
+    vocabulario = " ".join(pd.concat([oei[COL_TEXTO], aei[COL_TEXTO]]).astype(str)).split()
+    relleno = [
+        " ".join(azar.choice(vocabulario) for _ in range(azar.randint(60, 110))).capitalize() + "."
+        for _ in range(max(0, paginas) * PARRAFOS_POR_PAGINA)
+    ]
+
+    ruido = []
+    for _ in range(tablas_ruido):
+        filas = azar.randint(3, 8)
+        ruido.append([["Año", "Meta", "Presupuesto (S/)", "Responsable"]] + [
+            [str(2024 + i), str(azar.randint(1, 100)), f"{azar.uniform(1e3, 1e6):,.2f}",
+             " ".join(azar.choice(vocabulario) for _ in range(3))]
+            for i in range(filas)
+        ])
+
+    return {"oei": filas_oei, "aei": filas_aei, "relleno": relleno, "ruido": ruido}
+
+
+def _secuencia(contenido):
+    """
+    Orden de los bloques del documento: relleno repartido, tablas de ruido
+    intercaladas y las matrices OEI/AEI hacia la mitad del documento.
+    """
+    paginas = [
+        contenido["relleno"][i:i + PARRAFOS_POR_PAGINA]
+        for i in range(0, len(contenido["relleno"]), PARRAFOS_POR_PAGINA)
+    ]
+    mitad = len(paginas) // 2
+    bloques = []
+    ruido = list(contenido["ruido"])
+    for n, parrafos in enumerate(paginas):
+        if n == mitad:
+            bloques.append(("titulo", "Objetivos Estratégicos Institucionales"))
+            bloques.append(("tabla", [ENCABEZADO_OEI] + contenido["oei"]))
+            bloques.append(("titulo", "Acciones Estratégicas Institucionales"))
+            bloques.append(("tabla", [ENCABEZADO_AEI] + contenido["aei"]))
+        bloques.extend(("parrafo", p) for p in parrafos)
+        if ruido and n % 2 == 1:
+            bloques.append(("tabla", ruido.pop()))
+        bloques.append(("salto", None))
+    if not paginas:
+        bloques = [("tabla", [ENCABEZADO_OEI] + contenido["oei"]), ("tabla", [ENCABEZADO_AEI] + contenido["aei"])]
+    bloques.extend(("tabla", t) for t in ruido)
+    return bloques
+
+
+# === ESCRITURA ===
+def escribir_docx(ruta, contenido):
+    if Document is None:
+        raise ImportError("Falta instalar python-docx: pip install python-docx")
+    documento = Document()
+    for tipo, valor in _secuencia(contenido):
+        if tipo == "titulo":
+            documento.add_heading(valor, level=2)
+        elif tipo == "parrafo":
+            documento.add_paragraph(valor)
+        elif tipo == "salto":
+            documento.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+        else:
+            tabla = documento.add_table(rows=len(valor), cols=len(valor[0]))
+            tabla.style = "Table Grid"
+            for i, fila in enumerate(valor):
+                celdas = tabla.rows[i].cells
+                for j, texto in enumerate(fila):
+                    celdas[j].text = texto
+    documento.save(ruta)
+
+
+def escribir_pdf(ruta, contenido):
+    if SimpleDocTemplate is None:
+        raise ImportError("Falta instalar reportlab: pip install reportlab")
+    estilos = getSampleStyleSheet()
+    celda = estilos["BodyText"]
+    elementos = []
+    for tipo, valor in _secuencia(contenido):
+        if tipo == "titulo":
+            elementos.append(Paragraph(escape(valor), estilos["Heading2"]))
+        elif tipo == "parrafo":
+            elementos.append(Paragraph(escape(valor), estilos["BodyText"]))
+        elif tipo == "salto":
+            elementos.append(PageBreak())
+        else:
+            # Tablas con bordes (Camelot "lattice"); se parten entre páginas repitiendo el encabezado
+            datos = [[Paragraph(escape(texto), celda) for texto in fila] for fila in valor]
+            ancho = (landscape(A4)[0] - 72) / len(valor[0])
+            tabla = Table(datos, colWidths=[ancho] * len(valor[0]), repeatRows=1)
+            tabla.setStyle(TableStyle([("GRID", (0, 0), (-1, -1), 0.5, colors.black)]))
+            elementos.append(tabla)
+    SimpleDocTemplate(ruta, pagesize=landscape(A4)).build(elementos)
+
+
+def generar_pei(ruta, num_oei=12, num_aei=40, paginas=30, tablas_ruido=5,
+                ruta_estandar=RUTA_ESTANDAR, semilla=0):
+    """
+    Genera un PEI sintético en `ruta` (.docx o .pdf) y devuelve el contenido usado.
+    """
+    contenido = generar_contenido(num_oei, num_aei, paginas, tablas_ruido, ruta_estandar, semilla)
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".docx":
+        escribir_docx(ruta, contenido)
+    elif extension == ".pdf":
+        escribir_pdf(ruta, contenido)
+    else:
+        raise ValueError(f"Formato de archivo no soportado: {extension}")
+    return contenido
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.generador",
+                                     description="Genera un PEI sintético (.docx o .pdf)")
+    parser.add_argument("salida", help="Archivo a generar (.docx o .pdf)")
+    parser.add_argument("--oei", type=int, default=12, help="Filas de la tabla OEI")
+    parser.add_argument("--aei", type=int, default=40, help="Filas de la tabla AEI")
+    parser.add_argument("--paginas", type=int, default=30, help="Páginas de texto de relleno")
+    parser.add_argument("--ruido", type=int, default=5, help="Tablas ajenas a OEI/AEI")
+    parser.add_argument("--estandar", default=RUTA_ESTANDAR, help="Libro Excel de la matriz estándar")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+    generar_pei(args.salida, args.oei, args.aei, args.paginas, args.ruido, args.estandar, args.semilla)
+    print(f"✅ PEI sintético generado: {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Mediciones de rendimiento por etapa sobre PEI sintéticos.
+
+Genera un PEI (Word y/o PDF) con benchmarks.generador y mide por separado:
+extracción de tablas, carga del estándar, codificación, emparejamiento,
+diferencias, estilos y exportación a Excel (además del recorrido completo).
+Los tiempos se guardan en JSON para comparar entre commits.
+
+Uso:
+    python -m benchmarks.medir [--formatos docx pdf] [--oei 12] [--aei 40] [--paginas 30]
+                               [--ruido 5] [--repeticiones 3] [--salida resultado.json]
+                               [--comparar resultado_anterior.json]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.generador import generar_pei, RUTA_ESTANDAR
+from modules import indice_estandar
+from modules.modelo import calentar_modelo, codificar, backend_actual, NOMBRE_MODELO
+from modules.extract_tables import extraer_tablas
+from modules.comparador import COMPARACIONES, comparar_tablas, precargar_estandar
+from modules.motor import emparejar, estilizar_resultado
+from modules.diferencias import completar_diferencias
+from modules.reporte import exportar_excel, resumen_resultados
+
+ETAPAS = [
+    "extraccion", "carga_estandar", "codificacion", "emparejamiento",
+    "diferencias", "estilos", "exportacion_excel", "total_comparacion",
+]
+
+
+# === UTILIDADES ===
+def medir(funcion, repeticiones):
+    """
+    Ejecuta `funcion` `repeticiones` veces; devuelve (último resultado, tiempos en s).
+    """
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, tiempos
+
+
+def resumir(tiempos):
+    return {
+        "mediana": round(statistics.median(tiempos), 6),
+        "minimo": round(min(tiempos), 6),
+        "repeticiones": [round(t, 6) for t in tiempos],
+    }
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _limpiar_cache_estandar():
+    # Fuerza a releer el libro y los índices .npy (como en un proceso nuevo)
+    indice_estandar._hashes.clear()
+    indice_estandar._hojas.clear()
+    indice_estandar._embeddings.clear()
+    indice_estandar._filas_padre.clear()
+
+
+# === ETAPAS ===
+def _preparar(ruta_estandar, tablas):
+    """
+    Reproduce la preparación del motor: columnas detectadas, textos normalizados
+    e índices del estándar de cada comparación con tabla disponible.
+    """
+    preparados = {}
+    for nombre, (tabla, espec) in COMPARACIONES.items():
+        if tablas.get(tabla) is None:
+            continue
+        prep = espec["preparar"](tablas[tabla], espec)
+        indice = indice_estandar.obtener_embeddings_estandar(
+            ruta_estandar, espec["hoja"], espec["col_estandar_texto"],
+            espec["normalizador"], espec["version_normalizacion"]
+        )
+        preparados[nombre] = (espec, prep, indice)
+    return preparados
+
+
+def medir_documento(ruta, ruta_estandar=RUTA_ESTANDAR, repeticiones=3):
+    """
+    Mide cada etapa sobre un documento. Devuelve {"etapas": {...}, "filas": {...}}.
+    """
+    etapas = {}
+
+    def extraer():
+        with open(ruta, "rb") as archivo:
+            return extraer_tablas(archivo)
+    tablas, etapas["extraccion"] = medir(extraer, repeticiones)
+
+    def cargar():
+        _limpiar_cache_estandar()
+        precargar_estandar(ruta_estandar)
+    _, etapas["carga_estandar"] = medir(cargar, repeticiones)
+
+    preparados = _preparar(ruta_estandar, tablas)
+
+    # Codificación: solo los textos que el motor envía al modelo (sin coincidencia exacta)
+    textos = list(dict.fromkeys(
+        t for _, prep, (_, _, exactos) in preparados.values()
+        for t in prep["textos_norm"] if t not in exactos
+    ))
+    emb, etapas["codificacion"] = medir(lambda: codificar(textos) if textos else None, repeticiones)
+    posicion = {t: i for i, t in enumerate(textos)}
+
+    def emparejar_todo():
+        resultados = {}
+        for nombre, (espec, prep, (textos_est, emb_est, exactos)) in preparados.items():
+            emb_comparar = np.stack([
+                emb_est[exactos[t]] if t in exactos else emb[posicion[t]] for t in prep["textos_norm"]
+            ]) if prep["textos_norm"] else np.zeros((0, 0), dtype=np.float32)
+            puntajes, indices = emparejar(emb_comparar, emb_est)
+            df_estandar = indice_estandar.cargar_hoja_estandar(ruta_estandar, espec["hoja"])
+            resultados[nombre] = espec["construir"](
+                prep, espec, df_estandar, textos_est, puntajes, indices, 0.75, diferencias_diferidas=True
+            )
+        return resultados
+    diferidos, etapas["emparejamiento"] = medir(emparejar_todo, repeticiones)
+
+    resultados, etapas["diferencias"] = medir(
+        lambda: {n: completar_diferencias(df) for n, df in diferidos.items()}, repeticiones
+    )
+    _, etapas["estilos"] = medir(
+        lambda: [estilizar_resultado(df).to_html() for df in resultados.values()], repeticiones
+    )
+    _, etapas["exportacion_excel"] = medir(
+        lambda: exportar_excel(resumen_resultados(resultados), resultados), repeticiones
+    )
+    _, etapas["total_comparacion"] = medir(lambda: comparar_tablas(ruta_estandar, tablas), repeticiones)
+
+    return {
+        "etapas": {etapa: resumir(etapas[etapa]) for etapa in ETAPAS},
+        "filas": {nombre: len(df) for nombre, df in resultados.items()},
+        "textos_codificados": len(textos),
+    }
+
+
+# === COMPARACIÓN ENTRE EJECUCIONES ===
+def comparar_con(anterior, actual):
+    """
+    Imprime, por formato y etapa, la mediana anterior, la actual y el cociente.
+    """
+    print(f"\nComparación con {anterior.get('commit')} ({anterior.get('fecha')}):")
+    for formato, datos in actual["resultados"].items():
+        previos = anterior.get("resultados", {}).get(formato)
+        if not previos:
+            continue
+        for etapa, valores in datos["etapas"].items():
+            if etapa not in previos["etapas"]:
+                continue
+            antes, ahora = previos["etapas"][etapa]["mediana"], valores["mediana"]
+            cociente = ahora / antes if antes else float("inf")
+            marca = "⚠️" if cociente > 1.2 else ""
+            print(f"  {formato:5} {etapa:18} {antes:9.4f} s → {ahora:9.4f} s  x{cociente:5.2f} {marca}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.medir",
+                                     description="Tiempos por etapa del comparador PEI-GL")
+    parser.add_argument("--formatos", nargs="+", default=["docx", "pdf"], choices=["docx", "pdf"])
+    parser.add_argument("--oei", type=int, default=12, help="Filas de la tabla OEI")
+    parser.add_argument("--aei", type=int, default=40, help="Filas de la tabla AEI")
+    parser.add_argument("--paginas", type=int, default=30, help="Páginas de texto de relleno")
+    parser.add_argument("--ruido", type=int, default=5, help="Tablas ajenas a OEI/AEI")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--estandar", default=RUTA_ESTANDAR, help="Libro Excel de la matriz estándar")
+    parser.add_argument("--salida", help="Archivo JSON de resultados "
+                                         "(por defecto benchmarks/resultados/<fecha>_<commit>.json)")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para comparar")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    calentar_modelo()
+    carga_modelo = time.perf_counter() - inicio
+
+    reporte = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "modelo": NOMBRE_MODELO,
+            "backend": backend_actual(),
+        },
+        "parametros": {
+            "oei": args.oei, "aei": args.aei, "paginas": args.paginas, "ruido": args.ruido,
+            "repeticiones": args.repeticiones, "semilla": args.semilla,
+        },
+        "carga_modelo": round(carga_modelo, 6),
+        "resultados": {},
+    }
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        for formato in args.formatos:
+            ruta = os.path.join(carpeta, f"pei_sintetico.{formato}")
+            try:
+                generar_pei(ruta, args.oei, args.aei, args.paginas, args.ruido, args.estandar, args.semilla)
+            except ImportError as e:
+                print(f"⚠️ Se omite {formato}: {e}")
+                continue
+            print(f"⏱️ Midiendo {formato}...")
+            reporte["resultados"][formato] = medir_documento(ruta, args.estandar, max(1, args.repeticiones))
+            for etapa, valores in reporte["resultados"][formato]["etapas"].items():
+                print(f"  {etapa:18} {valores['mediana']:9.4f} s")
+
+    salida = args.salida or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "resultados",
+        f"{datetime.now():%Y%m%d_%H%M%S}_{reporte['commit'] or 'sin_commit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar_con(json.load(f), reporte)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
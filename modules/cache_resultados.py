@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+import pandas as pd
+
+from modules.modelo import identificador_modelo
+from modules.indice_estandar import hash_estandar
+from modules import reordenamiento
+from modules.trazas import trazar, anotar
+
+try:
+    import pyarrow  # Formato columnar (Parquet) para guardar las tablas
+except ImportError:
+    pyarrow = None
+
+# Caché en disco de extracción + comparación, direccionada por contenido
+CARPETA_CACHE = os.environ.get("PEI_CARPETA_CACHE", ".cache_resultados")
+TAMANO_MAXIMO_CACHE = int(os.environ.get("PEI_CACHE_MB", "512")) * 1024 * 1024
+
+# Cambiar esta versión cuando cambie la lógica de emparejamiento (invalida la caché)
+VERSION_RESULTADOS = "4"
+
+
+def clave_resultados(contenido, ruta_estandar, umbral, num_candidatos=1, diferencias_diferidas=False):
+    """
+    Clave de la caché: hash de los bytes subidos, del libro estándar, modelo
+    (nombre y backend), versión de la lógica, parámetros de la comparación y
+    configuración del reordenamiento (si está activo).
+    `contenido` puede ser bytes o un archivo binario abierto; en ese caso se
+    lee por bloques desde el inicio (sin copiarlo entero en memoria).
+    """
+    if hasattr(contenido, "read"):
+        h = hashlib.sha256()
+        contenido.seek(0)
+        for bloque in iter(lambda: contenido.read(1 << 20), b""):
+            h.update(bloque)
+        contenido.seek(0)
+    else:
+        h = hashlib.sha256(contenido)
+    partes = [
+        VERSION_RESULTADOS, hash_estandar(ruta_estandar), identificador_modelo(),
+        repr(float(umbral)), str(num_candidatos),
+    ]
+    if diferencias_diferidas:
+        partes.append("diferidas")
+    if reordenamiento.ACTIVO:
+        partes.append(reordenamiento.identificador())
+    h.update("|".join(partes).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _tamano_carpeta(ruta):
+    return sum(
+        os.path.getsize(os.path.join(raiz, f))
+        for raiz, _, archivos in os.walk(ruta) for f in archivos
+    )
+
+
+def _desalojar(carpeta=CARPETA_CACHE, limite=TAMANO_MAXIMO_CACHE):
+    """
+    Elimina las entradas usadas hace más tiempo (LRU por fecha de modificación)
+    hasta que la caché quede por debajo del límite de tamaño.
+    """
+    entradas = []
+    for nombre in os.listdir(carpeta):
+        ruta = os.path.join(carpeta, nombre)
+        if os.path.isdir(ruta) and not nombre.startswith("."):
+            entradas.append((os.path.getmtime(ruta), _tamano_carpeta(ruta), ruta))
+
+    total = sum(tamano for _, tamano, _ in entradas)
+    for _, tamano, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        shutil.rmtree(ruta, ignore_errors=True)
+        total -= tamano
+
+
+# === CARPETAS DE TABLAS (Parquet + indice.json) ===
+def escribir_tablas(ruta, grupos, **metadatos):
+    """
+    Escribe los DataFrames de `grupos` ({grupo: {nombre: DataFrame}}) en
+    Parquet dentro de la carpeta `ruta`, con un indice.json de sus archivos y
+    los `metadatos`. La carpeta se arma aparte y reemplaza a la anterior de una
+    vez (quien lea nunca ve una carpeta a medio escribir).
+    """
+    carpeta, nombre_carpeta = os.path.split(ruta)
+    ruta_tmp = os.path.join(carpeta, f".{nombre_carpeta}.{os.getpid()}.{time.monotonic_ns()}")
+    try:
+        os.makedirs(ruta_tmp)
+        indice = {**metadatos}
+        for grupo, frames in grupos.items():
+            indice[grupo] = {}
+            for n, (nombre, df) in enumerate(frames.items()):
+                if df is None:
+                    continue
+                archivo = f"{grupo}_{n}.parquet"
+                df = df.copy()
+                df.columns = [str(c) for c in df.columns]
+                df.to_parquet(os.path.join(ruta_tmp, archivo), index=False)
+                indice[grupo][nombre] = archivo
+        with open(os.path.join(ruta_tmp, "indice.json"), "w", encoding="utf-8") as f:
+            json.dump(indice, f, ensure_ascii=False)
+
+        if os.path.isdir(ruta):
+            shutil.rmtree(ruta, ignore_errors=True)
+        os.replace(ruta_tmp, ruta)
+    finally:
+        shutil.rmtree(ruta_tmp, ignore_errors=True)
+
+
+def leer_tablas(ruta, grupos):
+    """
+    Lee una carpeta escrita con escribir_tablas: devuelve (índice, {grupo:
+    {nombre: DataFrame}}) con los grupos pedidos.
+    """
+    with open(os.path.join(ruta, "indice.json"), encoding="utf-8") as f:
+        indice = json.load(f)
+    return indice, {
+        grupo: {
+            nombre: pd.read_parquet(os.path.join(ruta, archivo))
+            for nombre, archivo in indice[grupo].items()
+        }
+        for grupo in grupos
+    }
+
+
+# === CACHÉ ===
+@trazar("cache_resultados.leer")
+def leer_cache(clave, carpeta=CARPETA_CACHE):
+    """
+    Devuelve (tablas, resultados) guardados para la clave, o None si no existen.
+    """
+    ruta = os.path.join(carpeta, clave)
+    if pyarrow is None or not os.path.isfile(os.path.join(ruta, "indice.json")):
+        anotar(cache="fallo")
+        return None
+    try:
+        _, grupos = leer_tablas(ruta, ("tablas", "resultados"))
+    except Exception as e:
+        print(f"⚠️ Entrada de caché ilegible, se ignora: {e}")
+        anotar(cache="fallo")
+        return None
+
+    os.utime(ruta)  # marca de uso reciente para el desalojo LRU
+    anotar(cache="acierto", filas=sum(len(df) for df in grupos["resultados"].values()))
+    return grupos["tablas"], grupos["resultados"]
+
+
+@trazar("cache_resultados.guardar")
+def guardar_cache(clave, tablas, resultados, carpeta=CARPETA_CACHE):
+    """
+    Guarda las tablas extraídas y los DataFrames de resultados (Parquet) y
+    aplica el límite de tamaño de la caché.
+    """
+    if pyarrow is None:
+        return
+    try:
+        escribir_tablas(os.path.join(carpeta, clave), {"tablas": tablas, "resultados": resultados})
+        _desalojar(carpeta)
+    except Exception as e:
+        print(f"⚠️ No se pudo guardar en caché: {e}")
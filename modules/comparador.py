@@ -0,0 +1,96 @@
+from modules.motor import ejecutar_comparaciones, iterar_comparaciones, HILOS_COMPARACION
+from modules.indice_estandar import obtener_embeddings_estandar_lote
+from modules.compare_oei import ESPEC_OEI_DEN, ESPEC_OEI_IND
+from modules.compare_aei import ESPEC_AEI_DEN, ESPEC_AEI_IND
+
+# Comparaciones que se ejecutan sobre cada documento: nombre -> (tabla extraída, especificación)
+COMPARACIONES = {
+    "OEI (Denominación)": ("OEI", ESPEC_OEI_DEN),
+    "OEI (Indicador)": ("OEI", ESPEC_OEI_IND),
+    "AEI (Denominación)": ("AEI", ESPEC_AEI_DEN),
+    "AEI (Indicador)": ("AEI", ESPEC_AEI_IND),
+}
+
+# Comparaciones que se resuelven con el resultado de otra: cada AEI del GL se
+# busca solo entre los AEI del estándar del OEI con que se emparejó su OEI
+PADRES = {
+    "AEI (Denominación)": "OEI (Denominación)",
+    "AEI (Indicador)": "OEI (Denominación)",
+}
+
+
+def comparar_tablas(ruta_estandar, tablas, umbral=0.75, num_candidatos=1, diferencias_diferidas=False):
+    """
+    Ejecuta las cuatro comparaciones (OEI/AEI x denominación/indicador) sobre el
+    diccionario `tablas` devuelto por extraer_tablas, codificando cada texto del
+    documento una sola vez. Con num_candidatos > 1 cada resultado incluye
+    también los candidatos alternativos del estándar. Con diferencias_diferidas=True
+    la columna de diferencias se deja vacía (ver modules.diferencias).
+    Devuelve {nombre de la comparación: DataFrame de resultados} (sin estilos).
+    """
+    trabajos = {
+        nombre: (espec, tablas.get(tabla), PADRES.get(nombre))
+        for nombre, (tabla, espec) in COMPARACIONES.items()
+    }
+    return ejecutar_comparaciones(
+        ruta_estandar, trabajos, umbral, num_candidatos, diferencias_diferidas=diferencias_diferidas
+    )
+
+
+def iterar_tablas(ruta_estandar, tablas, umbral=0.75, num_candidatos=1, diferencias_diferidas=False,
+                  hilos=HILOS_COMPARACION):
+    """
+    Como comparar_tablas, pero las comparaciones se ejecutan en paralelo
+    (pool de hilos) y se entregan a medida que terminan: generador de
+    (nombre de la comparación, DataFrame de resultados).
+    """
+    trabajos = {
+        nombre: (espec, tablas.get(tabla), PADRES.get(nombre))
+        for nombre, (tabla, espec) in COMPARACIONES.items()
+    }
+    return iterar_comparaciones(
+        ruta_estandar, trabajos, umbral, num_candidatos,
+        diferencias_diferidas=diferencias_diferidas, hilos=hilos,
+    )
+
+
+def precargar_estandar(ruta_estandar):
+    """
+    Lee las hojas del estándar y carga (o construye) sus embeddings para todas
+    las comparaciones, de modo que la primera comparación no pague ese costo.
+    """
+    obtener_embeddings_estandar_lote(ruta_estandar, [
+        (espec["hoja"], espec["col_estandar_texto"], espec["normalizador"], espec["version_normalizacion"])
+        for _, espec in COMPARACIONES.values()
+    ])
+
+
+def comparar_documentos(ruta_estandar, documentos, umbral=0.75, num_candidatos=1, errores=None,
+                        diferencias_diferidas=False):
+    """
+    Ejecuta las comparaciones de varios documentos a la vez: `documentos` es
+    {documento: tablas devueltas por extraer_tablas}. Los textos de todos los
+    documentos se codifican juntos, en lotes, con el mismo modelo en memoria.
+    Si se pasa un diccionario `errores`, los documentos cuyas tablas no se
+    pueden comparar se registran en él ({documento: mensaje}) y se omiten.
+    Devuelve {documento: {nombre de la comparación: DataFrame de resultados}}.
+    """
+    trabajos = {
+        (documento, nombre): (espec, tablas.get(tabla), (documento, PADRES[nombre]) if nombre in PADRES else None)
+        for documento, tablas in documentos.items()
+        for nombre, (tabla, espec) in COMPARACIONES.items()
+    }
+    fallidos = {} if errores is not None else None
+    resultados = ejecutar_comparaciones(
+        ruta_estandar, trabajos, umbral, num_candidatos, errores=fallidos,
+        diferencias_diferidas=diferencias_diferidas,
+    )
+
+    for (documento, nombre), e in (fallidos or {}).items():
+        errores.setdefault(documento, f"{nombre}: {e}")
+
+    por_documento = {}
+    for (documento, nombre), df in resultados.items():
+        if errores is None or documento not in errores:
+            por_documento.setdefault(documento, {})[nombre] = df
+    return por_documento
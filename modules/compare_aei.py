@@ -1,315 +1,213 @@
+import re
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
 from difflib import get_close_matches
-import re
+import numpy as np
+from modules.motor import ejecutar_comparaciones, estilizar_resultado, formatear_candidatos
+from modules.normalizacion import VERSION, normalizar_serie
+from modules.diferencias import calcular_diferencias
+
+# Cambiar esta versión invalida las embeddings del estándar guardadas en disco
+VERSION_NORMALIZACION = f"aei-n{VERSION}"
+
+# Códigos de filas de OEI ("OEI", "OIE" o similares) que aparecen dentro de la tabla AEI
+PATRON_CODIGO_OEI = r"O.?E.?I|O.?I.?E"
+
+# Formas de código de las que se puede deducir el OEI padre: "AEI.01.02" (OEI
+# 01, acción 02) y "OEI.01"; admite otros separadores ("AEI 1-2", "OEI 1")
+PATRON_AEI_CON_PADRE = re.compile(r"\s*A\W?E\W?I\W*(\d+)\W+\d+\s*", re.IGNORECASE)
+PATRON_OEI_NUMERO = re.compile(r"\s*(?:O\W?E\W?I|O\W?I\W?E)\W*(\d+)\s*", re.IGNORECASE)
+
+COLUMNAS_RESULTADO = [
+    "Código del GL",
+    "Elemento del GL",
+    "Código estándar más similar",
+    "Elemento estándar más similar",
+    #"Similitud",
+    "Resultado",
+    "Diferencias detectadas"
+]
+
+
+# === DETECCIÓN DE COLUMNAS ===
+def detectar_columna(df, opciones, tipo):
+    cols_norm = {col: col.strip().lower()
+                 .replace("ó", "o").replace("í", "i")
+                 .replace("á", "a").replace("é", "e")
+                 .replace("ú", "u") for col in df.columns}
+
+    for col_real, col_norm in cols_norm.items():
+        for opt in opciones:
+            opt_norm = opt.strip().lower().replace("ó", "o").replace("í", "i")\
+                .replace("á", "a").replace("é", "e").replace("ú", "u")
+            if opt_norm in col_norm or col_norm in opt_norm:
+                return col_real
+
+        coincidencia = get_close_matches(col_norm, [o.lower() for o in opciones], n=1, cutoff=0.6)
+        if coincidencia:
+            return col_real
 
-def comparar_aei(ruta_estandar, df_aei, umbral=0.75):
+    raise KeyError(
+        f"❌ No se encontró la columna de {tipo}.\n"
+        f"🧠 Columnas del archivo: {list(df.columns)}\n"
+        f"🧩 Opciones buscadas: {opciones}"
+    )
+
+
+def codigo_oei_padre(codigo):
     """
-    Compara la tabla AEI extraída del PEI con la tabla estándar.
-    Devuelve un DataFrame estilizado con:
-      - Similitud semántica
-      - Clasificación (exacta / parcial / no coincide)
-      - Diferencias visuales (+ añadidas / – eliminadas)
+    Código del OEI al que pertenece un AEI ("AEI.01.02" -> "OEI.01"). También
+    uniformiza códigos de OEI ("OEI 1" -> "OEI.01"). None si el código no tiene
+    una de esas formas (p. ej. numeración correlativa "AEI.05" o "1.2"): esas
+    filas se buscan en todo el estándar.
+    """
+    texto = str(codigo)
+    coincidencia = PATRON_AEI_CON_PADRE.fullmatch(texto) or PATRON_OEI_NUMERO.fullmatch(texto)
+    return f"OEI.{int(coincidencia.group(1)):02d}" if coincidencia else None
+
+
+# === ETAPAS DEL MOTOR DE COMPARACIÓN ===
+def preparar_aei(df_aei, espec):
+    """
+    Detecta las columnas de texto y código de la tabla AEI del PEI, limpia sus
+    textos y descarta las filas sin código o sin texto y las filas de OEI
+    (antes de codificar, para no gastar trabajo del modelo en ellas).
     """
-    modelo = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-       
-    HOJA_ESTANDAR = "AEI"
-    COLUMNA_ESTANDAR_TEXTO = "Denominación de OEI / AEI / AO"
-    COLUMNA_ESTANDAR_CODIGO = "Código"
-    COLUMNA_COMPARAR_TEXTO = [
-        "Enunciado",
-        "AEI",
-        "ACCIONES ESTRATÉGICAS INSTITUCIONALES",
-        "Denominación de OEI / AEI / AO",
-        "Denominación del OEI/AEI",
-        "Denominación de OEI / AEI",
-        "Denominación de OEI/AEI",
-        "Descripción"        
-    ]    
-    COLUMNA_COMPARAR_CODIGO = [
-        "Código",
-        "CODIGO",
-        "CÓDIGO",        
-        "Código AEI",
-        "Cod AEI"
-    ]
-
-    # === CARGA DE ARCHIVOS ===
-    df_estandar = pd.read_excel(ruta_estandar, sheet_name=HOJA_ESTANDAR)
     df_comparar = df_aei.copy()
 
-    # === DETECCIÓN DE COLUMNAS ===
-    def detectar_columna(df, opciones, tipo):
-        cols_norm = {col: col.strip().lower()
-                     .replace("ó", "o").replace("í", "i")
-                     .replace("á", "a").replace("é", "e")
-                     .replace("ú", "u") for col in df.columns}
-
-        for col_real, col_norm in cols_norm.items():
-            for opt in opciones:
-                opt_norm = opt.strip().lower().replace("ó", "o").replace("í", "i")\
-                    .replace("á", "a").replace("é", "e").replace("ú", "u")
-                if opt_norm in col_norm or col_norm in opt_norm:
-                    return col_real
-
-            coincidencia = get_close_matches(col_norm, [o.lower() for o in opciones], n=1, cutoff=0.6)
-            if coincidencia:
-                return col_real
+    col_texto_comparar = detectar_columna(df_comparar, espec["opciones_texto"], "texto a comparar")
+    col_codigo_comparar = detectar_columna(df_comparar, espec["opciones_codigo"], "código a comparar")
 
-        raise KeyError(
-            f"❌ No se encontró la columna de {tipo}.\n"
-            f"🧠 Columnas del archivo: {list(df.columns)}\n"
-            f"🧩 Opciones buscadas: {opciones}"
-        )
+    df_comparar[col_texto_comparar] = normalizar_serie(df_comparar[col_texto_comparar])
 
-    col_texto_comparar = detectar_columna(df_comparar, COLUMNA_COMPARAR_TEXTO, "texto a comparar")
-    col_codigo_comparar = detectar_columna(df_comparar, COLUMNA_COMPARAR_CODIGO, "código a comparar")
-
-    # === LIMPIEZA Y NORMALIZACIÓN ===
-    def limpiar_texto(t):
-        if not isinstance(t, str):
-            return ""
-        t = t.lower().strip()
-        t = re.sub(r"\s+", " ", t)  # quita dobles espacios
-        t = re.sub(r"[.,;:¡!¿?\-\–]", "", t)  # quita puntuación
-        t = re.sub(r"[áà]", "a", t)
-        t = re.sub(r"[éè]", "e", t)
-        t = re.sub(r"[íì]", "i", t)
-        t = re.sub(r"[óò]", "o", t)
-        t = re.sub(r"[úù]", "u", t)
-        return t
-
-    df_estandar[COLUMNA_ESTANDAR_TEXTO] = df_estandar[COLUMNA_ESTANDAR_TEXTO].astype(str).apply(limpiar_texto)
-    df_comparar[col_texto_comparar] = df_comparar[col_texto_comparar].astype(str).apply(limpiar_texto)
-
-    # 🧹 Eliminar filas sin código o sin texto (vacías o nulas)
+    # 🧹 Eliminar filas sin código o sin texto (vacías o nulas) y filas de OEI
+    codigos = df_comparar[col_codigo_comparar].astype(str)
     df_comparar = df_comparar[
         df_comparar[col_texto_comparar].str.strip().ne("") &
-        df_comparar[col_codigo_comparar].astype(str).str.strip().ne("")
-    ].reset_index(drop=True)
-       
-    # === EMBEDDINGS ===
-    embeddings_estandar = modelo.encode(df_estandar[COLUMNA_ESTANDAR_TEXTO].tolist(), convert_to_tensor=True)
-    embeddings_comparar = modelo.encode(df_comparar[col_texto_comparar].tolist(), convert_to_tensor=True)
-
-    # === FUNCIÓN PARA DETECTAR DIFERENCIAS VISUALES ===
-    def detectar_diferencias(texto_estandar, texto):
-        palabras_estandar = texto_estandar.split()
-        palabras_texto = texto.split()
-
-        eliminadas = set(palabras_estandar) - set(palabras_texto)
-        añadidas = set(palabras_texto) - set(palabras_estandar)
-
-        diferencias = []
-        if eliminadas:
-            diferencias.append("– " + ", ".join(sorted(eliminadas)))
-        if añadidas:
-            diferencias.append("+ " + ", ".join(sorted(añadidas)))
-
-        return "; ".join(diferencias) if diferencias else "(sin diferencias)"
-
-    # === CÁLCULO DE SIMILITUD ===
-    resultados = []
-    for i, texto in enumerate(df_comparar[col_texto_comparar]):
-        emb_texto = embeddings_comparar[i]
-        similitudes = util.cos_sim(emb_texto, embeddings_estandar)[0]
-        indice_max = similitudes.argmax().item()
-        valor_max = similitudes[indice_max].item()
-
-        texto_estandar = df_estandar.loc[indice_max, COLUMNA_ESTANDAR_TEXTO]
-        codigo_estandar = df_estandar.loc[indice_max, COLUMNA_ESTANDAR_CODIGO]
-        codigo_comparar = df_comparar.loc[i, col_codigo_comparar]
-
-        # Clasificación
-        if texto.lower() == texto_estandar.lower():
-            categoria = "Coincidencia exacta"
-        elif valor_max >= umbral:
-            categoria = "Coincidencia parcial"
-        else:
-            categoria = "No coincide"
-
-        diferencias = detectar_diferencias(texto_estandar, texto)
-
-        resultados.append({
-            "Código del GL": codigo_comparar,
-            "Elemento del GL": texto,
-            "Código estándar más similar": codigo_estandar,
-            "Elemento estándar más similar": texto_estandar,
-            #"Similitud": round(valor_max, 3),
-            "Resultado": categoria,
-            "Diferencias detectadas": diferencias
-        })
-
-    df_resultado = pd.DataFrame(resultados)
-
-    # === 🔍 FILTRO PARA EXCLUIR FILAS CON "OEI", "OIE" O SIMILARES ===
-    df_resultado = df_resultado[
-        ~df_resultado["Código del GL"]
-        .astype(str)
-        .str.contains(r"O.?E.?I|O.?I.?E", case=False, na=False)
+        codigos.str.strip().ne("") &
+        ~codigos.str.contains(PATRON_CODIGO_OEI, case=False, na=False)
     ].reset_index(drop=True)
 
-    # === 🎨 COLORES DE RESULTADO ===
-    def color_fila(row):
-        if row["Resultado"] == "Coincidencia exacta":
-            color = "background-color: lightgreen"
-        elif row["Resultado"] == "Coincidencia parcial":
-            color = "background-color: khaki"
-        else:
-            color = "background-color: lightcoral"
-        return [color] * len(row)
+    return {
+        "df": df_comparar,
+        "col_texto": col_texto_comparar,
+        "col_codigo": col_codigo_comparar,
+        "textos_norm": df_comparar[col_texto_comparar].tolist(),
+    }
+
 
-    return df_resultado.style.apply(color_fila, axis=1)
+def construir_resultado_aei(prep, espec, df_estandar, textos_estandar_norm, puntajes, indices, umbral,
+                            diferencias_diferidas=False):
+    """
+    Arma la tabla de resultados a partir de los mejores candidatos del estándar
+    para cada fila del GL (puntajes e índices de forma filas x candidatos).
+    Con diferencias_diferidas=True la columna "Diferencias detectadas" queda vacía.
+    """
+    df_comparar = prep["df"]
+    col_estandar_codigo = espec["col_estandar_codigo"]
+
+    indice_max = indices[:, 0] if indices.size else np.zeros(0, dtype=np.int64)
+    valor_max = puntajes[:, 0] if puntajes.size else np.zeros(0)
+
+    textos = df_comparar[prep["col_texto"]].to_numpy()
+    textos_estandar = np.asarray(textos_estandar_norm, dtype=object)[indice_max]
+
+    # Clasificación
+    exacta = pd.Series(textos, dtype=object).str.lower().to_numpy() == \
+        pd.Series(textos_estandar, dtype=object).str.lower().to_numpy()
+    categoria = np.where(
+        exacta, "Coincidencia exacta",
+        np.where(valor_max >= umbral, "Coincidencia parcial", "No coincide")
+    )
+
+    df_resultado = pd.DataFrame({
+        "Código del GL": df_comparar[prep["col_codigo"]].to_numpy(),
+        "Elemento del GL": textos,
+        "Código estándar más similar": df_estandar[col_estandar_codigo].to_numpy()[indice_max],
+        "Elemento estándar más similar": textos_estandar,
+        #"Similitud": valor_max.round(3),
+        "Resultado": categoria,
+        "Diferencias detectadas": calcular_diferencias(
+            prep["textos_norm"], textos_estandar, exacta, diferencias_diferidas, desde_estandar=True
+        ),
+    }, columns=COLUMNAS_RESULTADO)
+
+    if indices.shape[1] > 1:
+        df_resultado["Otros candidatos (similitud)"] = formatear_candidatos(
+            df_estandar[col_estandar_codigo], puntajes, indices
+        )
 
+    return df_resultado
 
-def comparar_aei_ind(ruta_estandar, df_aei, umbral=0.75):
+
+# === ESPECIFICACIONES DE LAS COMPARACIONES AEI ===
+COLUMNA_COMPARAR_CODIGO = [
+    "Código",
+    "CODIGO",
+    "CÓDIGO",
+    "Código AEI",
+    "Cod AEI"
+]
+
+ESPEC_AEI_DEN = {
+    "hoja": "AEI",
+    "col_estandar_texto": "Denominación de OEI / AEI / AO",
+    "col_estandar_codigo": "Código",
+    "opciones_texto": [
+        "Enunciado",
+        "AEI",
+        "ACCIONES ESTRATÉGICAS INSTITUCIONALES",
+        "Denominación de OEI / AEI / AO",
+        "Denominación del OEI/AEI",
+        "Denominación de OEI / AEI",
+        "Denominación de OEI/AEI",
+        "Descripción"
+    ],
+    "opciones_codigo": COLUMNA_COMPARAR_CODIGO,
+    "normalizador": normalizar_serie,
+    "version_normalizacion": VERSION_NORMALIZACION,
+    "preparar": preparar_aei,
+    # Con el resultado de la comparación de OEI (trabajo "padre" en el motor),
+    # cada AEI se busca solo entre los AEI del estándar de su OEI
+    "codigo_padre": codigo_oei_padre,
+    "columnas_resultado": COLUMNAS_RESULTADO,
+    "construir": construir_resultado_aei,
+}
+
+ESPEC_AEI_IND = {
+    **ESPEC_AEI_DEN,
+    "col_estandar_texto": "Nombre del indicador/ Unidad de medida",
+    "opciones_texto": [
+        "Nombre del Indicador",
+        "Indicador"
+    ],
+}
+
+
+def comparar_aei(ruta_estandar, df_aei, umbral=0.75, num_candidatos=1):
     """
     Compara la tabla AEI extraída del PEI con la tabla estándar.
     Devuelve un DataFrame estilizado con:
       - Similitud semántica
       - Clasificación (exacta / parcial / no coincide)
-      - Diferencias visuales (+ añadidas / – eliminadas)
+      - Diferencias visuales (– falta en el GL / + sobra en el GL / estándar → GL)
+      - Candidatos alternativos con su similitud (si num_candidatos > 1)
     """
-    modelo = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-       
-    HOJA_ESTANDAR = "AEI"
-    COLUMNA_ESTANDAR_TEXTO = "Nombre del indicador/ Unidad de medida"
-    COLUMNA_ESTANDAR_CODIGO = "Código"
-    COLUMNA_COMPARAR_TEXTO = [
-        "Nombre del Indicador",
-        "Indicador"        
-    ]    
-    COLUMNA_COMPARAR_CODIGO = [
-        "Código",
-        "CODIGO",
-        "CÓDIGO",        
-        "Código AEI",
-        "Cod AEI"
-    ]
-
-    # === CARGA DE ARCHIVOS ===
-    df_estandar = pd.read_excel(ruta_estandar, sheet_name=HOJA_ESTANDAR)
-    df_comparar = df_aei.copy()
+    resultados = ejecutar_comparaciones(
+        ruta_estandar, {"aei_den": (ESPEC_AEI_DEN, df_aei)}, umbral, num_candidatos
+    )
+    return estilizar_resultado(resultados["aei_den"])
 
-    # === DETECCIÓN DE COLUMNAS ===
-    def detectar_columna(df, opciones, tipo):
-        cols_norm = {col: col.strip().lower()
-                     .replace("ó", "o").replace("í", "i")
-                     .replace("á", "a").replace("é", "e")
-                     .replace("ú", "u") for col in df.columns}
-
-        for col_real, col_norm in cols_norm.items():
-            for opt in opciones:
-                opt_norm = opt.strip().lower().replace("ó", "o").replace("í", "i")\
-                    .replace("á", "a").replace("é", "e").replace("ú", "u")
-                if opt_norm in col_norm or col_norm in opt_norm:
-                    return col_real
-
-            coincidencia = get_close_matches(col_norm, [o.lower() for o in opciones], n=1, cutoff=0.6)
-            if coincidencia:
-                return col_real
-
-        raise KeyError(
-            f"❌ No se encontró la columna de {tipo}.\n"
-            f"🧠 Columnas del archivo: {list(df.columns)}\n"
-            f"🧩 Opciones buscadas: {opciones}"
-        )
 
-    col_texto_comparar = detectar_columna(df_comparar, COLUMNA_COMPARAR_TEXTO, "texto a comparar")
-    col_codigo_comparar = detectar_columna(df_comparar, COLUMNA_COMPARAR_CODIGO, "código a comparar")
-
-    # === LIMPIEZA Y NORMALIZACIÓN ===
-    def limpiar_texto(t):
-        if not isinstance(t, str):
-            return ""
-        t = t.lower().strip()
-        t = re.sub(r"\s+", " ", t)  # quita dobles espacios
-        t = re.sub(r"[.,;:¡!¿?\-\–]", "", t)  # quita puntuación
-        t = re.sub(r"[áà]", "a", t)
-        t = re.sub(r"[éè]", "e", t)
-        t = re.sub(r"[íì]", "i", t)
-        t = re.sub(r"[óò]", "o", t)
-        t = re.sub(r"[úù]", "u", t)
-        return t
-
-    df_estandar[COLUMNA_ESTANDAR_TEXTO] = df_estandar[COLUMNA_ESTANDAR_TEXTO].astype(str).apply(limpiar_texto)
-    df_comparar[col_texto_comparar] = df_comparar[col_texto_comparar].astype(str).apply(limpiar_texto)
-
-    # 🧹 Eliminar filas sin código o sin texto (vacías o nulas)
-    df_comparar = df_comparar[
-        df_comparar[col_texto_comparar].str.strip().ne("") &
-        df_comparar[col_codigo_comparar].astype(str).str.strip().ne("")
-    ].reset_index(drop=True)
-       
-    # === EMBEDDINGS ===
-    embeddings_estandar = modelo.encode(df_estandar[COLUMNA_ESTANDAR_TEXTO].tolist(), convert_to_tensor=True)
-    embeddings_comparar = modelo.encode(df_comparar[col_texto_comparar].tolist(), convert_to_tensor=True)
-
-    # === FUNCIÓN PARA DETECTAR DIFERENCIAS VISUALES ===
-    def detectar_diferencias(texto_estandar, texto):
-        palabras_estandar = texto_estandar.split()
-        palabras_texto = texto.split()
-
-        eliminadas = set(palabras_estandar) - set(palabras_texto)
-        añadidas = set(palabras_texto) - set(palabras_estandar)
-
-        diferencias = []
-        if eliminadas:
-            diferencias.append("– " + ", ".join(sorted(eliminadas)))
-        if añadidas:
-            diferencias.append("+ " + ", ".join(sorted(añadidas)))
-
-        return "; ".join(diferencias) if diferencias else "(sin diferencias)"
-
-    # === CÁLCULO DE SIMILITUD ===
-    resultados = []
-    for i, texto in enumerate(df_comparar[col_texto_comparar]):
-        emb_texto = embeddings_comparar[i]
-        similitudes = util.cos_sim(emb_texto, embeddings_estandar)[0]
-        indice_max = similitudes.argmax().item()
-        valor_max = similitudes[indice_max].item()
-
-        texto_estandar = df_estandar.loc[indice_max, COLUMNA_ESTANDAR_TEXTO]
-        codigo_estandar = df_estandar.loc[indice_max, COLUMNA_ESTANDAR_CODIGO]
-        codigo_comparar = df_comparar.loc[i, col_codigo_comparar]
-
-        # Clasificación
-        if texto.lower() == texto_estandar.lower():
-            categoria = "Coincidencia exacta"
-        elif valor_max >= umbral:
-            categoria = "Coincidencia parcial"
-        else:
-            categoria = "No coincide"
-
-        diferencias = detectar_diferencias(texto_estandar, texto)
-
-        resultados.append({
-            "Código del GL": codigo_comparar,
-            "Elemento del GL": texto,
-            "Código estándar más similar": codigo_estandar,
-            "Elemento estándar más similar": texto_estandar,
-            #"Similitud": round(valor_max, 3),
-            "Resultado": categoria,
-            "Diferencias detectadas": diferencias
-        })
-
-    df_resultado = pd.DataFrame(resultados)
-
-    # === 🔍 FILTRO PARA EXCLUIR FILAS CON "OEI", "OIE" O SIMILARES ===
-    df_resultado = df_resultado[
-        ~df_resultado["Código del GL"]
-        .astype(str)
-        .str.contains(r"O.?E.?I|O.?I.?E", case=False, na=False)
-    ].reset_index(drop=True)
-
-    # === 🎨 COLORES DE RESULTADO ===
-    def color_fila(row):
-        if row["Resultado"] == "Coincidencia exacta":
-            color = "background-color: lightgreen"
-        elif row["Resultado"] == "Coincidencia parcial":
-            color = "background-color: khaki"
-        else:
-            color = "background-color: lightcoral"
-        return [color] * len(row)
-
-    return df_resultado.style.apply(color_fila, axis=1)
+def comparar_aei_ind(ruta_estandar, df_aei, umbral=0.75, num_candidatos=1):
+    """
+    Compara los indicadores de la tabla AEI extraída del PEI con la tabla estándar.
+    Devuelve un DataFrame estilizado con:
+      - Similitud semántica
+      - Clasificación (exacta / parcial / no coincide)
+      - Diferencias visuales (– falta en el GL / + sobra en el GL / estándar → GL)
+      - Candidatos alternativos con su similitud (si num_candidatos > 1)
+    """
+    resultados = ejecutar_comparaciones(
+        ruta_estandar, {"aei_ind": (ESPEC_AEI_IND, df_aei)}, umbral, num_candidatos
+    )
+    return estilizar_resultado(resultados["aei_ind"])
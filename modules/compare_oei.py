@@ -1,267 +1,165 @@
 import pandas as pd
-import re
-import unicodedata
-import difflib
-from sentence_transformers import SentenceTransformer, util
-import torch
-
-def comparar_oei(ruta_estandar, df_oei, umbral=0.75):
+import numpy as np
+from modules.motor import ejecutar_comparaciones, estilizar_resultado, formatear_candidatos
+from modules.normalizacion import VERSION, normalizar_serie
+from modules.diferencias import calcular_diferencias
+
+# Cambiar esta versión invalida las embeddings del estándar guardadas en disco
+VERSION_NORMALIZACION = f"oei-n{VERSION}"
+
+COLUMNAS_RESULTADO = [
+    "Código del GL",
+    "Elemento del GL",
+    "Código estándar más similar",
+    "Elemento estándar más similar",
+    #"Similitud",
+    "Resultado",
+    "Diferencias"
+]
+
+
+# === FUNCIONES AUXILIARES ===
+def detectar_columna(df, opciones, tipo):
+    for col in df.columns:
+        for opc in opciones:
+            if col.strip().lower() == opc.strip().lower():
+                return col
+    raise ValueError(f"No se encontró columna de {tipo} en las opciones: {opciones}")
+
+
+# === ETAPAS DEL MOTOR DE COMPARACIÓN ===
+def preparar_oei(df_oei, espec):
     """
-    Compara la tabla OEI extraída del PEI con la tabla estándar,
-    ignorando diferencias en tildes, espacios y puntuación.
-    Además, muestra las palabras que difieren entre ambas frases.
-    Devuelve (df_resultado, df_estilizado).
+    Detecta las columnas de texto y código de la tabla OEI del PEI y normaliza sus textos.
     """
-
-    #modelo = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    modelo = SentenceTransformer('paraphrase-MiniLM-L6-v2', device=device)
-    HOJA_ESTANDAR = "OEI"
-    COL_EST_TEXTO = "Denominación de OEI / AEI / AO"
-    COL_EST_CODIGO = "Código"
-
-    COL_OPC_TEXTO = [
-        "Enunciado",
-        "Denominación de OEI",
-        "OBJETIVOS ESTRATÉGICOS INSTITUCIONALES",
-        "OBJETIVOS ESTRATÉGICOS INSTITUCIONAL",
-        "OBJETIVOS ESTRATEGICOS INSTITUCIONAL",
-        "Denominación de OEI / AEI / AO",
-        "Descripción"
-    ]
-    COL_OPC_CODIGO = [
-        "Código", "CODIGO", "CÓDIGO", "Código OEI", "Cod OEI"
-    ]
-
-    # === FUNCIONES AUXILIARES ===
-    def normalizar_texto(texto):
-        if pd.isna(texto):
-            return ""
-        texto = str(texto).lower().strip()
-        texto = unicodedata.normalize("NFD", texto)
-        texto = texto.encode("ascii", "ignore").decode("utf-8")
-        texto = re.sub(r"[.,;:!?¿¡()\"'”“]", "", texto)
-        texto = re.sub(r"\s+", " ", texto).strip()
-        return texto
-
-    def detectar_columna(df, opciones, tipo):
-        for col in df.columns:
-            for opc in opciones:
-                if col.strip().lower() == opc.strip().lower():
-                    return col
-        raise ValueError(f"No se encontró columna de {tipo} en las opciones: {opciones}")
-
-    def obtener_diferencias(texto1, texto2):
-        """
-        Devuelve las palabras que difieren entre texto1 y texto2.
-        """
-        palabras1 = normalizar_texto(texto1).split()
-        palabras2 = normalizar_texto(texto2).split()
-        diffs = []
-        sm = difflib.SequenceMatcher(None, palabras1, palabras2)
-        for tag, i1, i2, j1, j2 in sm.get_opcodes():
-            if tag in ["replace", "delete", "insert"]:
-                parte1 = " ".join(palabras1[i1:i2])
-                parte2 = " ".join(palabras2[j1:j2])
-                if parte1 and parte2:
-                    diffs.append(f"{parte1} → {parte2}")
-                elif parte1:
-                    diffs.append(f"– {parte1}")
-                elif parte2:
-                    diffs.append(f"+ {parte2}")
-        return "; ".join(diffs) if diffs else "—"
-
-    # === CARGA ===
-    df_estandar = pd.read_excel(ruta_estandar, sheet_name=HOJA_ESTANDAR)
     df_comparar = df_oei.copy()
 
-    col_txt_cmp = detectar_columna(df_comparar, COL_OPC_TEXTO, "texto a comparar")
-    col_cod_cmp = detectar_columna(df_comparar, COL_OPC_CODIGO, "código a comparar")
+    col_txt_cmp = detectar_columna(df_comparar, espec["opciones_texto"], "texto a comparar")
+    col_cod_cmp = detectar_columna(df_comparar, espec["opciones_codigo"], "código a comparar")
 
     # === LIMPIEZA ===
-    df_estandar[COL_EST_TEXTO] = df_estandar[COL_EST_TEXTO].astype(str).str.strip()
     df_comparar[col_txt_cmp] = df_comparar[col_txt_cmp].astype(str).str.strip()
 
     # === NORMALIZACIÓN ===
-    textos_estandar_norm = df_estandar[COL_EST_TEXTO].apply(normalizar_texto)
-    textos_comparar_norm = df_comparar[col_txt_cmp].apply(normalizar_texto)
+    textos_comparar_norm = normalizar_serie(df_comparar[col_txt_cmp])
 
-    # === EMBEDDINGS ===
-    emb_estandar = modelo.encode(textos_estandar_norm.tolist(), convert_to_tensor=True)
-    emb_comparar = modelo.encode(textos_comparar_norm.tolist(), convert_to_tensor=True)
+    return {
+        "df": df_comparar,
+        "col_texto": col_txt_cmp,
+        "col_codigo": col_cod_cmp,
+        "textos_norm": textos_comparar_norm.tolist(),
+    }
 
-    # === SIMILITUD ===
-    matriz_sim = util.cos_sim(emb_comparar, emb_estandar)
 
-    resultados = []
-    for i, texto in enumerate(df_comparar[col_txt_cmp]):
-        simil_row = matriz_sim[i]
-        idx_max = simil_row.argmax().item()
-        val_max = simil_row[idx_max].item()
-
-        texto_estandar = df_estandar.loc[idx_max, COL_EST_TEXTO]
-        codigo_estandar = df_estandar.loc[idx_max, COL_EST_CODIGO]
-        codigo_comparar = df_comparar.loc[i, col_cod_cmp]
-
-        # Categoría
-        if normalizar_texto(texto) == normalizar_texto(texto_estandar):
-            categoria = "Coincidencia exacta"
-        elif val_max >= umbral:
-            categoria = "Coincidencia parcial"
-        else:
-            categoria = "No coincide"
-
-        # Diferencias literales
-        diferencias = obtener_diferencias(texto, texto_estandar)
-
-        resultados.append({
-            "Código del GL": codigo_comparar,
-            "Elemento del GL": texto,
-            "Código estándar más similar": codigo_estandar,
-            "Elemento estándar más similar": texto_estandar,
-            #"Similitud": round(val_max, 3),
-            "Resultado": categoria,
-            "Diferencias": diferencias
-        })
-
-    df_result = pd.DataFrame(resultados)
-
-    # === COLOR VISUAL ===
-    def color_fila(row):
-        if row["Resultado"] == "Coincidencia exacta":
-            return ["background-color: lightgreen"] * len(row)
-        elif row["Resultado"] == "Coincidencia parcial":
-            return ["background-color: khaki"] * len(row)
-        else:
-            return ["background-color: lightcoral"] * len(row)
-
-    df_styled = df_result.style.apply(color_fila, axis=1)
-
-    return df_styled
-
-def comparar_oei_ind(ruta_estandar, df_oei, umbral=0.75):
+def construir_resultado_oei(prep, espec, df_estandar, textos_estandar_norm, puntajes, indices, umbral,
+                            diferencias_diferidas=False):
     """
-    Compara la tabla OEI extraída del PEI con la tabla estándar,
-    ignorando diferencias en tildes, espacios y puntuación.
-    Además, muestra las palabras que difieren entre ambas frases.
-    Devuelve (df_resultado, df_estilizado).
+    Arma la tabla de resultados a partir de los mejores candidatos del estándar
+    para cada fila del GL (puntajes e índices de forma filas x candidatos).
+    Con diferencias_diferidas=True la columna "Diferencias" queda vacía.
     """
-
-    modelo = SentenceTransformer('paraphrase-MiniLM-L6-v2')
-    HOJA_ESTANDAR = "OEI"
-    COL_EST_TEXTO = "Nombre del indicador/ Unidad de medida"
-    COL_EST_CODIGO = "Código"
-
-    COL_OPC_TEXTO = [
+    df_comparar = prep["df"]
+    col_est_texto = espec["col_estandar_texto"]
+    col_est_codigo = espec["col_estandar_codigo"]
+
+    idx_max = indices[:, 0] if indices.size else np.zeros(0, dtype=np.int64)
+    val_max = puntajes[:, 0] if puntajes.size else np.zeros(0)
+
+    textos = df_comparar[prep["col_texto"]].to_numpy()
+
+    # === LIMPIEZA === (solo de las filas elegidas; df_estandar no se modifica)
+    textos_estandar = pd.Series(
+        df_estandar[col_est_texto].to_numpy()[idx_max], dtype=object
+    ).astype(str).str.strip().to_numpy()
+
+    # Categoría
+    textos_estandar_norm_max = np.asarray(textos_estandar_norm, dtype=object)[idx_max]
+    exacta = np.asarray(prep["textos_norm"], dtype=object) == textos_estandar_norm_max
+    categoria = np.where(
+        exacta, "Coincidencia exacta",
+        np.where(val_max >= umbral, "Coincidencia parcial", "No coincide")
+    )
+
+    df_result = pd.DataFrame({
+        "Código del GL": df_comparar[prep["col_codigo"]].to_numpy(),
+        "Elemento del GL": textos,
+        "Código estándar más similar": df_estandar[col_est_codigo].to_numpy()[idx_max],
+        "Elemento estándar más similar": textos_estandar,
+        #"Similitud": val_max.round(3),
+        "Resultado": categoria,
+        # Diferencias literales (sobre los textos ya normalizados)
+        "Diferencias": calcular_diferencias(
+            prep["textos_norm"], textos_estandar_norm_max, exacta, diferencias_diferidas
+        ),
+    }, columns=COLUMNAS_RESULTADO)
+
+    if indices.shape[1] > 1:
+        df_result["Otros candidatos (similitud)"] = formatear_candidatos(
+            df_estandar[col_est_codigo], puntajes, indices
+        )
+
+    return df_result
+
+
+# === ESPECIFICACIONES DE LAS COMPARACIONES OEI ===
+COL_OPC_CODIGO = [
+    "Código", "CODIGO", "CÓDIGO", "Código OEI", "Cod OEI"
+]
+
+ESPEC_OEI_DEN = {
+    "hoja": "OEI",
+    "col_estandar_texto": "Denominación de OEI / AEI / AO",
+    "col_estandar_codigo": "Código",
+    "opciones_texto": [
+        "Enunciado",
+        "Denominación de OEI",
+        "OBJETIVOS ESTRATÉGICOS INSTITUCIONALES",
+        "OBJETIVOS ESTRATÉGICOS INSTITUCIONAL",
+        "OBJETIVOS ESTRATEGICOS INSTITUCIONAL",
+        "Denominación de OEI / AEI / AO",
+        "Descripción"
+    ],
+    "opciones_codigo": COL_OPC_CODIGO,
+    "normalizador": normalizar_serie,
+    "version_normalizacion": VERSION_NORMALIZACION,
+    "preparar": preparar_oei,
+    "columnas_resultado": COLUMNAS_RESULTADO,
+    "construir": construir_resultado_oei,
+}
+
+ESPEC_OEI_IND = {
+    **ESPEC_OEI_DEN,
+    "col_estandar_texto": "Nombre del indicador/ Unidad de medida",
+    "opciones_texto": [
         "Nombre del Indicador",
         "Indicador"
-    ]
-    COL_OPC_CODIGO = [
-        "Código", "CODIGO", "CÓDIGO", "Código OEI", "Cod OEI"
-    ]
-
-    # === FUNCIONES AUXILIARES ===
-    def normalizar_texto(texto):
-        if pd.isna(texto):
-            return ""
-        texto = str(texto).lower().strip()
-        texto = unicodedata.normalize("NFD", texto)
-        texto = texto.encode("ascii", "ignore").decode("utf-8")
-        texto = re.sub(r"[.,;:!?¿¡()\"'”“]", "", texto)
-        texto = re.sub(r"\s+", " ", texto).strip()
-        return texto
-
-    def detectar_columna(df, opciones, tipo):
-        for col in df.columns:
-            for opc in opciones:
-                if col.strip().lower() == opc.strip().lower():
-                    return col
-        raise ValueError(f"No se encontró columna de {tipo} en las opciones: {opciones}")
-
-    def obtener_diferencias(texto1, texto2):
-        """
-        Devuelve las palabras que difieren entre texto1 y texto2.
-        """
-        palabras1 = normalizar_texto(texto1).split()
-        palabras2 = normalizar_texto(texto2).split()
-        diffs = []
-        sm = difflib.SequenceMatcher(None, palabras1, palabras2)
-        for tag, i1, i2, j1, j2 in sm.get_opcodes():
-            if tag in ["replace", "delete", "insert"]:
-                parte1 = " ".join(palabras1[i1:i2])
-                parte2 = " ".join(palabras2[j1:j2])
-                if parte1 and parte2:
-                    diffs.append(f"{parte1} → {parte2}")
-                elif parte1:
-                    diffs.append(f"– {parte1}")
-                elif parte2:
-                    diffs.append(f"+ {parte2}")
-        return "; ".join(diffs) if diffs else "—"
-
-    # === CARGA ===
-    df_estandar = pd.read_excel(ruta_estandar, sheet_name=HOJA_ESTANDAR)
-    df_comparar = df_oei.copy()
-
-    col_txt_cmp = detectar_columna(df_comparar, COL_OPC_TEXTO, "texto a comparar")
-    col_cod_cmp = detectar_columna(df_comparar, COL_OPC_CODIGO, "código a comparar")
-
-    # === LIMPIEZA ===
-    df_estandar[COL_EST_TEXTO] = df_estandar[COL_EST_TEXTO].astype(str).str.strip()
-    df_comparar[col_txt_cmp] = df_comparar[col_txt_cmp].astype(str).str.strip()
-
-    # === NORMALIZACIÓN ===
-    textos_estandar_norm = df_estandar[COL_EST_TEXTO].apply(normalizar_texto)
-    textos_comparar_norm = df_comparar[col_txt_cmp].apply(normalizar_texto)
-
-    # === EMBEDDINGS ===
-    emb_estandar = modelo.encode(textos_estandar_norm.tolist(), convert_to_tensor=True)
-    emb_comparar = modelo.encode(textos_comparar_norm.tolist(), convert_to_tensor=True)
-
-    # === SIMILITUD ===
-    matriz_sim = util.cos_sim(emb_comparar, emb_estandar)
-
-    resultados = []
-    for i, texto in enumerate(df_comparar[col_txt_cmp]):
-        simil_row = matriz_sim[i]
-        idx_max = simil_row.argmax().item()
-        val_max = simil_row[idx_max].item()
-
-        texto_estandar = df_estandar.loc[idx_max, COL_EST_TEXTO]
-        codigo_estandar = df_estandar.loc[idx_max, COL_EST_CODIGO]
-        codigo_comparar = df_comparar.loc[i, col_cod_cmp]
-
-        # Categoría
-        if normalizar_texto(texto) == normalizar_texto(texto_estandar):
-            categoria = "Coincidencia exacta"
-        elif val_max >= umbral:
-            categoria = "Coincidencia parcial"
-        else:
-            categoria = "No coincide"
-
-        # Diferencias literales
-        diferencias = obtener_diferencias(texto, texto_estandar)
-
-        resultados.append({
-            "Código del GL": codigo_comparar,
-            "Elemento del GL": texto,
-            "Código estándar más similar": codigo_estandar,
-            "Elemento estándar más similar": texto_estandar,
-            #"Similitud": round(val_max, 3),
-            "Resultado": categoria,
-            "Diferencias": diferencias
-        })
+    ],
+}
 
-    df_result = pd.DataFrame(resultados)
 
-    # === COLOR VISUAL ===
-    def color_fila(row):
-        if row["Resultado"] == "Coincidencia exacta":
-            return ["background-color: lightgreen"] * len(row)
-        elif row["Resultado"] == "Coincidencia parcial":
-            return ["background-color: khaki"] * len(row)
-        else:
-            return ["background-color: lightcoral"] * len(row)
+def comparar_oei(ruta_estandar, df_oei, umbral=0.75, num_candidatos=1):
+    """
+    Compara la tabla OEI extraída del PEI con la tabla estándar,
+    ignorando diferencias en tildes, espacios y puntuación.
+    Además, muestra las palabras que difieren entre ambas frases y, si
+    num_candidatos > 1, los candidatos alternativos con su similitud.
+    Devuelve el DataFrame de resultados estilizado.
+    """
+    resultados = ejecutar_comparaciones(
+        ruta_estandar, {"oei_den": (ESPEC_OEI_DEN, df_oei)}, umbral, num_candidatos
+    )
+    return estilizar_resultado(resultados["oei_den"])
 
-    df_styled = df_result.style.apply(color_fila, axis=1)
 
-    return df_styled
+def comparar_oei_ind(ruta_estandar, df_oei, umbral=0.75, num_candidatos=1):
+    """
+    Compara los indicadores de la tabla OEI extraída del PEI con la tabla estándar,
+    ignorando diferencias en tildes, espacios y puntuación.
+    Además, muestra las palabras que difieren entre ambas frases y, si
+    num_candidatos > 1, los candidatos alternativos con su similitud.
+    Devuelve el DataFrame de resultados estilizado.
+    """
+    resultados = ejecutar_comparaciones(
+        ruta_estandar, {"oei_ind": (ESPEC_OEI_IND, df_oei)}, umbral, num_candidatos
+    )
+    return estilizar_resultado(resultados["oei_ind"])
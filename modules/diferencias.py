@@ -0,0 +1,120 @@
+from difflib import SequenceMatcher
+
+import pandas as pd
+
+from modules.normalizacion import normalizar_texto
+
+SIN_DIFERENCIAS = "—"
+
+# Columnas de diferencias de los resultados (OEI y AEI)
+COLUMNAS_DIFERENCIAS = ("Diferencias", "Diferencias detectadas")
+
+# La columna de AEI conserva su notación histórica, descrita desde el estándar:
+# "– a" falta en el GL, "+ b" sobra en el GL (la de OEI es la inversa)
+COLUMNAS_DESDE_ESTANDAR = ("Diferencias detectadas",)
+
+
+# === ALINEACIÓN DE PALABRAS ===
+def _operaciones(palabras1, palabras2):
+    """
+    Bloques distintos entre dos listas de palabras: [(i1, i2, j1, j2), ...].
+    Primero se descartan el prefijo y el sufijo comunes (lo habitual en textos
+    casi iguales) y solo el tramo central se alinea con SequenceMatcher.
+    """
+    n = min(len(palabras1), len(palabras2))
+    inicio = 0
+    while inicio < n and palabras1[inicio] == palabras2[inicio]:
+        inicio += 1
+    fin = 0
+    while fin < n - inicio and palabras1[-1 - fin] == palabras2[-1 - fin]:
+        fin += 1
+
+    medio1 = palabras1[inicio:len(palabras1) - fin]
+    medio2 = palabras2[inicio:len(palabras2) - fin]
+    if not medio1 and not medio2:
+        return []
+    if not medio1 or not medio2:
+        return [(inicio, inicio + len(medio1), inicio, inicio + len(medio2))]
+
+    sm = SequenceMatcher(None, medio1, medio2, autojunk=False)
+    return [
+        (inicio + i1, inicio + i2, inicio + j1, inicio + j2)
+        for tag, i1, i2, j1, j2 in sm.get_opcodes() if tag != "equal"
+    ]
+
+
+def diferencia_palabras(palabras1, palabras2):
+    """
+    Describe cómo pasar de palabras1 a palabras2 (en OEI, del GL al estándar):
+    "a → b" reemplazo, "– a" está solo en palabras1, "+ b" está solo en palabras2.
+    """
+    diffs = []
+    for i1, i2, j1, j2 in _operaciones(palabras1, palabras2):
+        parte1 = " ".join(palabras1[i1:i2])
+        parte2 = " ".join(palabras2[j1:j2])
+        if parte1 and parte2:
+            diffs.append(f"{parte1} → {parte2}")
+        elif parte1:
+            diffs.append(f"– {parte1}")
+        else:
+            diffs.append(f"+ {parte2}")
+    return "; ".join(diffs) if diffs else SIN_DIFERENCIAS
+
+
+def diferencia_textos(texto_gl, texto_estandar, desde_estandar=False):
+    """
+    Diferencias entre dos textos sin normalizar (se normalizan aquí).
+    Con desde_estandar=True se describe el paso del estándar al GL (notación de AEI).
+    """
+    palabras_gl = normalizar_texto(texto_gl).split()
+    palabras_estandar = normalizar_texto(texto_estandar).split()
+    if desde_estandar:
+        return diferencia_palabras(palabras_estandar, palabras_gl)
+    return diferencia_palabras(palabras_gl, palabras_estandar)
+
+
+# === COLUMNA DE DIFERENCIAS ===
+def calcular_diferencias(textos_norm, textos_estandar_norm, exacta=None, diferidas=False, desde_estandar=False):
+    """
+    Columna de diferencias a partir de los textos ya normalizados del GL y del
+    estándar (uno por fila). Las filas marcadas en `exacta` no se alinean.
+    Con diferidas=True no se calcula nada (None en cada fila): las diferencias
+    se obtienen luego con completar_diferencias solo para las filas revisadas.
+    Con desde_estandar=True "–" marca lo que falta en el GL y "+" lo que sobra
+    (notación de la tabla AEI); por defecto es al revés (tabla OEI).
+    """
+    if diferidas:
+        return [None] * len(textos_norm)
+    if exacta is None:
+        exacta = [False] * len(textos_norm)
+    if desde_estandar:
+        textos_norm, textos_estandar_norm = textos_estandar_norm, textos_norm
+    return [
+        SIN_DIFERENCIAS if es_exacta or a == b else diferencia_palabras(a.split(), b.split())
+        for a, b, es_exacta in zip(textos_norm, textos_estandar_norm, exacta)
+    ]
+
+
+def completar_diferencias(df_resultado, filas=None):
+    """
+    Calcula las diferencias pendientes (modo diferido) de las filas indicadas
+    (posiciones; por defecto todas) y devuelve una copia del DataFrame.
+    """
+    if isinstance(df_resultado, pd.DataFrame):
+        df = df_resultado.copy()
+    else:
+        df = df_resultado.data.copy()  # Styler
+    columna = next((c for c in COLUMNAS_DIFERENCIAS if c in df.columns), None)
+    if columna is None or df.empty:
+        return df
+
+    posiciones = range(len(df)) if filas is None else filas
+    df[columna] = df[columna].astype(object)
+    col = df.columns.get_loc(columna)
+    col_gl = df.columns.get_loc("Elemento del GL")
+    col_est = df.columns.get_loc("Elemento estándar más similar")
+    desde_estandar = columna in COLUMNAS_DESDE_ESTANDAR
+    for p in posiciones:
+        if pd.isna(df.iat[p, col]):
+            df.iat[p, col] = diferencia_textos(df.iat[p, col_gl], df.iat[p, col_est], desde_estandar)
+    return df
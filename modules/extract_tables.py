@@ -1,7 +1,15 @@
 import os
+import re
+import unicodedata
 import pandas as pd
 from io import BytesIO
+import shutil
 import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.trazas import tramo, trazar, anotar
 
 try:
     import camelot  # Para PDFs digitales
@@ -9,9 +17,49 @@ except ImportError:
     camelot = None
 
 try:
-    from docx import Document  # Para Word
+    import pypdfium2  # Lectura rápida de la capa de texto del PDF
 except ImportError:
-    Document = None
+    pypdfium2 = None
+
+try:
+    from pypdf import PdfReader  # Alternativa si no está pypdfium2
+except ImportError:
+    PdfReader = None
+
+# Sin pypdfium2 ni pypdf no se puede preseleccionar páginas y Camelot lee el PDF completo
+AVISO_SIN_PRESELECCION = (
+    "No está instalado pypdfium2 (ni pypdf): se analizan todas las páginas del PDF. "
+    "Instalar con: pip install pypdfium2"
+)
+
+# Espacio de nombres de WordprocessingML (word/document.xml)
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Número de procesos para leer el PDF con Camelot por bloques de páginas (1 = sin paralelismo)
+TRABAJADORES_PDF = int(os.environ.get("PEI_TRABAJADORES_PDF", "1"))
+
+# Tamaño de los bloques con que se copia el archivo subido a disco
+TAMANO_BLOQUE_ARCHIVO = 1 << 20
+
+# Texto (normalizado, sin tildes) que indica que una página contiene las matrices OEI/AEI
+PATRON_PAGINAS_OBJETIVO = re.compile(
+    r"oei\.0|aei\.0|objetivos estrategicos institucionales|acciones estrategicas institucionales"
+)
+
+
+# Palabras clave que identifican cada tabla buscada en el documento
+TABLAS_OBJETIVO = {
+    "OEI": ["OEI.0", "Objetivos Estratégicos Institucionales"],
+    "AEI": ["AEI.0", "Acciones Estratégicas Institucionales"]
+}
+
+# Un solo patrón precompilado con un grupo por tabla buscada (se evalúa sobre el texto en minúsculas)
+PATRON_TABLAS_OBJETIVO = re.compile("|".join(
+    f"(?P<{nombre}>" + "|".join(re.escape(p.lower()) for p in palabras) + ")"
+    for nombre, palabras in TABLAS_OBJETIVO.items()
+))
+
+PALABRAS_CLAVE_ENCABEZADO = ["código", "enunciado", "denominación", "objetivo", "indicador", "meta"]
 
 
 def detectar_fila_encabezado(dataframe):
@@ -19,7 +67,7 @@ def detectar_fila_encabezado(dataframe):
     Detecta la fila que contiene los encabezados correctos.
     Usa heurísticas simples: más celdas no vacías, presencia de palabras clave comunes.
     """
-    palabras_clave = ["código", "enunciado", "denominación", "objetivo", "indicador", "meta"]
+    palabras_clave = PALABRAS_CLAVE_ENCABEZADO
     mejor_fila = 0
     mejor_puntaje = 0
 
@@ -34,75 +82,316 @@ def detectar_fila_encabezado(dataframe):
     return mejor_fila
 
 
-def extraer_tablas(archivo):
+def _textos_paginas_pdf(ruta_pdf):
+    """
+    Devuelve el texto de cada página del PDF (capa de texto, sin OCR).
+    Retorna None si no hay una librería disponible para leerlo.
+    """
+    if pypdfium2 is not None:
+        pdf = pypdfium2.PdfDocument(ruta_pdf)
+        try:
+            return [pagina.get_textpage().get_text_range() for pagina in pdf]
+        finally:
+            pdf.close()
+    if PdfReader is not None:
+        return [pagina.extract_text() or "" for pagina in PdfReader(ruta_pdf).pages]
+    return None
+
+
+def preseleccionar_paginas(ruta_pdf, paginas_vecinas=1):
+    """
+    Recorre la capa de texto del PDF y devuelve la lista (ordenada, base 1) de
+    páginas que mencionan "OEI.0", "AEI.0" o los títulos de Objetivos/Acciones
+    Estratégicas Institucionales, junto con sus páginas vecinas.
+    Retorna None si no se puede leer el texto o no hay coincidencias; en ese
+    caso se deben analizar todas las páginas.
+    """
+    try:
+        textos = _textos_paginas_pdf(ruta_pdf)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer el texto del PDF para preseleccionar páginas: {e}")
+        return None
+    if not textos:
+        return None
+
+    paginas = set()
+    for i, texto in enumerate(textos):
+        texto = unicodedata.normalize("NFD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+        texto = re.sub(r"\s+", " ", texto)
+        if PATRON_PAGINAS_OBJETIVO.search(texto):
+            for vecina in range(i - paginas_vecinas, i + paginas_vecinas + 1):
+                if 0 <= vecina < len(textos):
+                    paginas.add(vecina + 1)
+
+    return sorted(paginas) or None
+
+
+def formatear_paginas(paginas):
+    """
+    Convierte [1, 2, 3, 7] en "1-3,7" (formato de páginas de Camelot).
+    """
+    rangos = []
+    for pagina in paginas:
+        if rangos and pagina == rangos[-1][1] + 1:
+            rangos[-1][1] = pagina
+        else:
+            rangos.append([pagina, pagina])
+    return ",".join(f"{a}-{b}" if a != b else str(a) for a, b in rangos)
+
+
+def _contar_paginas_pdf(ruta_pdf):
+    if pypdfium2 is not None:
+        pdf = pypdfium2.PdfDocument(ruta_pdf)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    if PdfReader is not None:
+        return len(PdfReader(ruta_pdf).pages)
+    return None
+
+
+def _leer_bloque_pdf(ruta_pdf, paginas):
+    """
+    Lee con Camelot un bloque de páginas. Se ejecuta en un proceso aparte,
+    por eso devuelve solo los DataFrames (los objetos de Camelot no se serializan bien).
+    """
+    return [tabla.df for tabla in camelot.read_pdf(ruta_pdf, pages=paginas)]
+
+
+def leer_tablas_pdf(ruta_pdf, paginas=None, trabajadores=1):
+    """
+    Devuelve los DataFrames de todas las tablas que Camelot encuentra en las
+    `paginas` indicadas (lista base 1; None = todas), en orden de página.
+
+    Con `trabajadores` > 1 las páginas se reparten en bloques contiguos que se
+    procesan en paralelo con un ProcessPoolExecutor; los resultados se unen en
+    el orden de los bloques, de modo que se conserva el orden de página.
+    """
+    if trabajadores > 1 and paginas is None:
+        total = _contar_paginas_pdf(ruta_pdf)
+        paginas = list(range(1, total + 1)) if total else None
+
+    if trabajadores <= 1 or not paginas or len(paginas) < 2:
+        return _leer_bloque_pdf(ruta_pdf, formatear_paginas(paginas) if paginas else "all")
+
+    trabajadores = min(trabajadores, len(paginas))
+    tamano = -(-len(paginas) // trabajadores)  # división hacia arriba
+    bloques = [paginas[i:i + tamano] for i in range(0, len(paginas), tamano)]
+
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        futuros = [pool.submit(_leer_bloque_pdf, ruta_pdf, formatear_paginas(b)) for b in bloques]
+        return [df for futuro in futuros for df in futuro.result()]
+
+
+def iterar_tablas_docx(archivo):
+    """
+    Recorre word/document.xml del .docx con un parser incremental y va
+    entregando (de forma perezosa) cada tabla de primer nivel como una lista
+    de filas con el texto de sus celdas.
+
+    Las celdas combinadas se materializan una sola vez: una celda que abarca
+    varias columnas (gridSpan) deja vacías las columnas siguientes y las
+    continuaciones de una combinación vertical (vMerge) quedan vacías.
+    El texto de tablas anidadas no se incluye (igual que celda.text en python-docx).
+    """
+    with zipfile.ZipFile(archivo) as docx:
+        with docx.open("word/document.xml") as xml:
+            nivel = 0
+            filas = fila = parrafos = partes = None
+            span, continuacion = 1, False
+
+            for evento, elem in ET.iterparse(xml, events=("start", "end")):
+                etiqueta = elem.tag
+
+                if evento == "start":
+                    if etiqueta == W + "tbl":
+                        nivel += 1
+                        if nivel == 1:
+                            filas = []
+                    elif nivel == 1:
+                        if etiqueta == W + "tr":
+                            fila = []
+                        elif etiqueta == W + "tc":
+                            parrafos, partes = [], []
+                            span, continuacion = 1, False
+                    continue
+
+                # === evento "end" ===
+                if etiqueta == W + "tbl":
+                    nivel -= 1
+                    if nivel == 0:
+                        elem.clear()
+                        yield filas
+                        filas = None
+                elif nivel == 1:
+                    if etiqueta == W + "t":
+                        partes.append(elem.text or "")
+                    elif etiqueta == W + "tab":
+                        partes.append("\t")
+                    elif etiqueta in (W + "br", W + "cr"):
+                        partes.append("\n")
+                    elif etiqueta == W + "p":
+                        parrafos.append("".join(partes))
+                        partes = []
+                    elif etiqueta == W + "gridSpan":
+                        span = int(elem.get(W + "val", "1"))
+                    elif etiqueta == W + "vMerge":
+                        continuacion = elem.get(W + "val", "continue") == "continue"
+                    elif etiqueta == W + "tc":
+                        texto = "" if continuacion else "\n".join(parrafos).strip()
+                        fila.append(texto)
+                        fila.extend([""] * (span - 1))
+                    elif etiqueta == W + "tr":
+                        filas.append(fila)
+                elif nivel == 0 and etiqueta == W + "p":
+                    elem.clear()  # párrafos fuera de tablas: liberar memoria
+
+
+def _normalizar_celda(valor):
+    return re.sub(r"\s+", " ", str(valor)).strip().lower()
+
+
+def _filas_continuacion(df, encabezado):
+    """
+    Si `df` continúa una tabla cuyo encabezado es `encabezado`, devuelve sus
+    filas de datos (sin el encabezado repetido); si no, devuelve None.
+    """
+    encabezado = [_normalizar_celda(x) for x in encabezado]
+    for j in range(min(3, len(df))):
+        if [_normalizar_celda(x) for x in df.iloc[j]] == encabezado:
+            return df.iloc[j + 1:]
+
+    # Sin encabezado repetido: la primera fila no debe ser el encabezado de otra tabla
+    if len(df):
+        primera = " ".join(_normalizar_celda(x) for x in df.iloc[0])
+        if sum(p in primera for p in PALABRAS_CLAVE_ENCABEZADO) >= 2:
+            return None
+    return df
+
+
+def seleccionar_tablas(tablas):
+    """
+    Recorre una sola vez las tablas del documento (DataFrames, en orden de
+    aparición) y devuelve {"OEI": df, "AEI": df}.
+
+    Cada tabla se compara contra todas las tablas buscadas a la vez con un
+    patrón precompilado; para cada una gana la primera tabla que la menciona.
+    Las tablas inmediatamente siguientes con el mismo número de columnas que
+    repiten el encabezado (o no tienen uno propio) y no mencionan otra tabla
+    buscada se consideran su continuación (tabla partida en varias páginas)
+    y se unen en un solo DataFrame.
+    La lectura se detiene en cuanto se hallan todas las tablas buscadas.
+    """
+    ganadoras = {}
+    actual = None  # tabla ganadora que aún puede continuar en la siguiente
+
+    for i, df in enumerate(tablas):
+        if actual is None and len(ganadoras) == len(TABLAS_OBJETIVO):
+            break
+        try:
+            texto_tabla = " ".join(df.astype(str).values.flatten()).lower()
+            objetivos = {m.lastgroup for m in PATRON_TABLAS_OBJETIVO.finditer(texto_tabla)}
+
+            # === ¿Continuación de la tabla anterior? ===
+            if actual is not None and df.shape[1] == actual["columnas"] and objetivos <= actual["objetivos"]:
+                filas = _filas_continuacion(df, actual["encabezado"])
+                if filas is not None:
+                    actual["partes"].append(filas)
+                    continue
+            actual = None
+
+            # === ¿Primera tabla que menciona alguna tabla buscada? ===
+            nuevas = [nombre for nombre in TABLAS_OBJETIVO if nombre in objetivos and nombre not in ganadoras]
+            if nuevas:
+                fila_header = detectar_fila_encabezado(df)
+                actual = {
+                    "encabezado": df.iloc[fila_header].tolist(),
+                    "partes": [df.iloc[fila_header + 1:]],
+                    "objetivos": objetivos,
+                    "columnas": df.shape[1],
+                }
+                for nombre in nuevas:
+                    ganadoras[nombre] = actual
+        except Exception as e:
+            print(f"⚠️ Error al procesar tabla {i}: {e}")
+            actual = None
+
+    tablas_encontradas = {}
+    for nombre, grupo in ganadoras.items():
+        df = pd.concat(grupo["partes"], ignore_index=True)
+        df.columns = grupo["encabezado"]
+        df = df.loc[:, ~df.columns.duplicated()]
+        tablas_encontradas[nombre] = df
+    return tablas_encontradas
+
+
+@trazar("extraccion")
+def extraer_tablas(archivo, informe=None, trabajadores=None):
     """
     Extrae las tablas OEI y AEI de un archivo PDF o Word del PEI.
     Retorna un diccionario con DataFrames.
+    Si se pasa un diccionario `informe`, se registra en él qué páginas del PDF
+    se analizaron con Camelot ("paginas_analizadas") y, si no se pudo
+    preseleccionar por falta de pypdfium2/pypdf, el aviso ("aviso_paginas").
+    `trabajadores` indica cuántos procesos usa Camelot (por defecto TRABAJADORES_PDF).
     """
     nombre_archivo = archivo.name
     extension = os.path.splitext(nombre_archivo)[1].lower()
-
-    tablas_objetivo = {
-        "OEI": ["OEI.0", "Objetivos Estratégicos Institucionales"],
-        "AEI": ["AEI.0", "Acciones Estratégicas Institucionales"]
-    }
-
-    tablas_encontradas = {}
+    anotar(formato=extension)
 
     # === PDF ===
     if extension == ".pdf":
         if camelot is None:
             raise ImportError("Falta instalar camelot: pip install camelot-py[cv]")
 
+        # Se copia a disco por bloques (sin cargar todo el archivo en memoria)
         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp.write(archivo.read())
+            shutil.copyfileobj(archivo, tmp, TAMANO_BLOQUE_ARCHIVO)
             tmp_path = tmp.name
 
         try:
-            tablas = camelot.read_pdf(tmp_path, pages="all")
-        except Exception as e:
-            raise RuntimeError(f"Error al leer el PDF con Camelot: {e}")
-
-        for nombre, palabras_clave in tablas_objetivo.items():
-            for i, tabla in enumerate(tablas):
-                df = tabla.df
-                texto_tabla = " ".join(df.astype(str).values.flatten())
-                if any(p.lower() in texto_tabla.lower() for p in palabras_clave):
-                    fila_header = detectar_fila_encabezado(df)
-                    df.columns = df.iloc[fila_header]
-                    df = df[fila_header + 1:].reset_index(drop=True)
-                    df = df.loc[:, ~df.columns.duplicated()]
-                    tablas_encontradas[nombre] = df
-                    break
-
-        os.remove(tmp_path)
+            # Solo se procesan con Camelot las páginas que mencionan OEI/AEI (y sus vecinas)
+            with tramo("extraccion.preseleccion"):
+                paginas = preseleccionar_paginas(tmp_path)
+                paginas_camelot = formatear_paginas(paginas) if paginas else "all"
+                anotar(paginas=paginas_camelot)
+                sin_preseleccion = pypdfium2 is None and PdfReader is None
+                if sin_preseleccion:
+                    print(f"⚠️ {AVISO_SIN_PRESELECCION}")
+                    anotar(aviso="sin pypdfium2/pypdf")
+            if informe is not None:
+                informe["paginas_analizadas"] = paginas_camelot
+                if sin_preseleccion:
+                    informe["aviso_paginas"] = AVISO_SIN_PRESELECCION
+
+            try:
+                with tramo("extraccion.camelot") as traza:
+                    tablas = leer_tablas_pdf(
+                        tmp_path, paginas, TRABAJADORES_PDF if trabajadores is None else trabajadores
+                    )
+                    traza.anotar(tablas=len(tablas))
+            except Exception as e:
+                raise RuntimeError(f"Error al leer el PDF con Camelot: {e}")
+
+            tablas_encontradas = seleccionar_tablas(tablas)
+            del tablas  # las tablas descartadas se liberan de inmediato
+        finally:
+            os.remove(tmp_path)
 
     # === WORD ===
     elif extension == ".docx":
-        if Document is None:
-            raise ImportError("Falta instalar python-docx: pip install python-docx")
-
-        doc = Document(archivo)
-        for nombre, palabras_clave in tablas_objetivo.items():
-            for i, tabla in enumerate(doc.tables):
-                try:
-                    data = [[celda.text.strip() for celda in fila.cells] for fila in tabla.rows]
-                    texto_tabla = " ".join(" ".join(fila) for fila in data)
-                    if any(p.lower() in texto_tabla.lower() for p in palabras_clave):
-                        df = pd.DataFrame(data)
-                        fila_header = detectar_fila_encabezado(df)
-                        df.columns = df.iloc[fila_header]
-                        df = df[fila_header + 1:].reset_index(drop=True)
-                        df = df.loc[:, ~df.columns.duplicated()]
-                        tablas_encontradas[nombre] = df
-                        break
-                except Exception as e:
-                    print(f"⚠️ Error al procesar tabla {i}: {e}")
+        # Recorrido perezoso: se deja de leer cuando ya se hallaron OEI y AEI
+        with tramo("extraccion.docx"):
+            tablas_encontradas = seleccionar_tablas(
+                pd.DataFrame(data).fillna("") for data in iterar_tablas_docx(archivo)
+            )
 
     else:
         raise ValueError(f"Formato de archivo no soportado: {extension}")
 
     if not tablas_encontradas:
         print("⚠️ No se encontraron tablas OEI o AEI en el documento.")
+    anotar(filas={nombre: len(df) for nombre, df in tablas_encontradas.items()})
 
     return tablas_encontradas
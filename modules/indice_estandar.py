@@ -0,0 +1,175 @@
+import os
+import re
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+from modules.modelo import identificador_modelo, variante_modelo, codificar, TIPO_EMBEDDINGS
+from modules.trazas import tramo, trazar, anotar
+
+# Las embeddings se guardan en una carpeta junto al libro estándar, p. ej.
+# "Extraer_por_elemento_MEGL.xlsx.emb/OEI__nombre_del_indicador__<clave>.npy"
+SUFIJO_CARPETA = ".emb"
+
+_hashes = {}
+_hojas = {}
+_embeddings = {}
+_filas_padre = {}
+_candado = threading.Lock()
+
+
+def hash_estandar(ruta_estandar):
+    """
+    Devuelve el hash SHA-256 del contenido del libro estándar.
+    Se recalcula solo si cambia la fecha de modificación o el tamaño del archivo.
+    """
+    info = os.stat(ruta_estandar)
+    firma = (os.path.abspath(ruta_estandar), info.st_mtime_ns, info.st_size)
+    if firma not in _hashes:
+        h = hashlib.sha256()
+        with open(ruta_estandar, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+        _hashes[firma] = h.hexdigest()
+    return _hashes[firma]
+
+
+def cargar_hoja_estandar(ruta_estandar, hoja, copia=True):
+    """
+    Lee una hoja del libro estándar una sola vez por proceso y devuelve una copia,
+    de modo que cada comparación pueda modificarla sin afectar a las demás.
+    Con copia=False se devuelve la hoja compartida (solo lectura).
+    """
+    clave = (hash_estandar(ruta_estandar), hoja)
+    if clave not in _hojas:
+        with _candado:
+            if clave not in _hojas:
+                with tramo("estandar.leer_excel", hoja=hoja) as traza:
+                    _hojas[clave] = pd.read_excel(ruta_estandar, sheet_name=hoja)
+                    traza.anotar(filas=len(_hojas[clave]))
+    return _hojas[clave].copy() if copia else _hojas[clave]
+
+
+def filas_por_padre(ruta_estandar, hoja, columna_codigo, codigo_padre):
+    """
+    Índice {código padre: filas de la hoja} (p. ej. "OEI.01" -> filas de
+    AEI.01.xx), donde `codigo_padre` obtiene el padre de cada código. Como el
+    estándar está ordenado por código, cada grupo es un rango contiguo de filas.
+    Se construye una sola vez por libro, hoja y función.
+    """
+    clave = (hash_estandar(ruta_estandar), hoja, columna_codigo, codigo_padre)
+    if clave not in _filas_padre:
+        df_estandar = cargar_hoja_estandar(ruta_estandar, hoja, copia=False)
+        padres = df_estandar[columna_codigo].map(codigo_padre).to_numpy(dtype=object)
+        filas = {}
+        for fila, padre in enumerate(padres):
+            if padre is not None:
+                filas.setdefault(padre, []).append(fila)
+        _filas_padre[clave] = {padre: np.asarray(f, dtype=np.int64) for padre, f in filas.items()}
+    return _filas_padre[clave]
+
+
+def _slug(texto):
+    texto = re.sub(r"[^0-9a-zA-Z]+", "_", str(texto).lower())
+    return texto.strip("_")
+
+
+def _ruta_indice(ruta_estandar, hoja, columna, version_normalizacion):
+    clave = hashlib.sha256(
+        "|".join([hash_estandar(ruta_estandar), identificador_modelo(), version_normalizacion]).encode("utf-8")
+    ).hexdigest()[:16]
+    carpeta = ruta_estandar + SUFIJO_CARPETA
+    prefijo = f"{_slug(hoja)}__{_slug(columna)}__"
+    if variante_modelo():
+        # Cada backend (y precisión) conserva su propio índice
+        prefijo += f"{_slug(variante_modelo())}__"
+    return carpeta, prefijo, os.path.join(carpeta, f"{prefijo}{clave}.npy")
+
+
+def _guardar_indice(ruta_npy, carpeta, prefijo, embeddings):
+    os.makedirs(carpeta, exist_ok=True)
+    ruta_tmp = f"{ruta_npy}.{os.getpid()}.tmp"
+    with open(ruta_tmp, "wb") as f:
+        np.save(f, np.asarray(embeddings, dtype=TIPO_EMBEDDINGS))
+    os.replace(ruta_tmp, ruta_npy)
+
+    # Eliminar índices obsoletos de la misma hoja/columna (y del mismo backend)
+    obsoleto = re.compile(re.escape(prefijo) + r"[0-9a-f]{16}\.npy")
+    for nombre in os.listdir(carpeta):
+        if obsoleto.fullmatch(nombre) and nombre != os.path.basename(ruta_npy):
+            try:
+                os.remove(os.path.join(carpeta, nombre))
+            except OSError:
+                pass
+
+
+def _registrar(ruta_npy, textos_norm, embeddings):
+    # Índice de coincidencias exactas: texto normalizado -> primera fila del estándar
+    exactos = {}
+    for i, texto in enumerate(textos_norm):
+        if texto:
+            exactos.setdefault(texto, i)
+    _embeddings[ruta_npy] = (textos_norm, embeddings, exactos)
+    return _embeddings[ruta_npy]
+
+
+@trazar("estandar.embeddings")
+def obtener_embeddings_estandar_lote(ruta_estandar, solicitudes):
+    """
+    Devuelve, para cada solicitud (hoja, columna, normalizador, version_normalizacion),
+    la tupla (textos_normalizados, embeddings, exactos) de esa columna del libro
+    estándar, donde `exactos` es el diccionario {texto normalizado: fila}.
+    El normalizador recibe la columna completa (Serie) y devuelve sus textos normalizados.
+
+    Las embeddings se leen de archivos .npy en disco (memory-mapped) cuya clave
+    combina el hash del libro, el nombre del modelo y la versión de normalización.
+    Si la clave cambia (nuevo estándar, otro modelo u otra normalización), el
+    archivo se reconstruye y se eliminan las versiones anteriores. Todas las
+    columnas que falten se codifican juntas en una sola llamada al modelo.
+    """
+    resultados = [None] * len(solicitudes)
+    pendientes = []
+
+    for n, (hoja, columna, normalizador, version) in enumerate(solicitudes):
+        carpeta, prefijo, ruta_npy = _ruta_indice(ruta_estandar, hoja, columna, version)
+        if ruta_npy in _embeddings:
+            resultados[n] = _embeddings[ruta_npy]
+            continue
+        df_estandar = cargar_hoja_estandar(ruta_estandar, hoja)
+        textos_norm = normalizador(df_estandar[columna]).tolist()
+        if os.path.exists(ruta_npy):
+            embeddings = np.load(ruta_npy, mmap_mode="r")
+            if len(embeddings) == len(textos_norm):
+                resultados[n] = _registrar(ruta_npy, textos_norm, embeddings)
+                continue
+        # Índice inexistente o incompleto: se reconstruye
+        pendientes.append((n, carpeta, prefijo, ruta_npy, textos_norm))
+
+    anotar(solicitudes=len(solicitudes), reconstruidas=len(pendientes),
+           cache="fallo" if pendientes else "acierto")
+    if pendientes:
+        with _candado:
+            unicos = list(dict.fromkeys(t for *_, textos in pendientes for t in textos))
+            posicion = {t: i for i, t in enumerate(unicos)}
+            emb_unicos = codificar(unicos) if unicos else np.zeros((0, 0), dtype=TIPO_EMBEDDINGS)
+            for n, carpeta, prefijo, ruta_npy, textos_norm in pendientes:
+                if ruta_npy in _embeddings:  # solicitud repetida en el mismo lote
+                    resultados[n] = _embeddings[ruta_npy]
+                    continue
+                embeddings = emb_unicos[[posicion[t] for t in textos_norm]]
+                _guardar_indice(ruta_npy, carpeta, prefijo, embeddings)
+                resultados[n] = _registrar(ruta_npy, textos_norm, np.load(ruta_npy, mmap_mode="r"))
+
+    return resultados
+
+
+def obtener_embeddings_estandar(ruta_estandar, hoja, columna, normalizador, version_normalizacion):
+    """
+    Devuelve (textos_normalizados, embeddings, exactos) de una columna del libro estándar.
+    Ver obtener_embeddings_estandar_lote.
+    """
+    return obtener_embeddings_estandar_lote(
+        ruta_estandar, [(hoja, columna, normalizador, version_normalizacion)]
+    )[0]
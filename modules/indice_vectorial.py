@@ -0,0 +1,335 @@
+"""
+Índice vectorial para catálogos estándar grandes (la matriz MEGL más
+catálogos sectoriales o regionales), con búsqueda exacta ("plano") o
+aproximada ("hnsw", requiere hnswlib).
+
+Las filas se agrupan en particiones por catálogo y tipo de elemento (hoja:
+OEI, AEI, ...); los filtros eligen particiones y cada partición se busca por
+separado (las pequeñas siempre de forma exacta). El índice se construye a
+partir de las embeddings ya guardadas del estándar y se persiste en disco.
+
+El motor de comparación no lo usa: con una sola matriz (MEGL, a lo sumo
+unos cientos de filas por hoja) la búsqueda exacta es más rápida y no pierde
+recall. Medido con 300 consultas de 384 dimensiones en una CPU, la búsqueda
+exacta gana hasta unas 15 000 filas por partición; por encima, HNSW con ef=64
+es más rápido pero su recall@1 cae (0,76 con 20 000 filas), y subir ef para
+recuperarlo lo vuelve más lento que la búsqueda exacta.
+
+Uso (recall@k de HNSW frente a la búsqueda exacta sobre el estándar incluido):
+    python -m modules.indice_vectorial [--catalogo MEGL=Extraer_por_elemento_MEGL.xlsx ...]
+                                       [--k 5] [--json salida.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import hnswlib  # Búsqueda aproximada (grafos HNSW)
+except ImportError:
+    hnswlib = None
+
+from modules.modelo import codificar, identificador_modelo
+from modules.normalizacion import normalizar_serie
+from modules.indice_estandar import hash_estandar, cargar_hoja_estandar, obtener_embeddings_estandar_lote
+
+TIPOS_INDICE = ("plano", "hnsw")
+HNSW_DISPONIBLE = hnswlib is not None
+CARPETA_INDICES = os.environ.get("PEI_CARPETA_INDICES", ".indices_vectoriales")
+RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+COLUMNAS_METADATOS = ["catalogo", "tipo", "fila", "codigo", "texto"]
+
+# Parámetros de los grafos HNSW
+HNSW_M = 16
+HNSW_EF_CONSTRUCCION = 200
+HNSW_EF_BUSQUEDA = 64
+# Las particiones con menos filas se recorren de forma exacta (es más rápido, ver arriba)
+FILAS_MINIMAS_HNSW = int(os.environ.get("PEI_FILAS_ANN", "20000"))
+
+
+def _normalizar_filas(vectores):
+    vectores = np.asarray(vectores, dtype=np.float32)
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    return vectores / np.where(normas == 0, 1, normas)
+
+
+# === ÍNDICE ===
+class IndiceVectorial:
+    """
+    Vectores (normalizados: similitud = producto interno) con sus metadatos
+    (COLUMNAS_METADATOS) y, con tipo="hnsw", un grafo por partición
+    (catálogo, tipo de elemento) de al menos `filas_minimas_hnsw` filas.
+    """
+
+    def __init__(self, vectores, metadatos=None, tipo="plano", filas_minimas_hnsw=FILAS_MINIMAS_HNSW,
+                 grafos=None):
+        if tipo not in TIPOS_INDICE:
+            raise ValueError(f"Tipo de índice desconocido: {tipo}. Opciones: {TIPOS_INDICE}")
+        if tipo == "hnsw" and hnswlib is None:
+            raise ImportError("Falta instalar hnswlib: pip install hnswlib")
+        self.vectores = _normalizar_filas(vectores)
+        if metadatos is None:
+            metadatos = pd.DataFrame({"catalogo": "", "tipo": "", "fila": np.arange(len(self.vectores))})
+        self.metadatos = metadatos.reset_index(drop=True)
+        self.tipo = tipo
+        self.filas_minimas_hnsw = filas_minimas_hnsw
+        self.particiones = {
+            clave: np.asarray(filas, dtype=np.int64)
+            for clave, filas in self.metadatos.groupby(["catalogo", "tipo"], sort=False).indices.items()
+        }
+        self._grafos = grafos if grafos is not None else {}
+        if tipo == "hnsw" and grafos is None:
+            for clave, filas in self.particiones.items():
+                if len(filas) >= filas_minimas_hnsw:
+                    self._grafos[clave] = self._construir_grafo(filas)
+
+    def __len__(self):
+        return len(self.vectores)
+
+    def _construir_grafo(self, filas):
+        grafo = hnswlib.Index(space="ip", dim=self.vectores.shape[1])
+        grafo.init_index(max_elements=len(filas), ef_construction=HNSW_EF_CONSTRUCCION, M=HNSW_M)
+        grafo.add_items(self.vectores[filas], filas)
+        grafo.set_ef(HNSW_EF_BUSQUEDA)
+        return grafo
+
+    def _buscar_particion(self, clave, consultas, k, exacta):
+        filas = self.particiones[clave]
+        k = min(k, len(filas))
+        if not exacta and clave in self._grafos:
+            grafo = self._grafos[clave]
+            grafo.set_ef(max(HNSW_EF_BUSQUEDA, k))
+            posiciones, distancias = grafo.knn_query(consultas, k=k)
+            return 1 - distancias, posiciones.astype(np.int64)
+
+        similitudes = consultas @ self.vectores[filas].T
+        mejores = np.argpartition(-similitudes, k - 1, axis=1)[:, :k] if k < len(filas) else \
+            np.tile(np.arange(len(filas)), (len(consultas), 1))
+        return np.take_along_axis(similitudes, mejores, axis=1), filas[mejores]
+
+    def buscar(self, consultas, k=1, catalogos=None, tipos=None, exacta=False):
+        """
+        Los `k` vecinos más similares de cada consulta entre las filas de los
+        catálogos y tipos de elemento indicados (None = todos).
+        Con exacta=True se ignoran los grafos HNSW (búsqueda exacta).
+        Devuelve (puntajes, posiciones), de forma (consultas, k), ordenados de
+        mayor a menor similitud; las posiciones son filas de `metadatos` y se
+        completan con -1 (puntaje NaN) si hay menos de `k` filas.
+        """
+        consultas = _normalizar_filas(consultas)
+        n = len(consultas)
+        claves = [
+            (catalogo, tipo) for catalogo, tipo in self.particiones
+            if (catalogos is None or catalogo in catalogos) and (tipos is None or tipo in tipos)
+        ]
+        puntajes = np.full((n, k), np.nan, dtype=np.float32)
+        posiciones = np.full((n, k), -1, dtype=np.int64)
+        if not n or not claves:
+            return puntajes, posiciones
+
+        partes = [self._buscar_particion(clave, consultas, k, exacta) for clave in claves]
+        todos_puntajes = np.concatenate([p for p, _ in partes], axis=1)
+        todas_posiciones = np.concatenate([i for _, i in partes], axis=1)
+        orden = np.argsort(-todos_puntajes, axis=1, kind="stable")[:, :k]
+        ancho = orden.shape[1]
+        puntajes[:, :ancho] = np.take_along_axis(todos_puntajes, orden, axis=1)
+        posiciones[:, :ancho] = np.take_along_axis(todas_posiciones, orden, axis=1)
+        return puntajes, posiciones
+
+    # === PERSISTENCIA ===
+    def guardar(self, carpeta):
+        """
+        Guarda vectores, metadatos y grafos en `carpeta` (se reemplaza completa).
+        """
+        # Nombre único por proceso e hilo: dos hilos pueden guardar el mismo índice a la vez
+        temporal = f"{carpeta.rstrip(os.sep)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(temporal, ignore_errors=True)
+        os.makedirs(temporal)
+        np.save(os.path.join(temporal, "vectores.npy"), self.vectores)
+        self.metadatos.to_json(os.path.join(temporal, "metadatos.json"), orient="split",
+                               index=False, force_ascii=False)
+        grafos = {}
+        for n, (clave, grafo) in enumerate(self._grafos.items()):
+            grafos[f"grafo_{n}.bin"] = list(clave)
+            grafo.save_index(os.path.join(temporal, f"grafo_{n}.bin"))
+        with open(os.path.join(temporal, "info.json"), "w", encoding="utf-8") as f:
+            json.dump({"tipo": self.tipo, "filas_minimas_hnsw": self.filas_minimas_hnsw, "grafos": grafos},
+                      f, ensure_ascii=False)
+        shutil.rmtree(carpeta, ignore_errors=True)
+        os.replace(temporal, carpeta)
+
+    @classmethod
+    def cargar(cls, carpeta):
+        with open(os.path.join(carpeta, "info.json"), encoding="utf-8") as f:
+            info = json.load(f)
+        vectores = np.load(os.path.join(carpeta, "vectores.npy"))
+        metadatos = pd.read_json(os.path.join(carpeta, "metadatos.json"), orient="split",
+                                 dtype={"catalogo": str, "tipo": str, "codigo": str})
+        grafos = {}
+        if info["tipo"] == "hnsw":
+            if hnswlib is None:
+                raise ImportError("Falta instalar hnswlib: pip install hnswlib")
+            for archivo, (catalogo, tipo) in info["grafos"].items():
+                grafo = hnswlib.Index(space="ip", dim=vectores.shape[1])
+                grafo.load_index(os.path.join(carpeta, archivo))
+                grafo.set_ef(HNSW_EF_BUSQUEDA)
+                grafos[(catalogo, tipo)] = grafo
+        return cls(vectores, metadatos, info["tipo"], info["filas_minimas_hnsw"], grafos=grafos)
+
+
+# === ÍNDICE A PARTIR DE LOS LIBROS ESTÁNDAR ===
+def solicitudes_por_defecto():
+    """
+    (hoja, columna, normalizador, versión) de las comparaciones de denominación:
+    las mismas embeddings que usa el motor, ya guardadas en disco.
+    """
+    from modules.comparador import COMPARACIONES
+    return list(dict.fromkeys(
+        (espec["hoja"], espec["col_estandar_texto"], espec["normalizador"], espec["version_normalizacion"],
+         espec["col_estandar_codigo"])
+        for nombre, (_, espec) in COMPARACIONES.items() if "Denominación" in nombre
+    ))
+
+
+def construir_indice(catalogos, tipo="hnsw", solicitudes=None, filas_minimas_hnsw=FILAS_MINIMAS_HNSW):
+    """
+    Índice de las filas de varios libros estándar: `catalogos` es
+    {nombre del catálogo: ruta del libro}; `solicitudes` es una lista de
+    (hoja, columna de texto, normalizador, versión, columna de código), una
+    partición por catálogo y hoja.
+    """
+    solicitudes = solicitudes or solicitudes_por_defecto()
+    vectores, metadatos = [], []
+    for catalogo, ruta in catalogos.items():
+        indices = obtener_embeddings_estandar_lote(ruta, [s[:4] for s in solicitudes])
+        for (hoja, columna, _, _, col_codigo), (_, embeddings, _) in zip(solicitudes, indices):
+            df_estandar = cargar_hoja_estandar(ruta, hoja, copia=False)
+            vectores.append(np.asarray(embeddings, dtype=np.float32))
+            metadatos.append(pd.DataFrame({
+                "catalogo": catalogo,
+                "tipo": hoja,
+                "fila": np.arange(len(df_estandar)),
+                "codigo": df_estandar[col_codigo].astype(str).to_numpy(),
+                "texto": df_estandar[columna].astype(str).to_numpy(),
+            }, columns=COLUMNAS_METADATOS))
+    return IndiceVectorial(
+        np.concatenate(vectores), pd.concat(metadatos, ignore_index=True), tipo, filas_minimas_hnsw
+    )
+
+
+def _clave_indice(catalogos, tipo, solicitudes, filas_minimas_hnsw):
+    partes = [identificador_modelo(), tipo, str(filas_minimas_hnsw), str(HNSW_M), str(HNSW_EF_CONSTRUCCION)]
+    partes += [f"{nombre}={hash_estandar(ruta)}" for nombre, ruta in catalogos.items()]
+    partes += [f"{hoja}:{columna}:{version}:{codigo}" for hoja, columna, _, version, codigo in solicitudes]
+    return hashlib.sha256("|".join(partes).encode("utf-8")).hexdigest()[:16]
+
+
+def obtener_indice(catalogos, tipo="hnsw", solicitudes=None, filas_minimas_hnsw=FILAS_MINIMAS_HNSW,
+                   carpeta=CARPETA_INDICES):
+    """
+    Carga de disco el índice de los catálogos o, si cambió alguno de los
+    libros, el modelo o los parámetros, lo construye y lo guarda.
+    """
+    solicitudes = solicitudes or solicitudes_por_defecto()
+    ruta = os.path.join(carpeta, _clave_indice(catalogos, tipo, solicitudes, filas_minimas_hnsw))
+    if os.path.exists(os.path.join(ruta, "info.json")):
+        return IndiceVectorial.cargar(ruta)
+    indice = construir_indice(catalogos, tipo, solicitudes, filas_minimas_hnsw)
+    os.makedirs(carpeta, exist_ok=True)
+    indice.guardar(ruta)
+    return indice
+
+
+# === RECALL ===
+def recall_a_k(indice, consultas, k=5, catalogos=None, tipos=None):
+    """
+    Fracción de los `k` vecinos exactos que también devuelve la búsqueda del
+    índice (promedio sobre las consultas). Un vecino devuelto con la misma
+    similitud que el k-ésimo exacto cuenta como acierto (empates entre filas
+    con textos repetidos).
+    """
+    consultas = _normalizar_filas(consultas)
+    _, aproximados = indice.buscar(consultas, k, catalogos, tipos)
+    puntajes_exactos, exactos = indice.buscar(consultas, k, catalogos, tipos, exacta=True)
+    aciertos = total = 0
+    for consulta, fila_aprox, fila_exacta, pts_exactos in zip(consultas, aproximados, exactos, puntajes_exactos):
+        validos = fila_exacta >= 0
+        if not validos.any():
+            continue
+        minimo = pts_exactos[validos].min() - 1e-5
+        devueltos = fila_aprox[fila_aprox >= 0]
+        # Similitud exacta de cada vecino devuelto
+        similitudes = indice.vectores[devueltos] @ consulta
+        aciertos += min(int((similitudes >= minimo).sum()), int(validos.sum()))
+        total += int(validos.sum())
+    return aciertos / total if total else 1.0
+
+
+def consultas_de_prueba(indice, semilla=0):
+    """
+    Textos de consulta a partir del propio catálogo: cada texto original y
+    variantes con palabras omitidas, intercambiadas, truncadas o mezcladas.
+    """
+    from modules.paridad_backend import variantes_texto
+    azar = random.Random(semilla)
+    textos = indice.metadatos["texto"].tolist()
+    consultas = [
+        variante
+        for n, texto in enumerate(textos)
+        for variante in variantes_texto(texto, textos[(n + 1) % len(textos)], azar).values()
+    ]
+    return normalizar_serie(pd.Series(consultas, dtype=object)).tolist()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m modules.indice_vectorial",
+                                     description="Recall@k del índice HNSW frente a la búsqueda exacta")
+    parser.add_argument("--catalogo", action="append",
+                        help=f"NOMBRE=ruta del libro estándar (repetible; por defecto MEGL={RUTA_ESTANDAR})")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--filas-minimas-hnsw", type=int, default=0,
+                        help="Particiones más pequeñas se buscan de forma exacta (0 = grafo en todas)")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo")
+    args = parser.parse_args(argv)
+
+    catalogos = dict(c.split("=", 1) for c in (args.catalogo or [f"MEGL={RUTA_ESTANDAR}"]))
+    inicio = time.perf_counter()
+    indice = obtener_indice(catalogos, "hnsw", filas_minimas_hnsw=args.filas_minimas_hnsw)
+    segundos_indice = time.perf_counter() - inicio
+    consultas = codificar(consultas_de_prueba(indice))
+
+    filtros = {"todos": {}}
+    filtros.update({f"tipo={tipo}": {"tipos": [tipo]} for tipo in indice.metadatos["tipo"].unique()})
+    filtros.update({f"catalogo={c}": {"catalogos": [c]} for c in catalogos})
+
+    reporte = {"filas": len(indice), "consultas": len(consultas), "k": args.k,
+               "segundos_indice": round(segundos_indice, 4), "filtros": {}}
+    print(f"Índice: {len(indice)} filas, {len(consultas)} consultas ({segundos_indice:.2f} s)")
+    for nombre, filtro in filtros.items():
+        tiempos = {}
+        for modo, exacta in (("hnsw", False), ("exacta", True)):
+            inicio = time.perf_counter()
+            indice.buscar(consultas, args.k, exacta=exacta, **filtro)
+            tiempos[modo] = time.perf_counter() - inicio
+        recall = recall_a_k(indice, consultas, args.k, **filtro)
+        reporte["filtros"][nombre] = {"recall": round(recall, 4),
+                                      **{f"segundos_{m}": round(t, 6) for m, t in tiempos.items()}}
+        print(f"  {nombre:20} recall@{args.k} = {recall:.3f}  "
+              f"hnsw {tiempos['hnsw'] * 1000:7.1f} ms  exacta {tiempos['exacta'] * 1000:7.1f} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Comparación por lotes, sin interfaz: procesa todos los PEI (.docx / .pdf) de una
+carpeta y genera un único reporte consolidado.
+
+Uso:
+    python -m modules.lote CARPETA [-o reporte.xlsx|reporte.parquet] [opciones]
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from modules.extract_tables import extraer_tablas
+from modules.comparador import comparar_documentos
+from modules.cache_resultados import clave_resultados, leer_cache, guardar_cache
+from modules.reporte import consolidar_lote, exportar_lote
+
+RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+EXTENSIONES = (".docx", ".pdf")
+COLUMNAS_ERRORES = ["Documento", "Etapa", "Error"]
+
+
+# === DOCUMENTOS DE ENTRADA ===
+def listar_documentos(carpeta, recursivo=False):
+    """
+    Rutas de los archivos .docx / .pdf de la carpeta, en orden alfabético.
+    Se ignoran los temporales de Word ("~$...").
+    """
+    if recursivo:
+        rutas = [os.path.join(raiz, f) for raiz, _, archivos in os.walk(carpeta) for f in archivos]
+    else:
+        rutas = [os.path.join(carpeta, f) for f in os.listdir(carpeta)]
+    return sorted(
+        r for r in rutas
+        if os.path.isfile(r) and r.lower().endswith(EXTENSIONES)
+        and not os.path.basename(r).startswith("~$")
+    )
+
+
+def _extraer_documento(ruta):
+    """
+    Se ejecuta en un proceso del pool: extrae las tablas de un documento.
+    Devuelve (tablas, error); los errores se devuelven como texto para que un
+    documento dañado no interrumpa el lote.
+    """
+    try:
+        with open(ruta, "rb") as archivo:
+            return extraer_tablas(archivo, trabajadores=1), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+# === PROCESAMIENTO DEL LOTE ===
+def procesar_lote(rutas, ruta_estandar=RUTA_ESTANDAR, umbral=0.75, num_candidatos=1,
+                  procesos=None, tamano_grupo=32, usar_cache=True, nombres=None,
+                  diferencias_diferidas=False):
+    """
+    Extrae las tablas de los documentos en un pool de procesos y, a medida que
+    terminan, los compara en grupos de `tamano_grupo` documentos con el modelo
+    cargado una sola vez en este proceso (codificación en lotes entre documentos).
+    Los documentos ya procesados se leen de la caché en disco. Con
+    diferencias_diferidas=True no se calcula la columna de diferencias.
+
+    Devuelve (resultados, errores): {documento: {comparación: DataFrame}} y una
+    lista de dicts con las columnas de COLUMNAS_ERRORES.
+    """
+    nombres = nombres or {r: r for r in rutas}
+    resultados, errores = {}, []
+    claves = {}
+    pendientes = []
+
+    # === CACHÉ ===
+    for ruta in rutas:
+        if usar_cache:
+            try:
+                with open(ruta, "rb") as f:
+                    claves[ruta] = clave_resultados(
+                        f, ruta_estandar, umbral, num_candidatos, diferencias_diferidas
+                    )
+            except OSError as e:
+                errores.append({"Documento": nombres[ruta], "Etapa": "lectura", "Error": str(e)})
+                continue
+            en_cache = leer_cache(claves[ruta])
+            if en_cache is not None:
+                resultados[nombres[ruta]] = en_cache[1]
+                continue
+        pendientes.append(ruta)
+
+    if len(resultados):
+        print(f"♻️ {len(resultados)} documento(s) recuperados de la caché")
+
+    # === EXTRACCIÓN (paralela) Y COMPARACIÓN (por grupos) ===
+    def comparar_grupo(grupo):
+        fallidos = {}
+        documentos = {nombres[r]: tablas for r, tablas in grupo.items()}
+        try:
+            por_documento = comparar_documentos(
+                ruta_estandar, documentos, umbral, num_candidatos, errores=fallidos,
+                diferencias_diferidas=diferencias_diferidas,
+            )
+        except Exception:
+            # Error en una etapa común del grupo (p. ej. la codificación conjunta):
+            # se repite documento por documento para aislar al que falla
+            por_documento = {}
+            for documento, tablas in documentos.items():
+                try:
+                    por_documento.update(comparar_documentos(
+                        ruta_estandar, {documento: tablas}, umbral, num_candidatos, errores=fallidos,
+                        diferencias_diferidas=diferencias_diferidas,
+                    ))
+                except Exception as e:
+                    fallidos[documento] = f"{type(e).__name__}: {e}"
+        for documento, mensaje in fallidos.items():
+            errores.append({"Documento": documento, "Etapa": "comparación", "Error": mensaje})
+        for ruta, tablas in grupo.items():
+            documento = nombres[ruta]
+            if documento in por_documento:
+                resultados[documento] = por_documento[documento]
+                if ruta in claves:
+                    guardar_cache(claves[ruta], tablas, por_documento[documento])
+        grupo.clear()
+
+    if pendientes:
+        grupo = {}
+        with ProcessPoolExecutor(max_workers=procesos or os.cpu_count() or 1) as pool:
+            futuros = {pool.submit(_extraer_documento, ruta): ruta for ruta in pendientes}
+            for n, futuro in enumerate(as_completed(futuros), start=1):
+                ruta = futuros[futuro]
+                try:
+                    tablas, error = futuro.result()
+                except Exception as e:  # p. ej. el proceso trabajador terminó abruptamente
+                    tablas, error = None, f"{type(e).__name__}: {e}"
+                print(f"[{n}/{len(pendientes)}] {nombres[ruta]}")
+
+                if error is None and not tablas:
+                    error = "No se encontraron tablas OEI o AEI en el documento."
+                if error is not None:
+                    errores.append({"Documento": nombres[ruta], "Etapa": "extracción", "Error": error})
+                    continue
+
+                grupo[ruta] = tablas
+                if len(grupo) >= tamano_grupo:
+                    comparar_grupo(grupo)
+        if grupo:
+            comparar_grupo(grupo)
+
+    # Mismo orden que la lista de entrada
+    orden = [nombres[r] for r in rutas]
+    resultados = {d: resultados[d] for d in orden if d in resultados}
+    errores.sort(key=lambda e: orden.index(e["Documento"]))
+    return resultados, errores
+
+
+# === LÍNEA DE COMANDOS ===
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m modules.lote",
+        description="Compara todos los PEI (.docx / .pdf) de una carpeta con la matriz estándar."
+    )
+    parser.add_argument("carpeta", help="Carpeta con los documentos PEI")
+    parser.add_argument("-o", "--salida", default="Comparativo_PEIGL_Lote.xlsx",
+                        help="Reporte consolidado (.xlsx o .parquet)")
+    parser.add_argument("--estandar", default=RUTA_ESTANDAR, help="Libro Excel de la matriz estándar")
+    parser.add_argument("--umbral", type=float, default=0.75, help="Similitud mínima para coincidencia parcial")
+    parser.add_argument("--candidatos", type=int, default=1, help="Candidatos del estándar por fila")
+    parser.add_argument("--procesos", type=int, default=None,
+                        help="Procesos para la extracción (por defecto, uno por CPU)")
+    parser.add_argument("--grupo", type=int, default=32,
+                        help="Documentos que se comparan juntos en cada llamada al modelo")
+    parser.add_argument("-r", "--recursivo", action="store_true", help="Incluir subcarpetas")
+    parser.add_argument("--sin-cache", action="store_true", help="No usar la caché de resultados en disco")
+    parser.add_argument("--sin-diferencias", action="store_true",
+                        help="No calcular la columna de diferencias (más rápido en lotes grandes)")
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    rutas = listar_documentos(args.carpeta, args.recursivo)
+    if not rutas:
+        print(f"⚠️ No hay archivos .docx o .pdf en {args.carpeta}")
+        return 1
+    nombres = {r: os.path.relpath(r, args.carpeta) for r in rutas}
+
+    inicio = time.perf_counter()
+    resultados, errores = procesar_lote(
+        rutas, args.estandar, args.umbral, args.candidatos,
+        procesos=args.procesos, tamano_grupo=max(1, args.grupo),
+        usar_cache=not args.sin_cache, nombres=nombres, diferencias_diferidas=args.sin_diferencias,
+    )
+
+    # Las hojas del Excel se escriben documento por documento, sin concatenarlas
+    df_resumen, consolidados = consolidar_lote(resultados, concatenar=False)
+    exportar_lote(args.salida, df_resumen, consolidados, pd.DataFrame(errores, columns=COLUMNAS_ERRORES))
+
+    print(f"✅ {len(resultados)} documento(s) comparados, {len(errores)} con error "
+          f"({time.perf_counter() - inicio:.1f} s) → {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
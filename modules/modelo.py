@@ -0,0 +1,162 @@
+import os
+import threading
+
+import numpy as np
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from modules.trazas import tramo, trazar, anotar
+
+# === CONFIGURACIÓN DEL MODELO ===
+# Todos los parámetros del modelo se definen aquí (y pueden sobrescribirse
+# por variables de entorno en el servidor).
+NOMBRE_MODELO = os.environ.get("PEI_MODELO", "paraphrase-MiniLM-L6-v2")
+DISPOSITIVO = os.environ.get("PEI_DISPOSITIVO") or ("cuda" if torch.cuda.is_available() else "cpu")
+NUM_HILOS = int(os.environ.get("PEI_NUM_HILOS", "0"))  # 0 = valor por defecto de torch
+TAMANO_LOTE = int(os.environ.get("PEI_TAMANO_LOTE", "64"))
+
+# Modo de bajo consumo de memoria (muchas sesiones simultáneas en un contenedor
+# pequeño): se codifica por bloques de TAMANO_BLOQUE textos y las embeddings
+# (también los índices del estándar en disco) se guardan en float16.
+BAJA_MEMORIA = os.environ.get("PEI_BAJA_MEMORIA", "0") != "0"
+TAMANO_BLOQUE = int(os.environ.get("PEI_TAMANO_BLOQUE", "256"))
+TIPO_EMBEDDINGS = np.float16 if BAJA_MEMORIA else np.float32
+
+# Backend de inferencia:
+#   "torch"      PyTorch fp32 (por defecto)
+#   "torch-int8" PyTorch con cuantización dinámica int8 de las capas lineales (solo CPU)
+#   "onnx"       ONNX Runtime (pip install "sentence-transformers[onnx]")
+BACKENDS = ("torch", "torch-int8", "onnx")
+BACKEND = os.environ.get("PEI_BACKEND", "torch")
+
+_modelos = {}
+_candado = threading.Lock()
+_backend_activo = ContextVar("backend_activo", default=None)
+
+
+def backend_actual():
+    return _backend_activo.get() or BACKEND
+
+
+@contextmanager
+def usar_backend(backend):
+    """
+    Dentro del bloque, codificar() y los índices del estándar usan `backend`
+    en lugar del configurado (p. ej. para comparar backends en un mismo proceso).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend desconocido: {backend}. Opciones: {BACKENDS}")
+    token = _backend_activo.set(backend)
+    try:
+        yield
+    finally:
+        _backend_activo.reset(token)
+
+
+def variante_modelo():
+    """
+    Backend y precisión de las embeddings cuando no son los por defecto
+    (torch, float32), p. ej. "onnx" o "torch_fp16"; "" en el caso por defecto.
+    """
+    partes = [backend_actual()]
+    if BAJA_MEMORIA:
+        partes.append("fp16")
+    variante = "_".join(partes)
+    return "" if variante == "torch" else variante
+
+
+def identificador_modelo():
+    """
+    Identifica las embeddings que produce el modelo actual: forma parte de la
+    clave de los índices del estándar y de la caché de resultados.
+    """
+    variante = variante_modelo()
+    return f"{NOMBRE_MODELO}@{variante}" if variante else NOMBRE_MODELO
+
+
+def _cargar_modelo(backend):
+    if NUM_HILOS > 0:
+        torch.set_num_threads(NUM_HILOS)
+
+    if backend == "onnx":
+        try:
+            import onnxruntime  # noqa: F401
+        except ImportError:
+            raise ImportError('Falta instalar ONNX Runtime: pip install "sentence-transformers[onnx]"')
+        return SentenceTransformer(NOMBRE_MODELO, device="cpu", backend="onnx")
+
+    if backend == "torch-int8":
+        modelo = SentenceTransformer(NOMBRE_MODELO, device="cpu")
+        modelo.eval()
+        return torch.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+
+    modelo = SentenceTransformer(NOMBRE_MODELO, device=DISPOSITIVO)
+    modelo.eval()
+    return modelo
+
+
+def obtener_modelo():
+    """
+    Devuelve el modelo SentenceTransformer compartido por todo el proceso para
+    el backend actual. Se carga una sola vez; las sesiones concurrentes de
+    Streamlit reutilizan la misma instancia (la carga está protegida con un candado).
+    """
+    backend = backend_actual()
+    if backend not in _modelos:
+        with _candado:
+            if backend not in _modelos:
+                with tramo("modelo.carga", modelo=NOMBRE_MODELO, backend=backend):
+                    _modelos[backend] = _cargar_modelo(backend)
+    return _modelos[backend]
+
+
+@trazar("modelo.codificar")
+def codificar(textos):
+    """
+    Codifica una lista de textos con el modelo compartido y el tamaño de lote
+    configurado. Devuelve un arreglo numpy de embeddings (TIPO_EMBEDDINGS).
+
+    En modo de baja memoria los textos se codifican por bloques de
+    TAMANO_BLOQUE y cada bloque se copia en float16 al arreglo final, de modo
+    que nunca se tienen en memoria todas las embeddings en float32.
+    """
+    textos = list(textos)
+    anotar(filas=len(textos), backend=backend_actual())
+    modelo = obtener_modelo()
+    with torch.inference_mode():
+        if not BAJA_MEMORIA:
+            return modelo.encode(
+                textos,
+                batch_size=TAMANO_LOTE,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+
+        resultado = None
+        for inicio in range(0, len(textos), TAMANO_BLOQUE):
+            bloque = modelo.encode(
+                textos[inicio:inicio + TAMANO_BLOQUE],
+                batch_size=TAMANO_LOTE,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            if resultado is None:
+                resultado = np.empty((len(textos), bloque.shape[1]), dtype=TIPO_EMBEDDINGS)
+            resultado[inicio:inicio + len(bloque)] = bloque
+            del bloque
+        if resultado is None:
+            dimension = modelo.get_sentence_embedding_dimension() or 0
+            resultado = np.empty((0, dimension), dtype=TIPO_EMBEDDINGS)
+        return resultado
+
+
+def calentar_modelo():
+    """
+    Carga el modelo y ejecuta una codificación de prueba para que la primera
+    comparación real no pague la inicialización.
+    """
+    codificar(["calentamiento del modelo"])
+    return obtener_modelo()
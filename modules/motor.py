@@ -0,0 +1,460 @@
+import gc
+import os
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+import torch
+from sentence_transformers import util
+
+from modules.modelo import codificar, BAJA_MEMORIA, TAMANO_BLOQUE, TIPO_EMBEDDINGS
+from modules.indice_estandar import cargar_hoja_estandar, obtener_embeddings_estandar_lote, filas_por_padre
+from modules import reordenamiento
+from modules.trazas import tramo, trazar, anotar
+
+# Hilos con que iterar_comparaciones ejecuta las comparaciones de un documento
+HILOS_COMPARACION = int(os.environ.get("PEI_HILOS_COMPARACION", "4"))
+
+# Con PEI_PODA_PADRE=0 los trabajos con padre (AEI) buscan siempre en todo el
+# estándar en lugar de solo entre los hijos del elemento emparejado con su padre
+PODAR_POR_PADRE = os.environ.get("PEI_PODA_PADRE", "1") != "0"
+
+
+def emparejar(emb_comparar, emb_estandar, num_candidatos=1):
+    """
+    Calcula la matriz de similitud completa (filas del GL x filas del estándar)
+    en una sola operación y devuelve, para todas las filas a la vez, los
+    `num_candidatos` mejores candidatos: (puntajes, indices), ambos de forma
+    (filas del GL, num_candidatos).
+    Las embeddings en float16 se operan en float32; en modo de baja memoria la
+    matriz de similitud se calcula por bloques de TAMANO_BLOQUE filas del GL.
+    """
+    n = len(emb_comparar)
+    if n == 0 or len(emb_estandar) == 0:
+        return np.zeros((n, 0), dtype=np.float32), np.zeros((n, 0), dtype=np.int64)
+
+    emb_estandar = torch.tensor(np.asarray(emb_estandar, dtype=np.float32))
+    bloque = TAMANO_BLOQUE if BAJA_MEMORIA else n
+    partes = []
+    for inicio in range(0, n, bloque):
+        matriz_sim = util.cos_sim(np.asarray(emb_comparar[inicio:inicio + bloque], dtype=np.float32), emb_estandar)
+        if num_candidatos <= 1:
+            puntajes, indices = matriz_sim.max(dim=1, keepdim=True)
+        else:
+            puntajes, indices = torch.topk(matriz_sim, k=min(num_candidatos, matriz_sim.shape[1]), dim=1)
+        del matriz_sim
+        partes.append((puntajes.cpu().numpy(), indices.cpu().numpy()))
+    if len(partes) == 1:
+        return partes[0]
+    return np.concatenate([p for p, _ in partes]), np.concatenate([i for _, i in partes])
+
+
+def emparejar_por_padre(emb_comparar, emb_estandar, grupos, num_candidatos=1):
+    """
+    Como emparejar, pero cada fila del GL se compara solo con las filas del
+    estándar de su grupo: `grupos` tiene, por fila del GL, un arreglo con las
+    filas candidatas del estándar o None (se busca en todo el estándar).
+    Las filas con menos candidatos que `num_candidatos` se completan con
+    índice -1 y puntaje NaN.
+    """
+    n = len(emb_comparar)
+    k = min(max(num_candidatos, 1), len(emb_estandar))
+    puntajes = np.full((n, k), np.nan, dtype=np.float32)
+    indices = np.full((n, k), -1, dtype=np.int64)
+
+    por_grupo = {}
+    for fila, candidatas in enumerate(grupos):
+        clave = None if candidatas is None else id(candidatas)
+        por_grupo.setdefault(clave, (candidatas, []))[1].append(fila)
+
+    for candidatas, filas in por_grupo.values():
+        filas = np.asarray(filas, dtype=np.int64)
+        if candidatas is None:
+            pts, idx = emparejar(emb_comparar[filas], emb_estandar, k)
+        else:
+            pts, idx = emparejar(emb_comparar[filas], emb_estandar[candidatas], k)
+            idx = candidatas[idx]
+        puntajes[filas, :pts.shape[1]] = pts
+        indices[filas, :idx.shape[1]] = idx
+    return puntajes, indices
+
+
+def formatear_candidatos(codigos_estandar, puntajes, indices):
+    """
+    Texto con los candidatos alternativos de cada fila (del 2.º en adelante),
+    p. ej. "AEI.01.02 (0.812); AEI.03.01 (0.774)".
+    """
+    codigos = np.asarray(codigos_estandar, dtype=object)
+    return [
+        "; ".join(f"{codigos[j]} ({p:.3f})" for j, p in zip(fila_idx[1:], fila_pts[1:]) if j >= 0)
+        for fila_idx, fila_pts in zip(indices, puntajes)
+    ]
+
+
+def _priorizar_exactas(indices, puntajes, fila_exacta, textos_norm, textos_estandar_norm):
+    """
+    Garantiza que la coincidencia exacta sea el primer candidato aunque otra
+    fila del estándar tenga una similitud igual o mayor (modifica los arreglos).
+    """
+    filas = np.flatnonzero(fila_exacta >= 0)
+    textos_estandar = np.asarray(textos_estandar_norm, dtype=object)
+    textos = np.asarray(textos_norm, dtype=object)
+    # Si el mejor candidato ya es un texto idéntico (p. ej. fila repetida), se respeta
+    filas = filas[textos_estandar[indices[filas, 0]] != textos[filas]]
+    for fila in filas:
+        posicion = np.flatnonzero(indices[fila] == fila_exacta[fila])
+        if posicion.size:  # ya estaba entre los candidatos: pasa al primer lugar
+            p = posicion[0]
+            indices[fila, [0, p]] = indices[fila, [p, 0]]
+            puntajes[fila, [0, p]] = puntajes[fila, [p, 0]]
+        else:
+            indices[fila, 0] = fila_exacta[fila]
+            puntajes[fila, 0] = 1.0
+
+
+def _preparar_trabajos(ruta_estandar, trabajos, errores):
+    """
+    Etapas comunes a ejecutar_comparaciones e iterar_comparaciones: resultados
+    vacíos de las tablas no encontradas, preparación de cada trabajo, índices
+    del estándar y coincidencias exactas.
+    Devuelve (orden, resultados, trabajos, padres, preparados, indices_estandar, exactas),
+    donde `padres` es {trabajo: trabajo padre (solo los padres que se ejecutan)
+    o DataFrame de resultados del padre ya calculado}.
+    """
+    orden = list(trabajos)
+    padres = {nombre: t[2] for nombre, t in trabajos.items() if len(t) > 2 and t[2] is not None}
+    trabajos = {nombre: t[:2] for nombre, t in trabajos.items()}
+
+    # Las tablas que no se encontraron en el documento dan un resultado vacío
+    resultados = {
+        nombre: pd.DataFrame(columns=espec["columnas_resultado"])
+        for nombre, (espec, df) in trabajos.items() if df is None
+    }
+    trabajos = {nombre: t for nombre, t in trabajos.items() if t[1] is not None}
+
+    # === PREPARACIÓN (detección de columnas y normalización) ===
+    preparados = {}
+    with tramo("motor.preparacion") as traza:
+        for nombre, (espec, df) in list(trabajos.items()):
+            try:
+                preparados[nombre] = espec["preparar"](df, espec)
+            except Exception as e:
+                if errores is None:
+                    raise
+                errores[nombre] = e
+                del trabajos[nombre]
+                orden.remove(nombre)
+        traza.anotar(filas=sum(len(prep["textos_norm"]) for prep in preparados.values()))
+
+    # Un trabajo cuyo padre no se ejecuta (tabla no encontrada o con error) busca en todo el estándar
+    padres = {
+        hijo: padre for hijo, padre in padres.items()
+        if hijo in trabajos and (isinstance(padre, pd.DataFrame) or padre in trabajos)
+    }
+
+    # === EMBEDDINGS DEL ESTÁNDAR ===
+    solicitudes = [
+        (espec["hoja"], espec["col_estandar_texto"], espec["normalizador"], espec["version_normalizacion"])
+        for espec, _ in trabajos.values()
+    ]
+    indices_estandar = dict(zip(trabajos, obtener_embeddings_estandar_lote(ruta_estandar, solicitudes)))
+
+    # === COINCIDENCIAS EXACTAS (sin pasar por el modelo) ===
+    # Las filas cuyo texto normalizado existe tal cual en el estándar se
+    # emparejan con esa fila; su embedding es la del propio estándar.
+    exactas = {
+        nombre: np.array(
+            [indices_estandar[nombre][2].get(t, -1) for t in prep["textos_norm"]], dtype=np.int64
+        )
+        for nombre, prep in preparados.items()
+    }
+    return orden, resultados, trabajos, padres, preparados, indices_estandar, exactas
+
+
+def padres_emparejados(resultado_padre, codigo_padre):
+    """
+    {código padre del GL: código padre del estándar} según el resultado del
+    trabajo padre (p. ej. "OEI.01" -> "OEI.03"); sin los padres que no coinciden.
+    """
+    padre_estandar = {}
+    for codigo_gl, codigo_est, resultado in zip(
+        resultado_padre["Código del GL"], resultado_padre["Código estándar más similar"],
+        resultado_padre["Resultado"],
+    ):
+        if resultado != "No coincide":
+            padre_estandar.setdefault(codigo_padre(codigo_gl), codigo_padre(codigo_est))
+    return padre_estandar
+
+
+def _grupos_por_padre(ruta_estandar, espec, prep, resultado_padre):
+    """
+    Filas candidatas del estándar para cada fila del GL según el resultado del
+    trabajo padre: el código padre de cada fila del GL (p. ej. su OEI) se
+    traduce al código del estándar con el que se emparejó y se toman las filas
+    del estándar de ese padre. None donde no se puede resolver (padre sin
+    coincidencia o inexistente).
+    """
+    codigo_padre = espec["codigo_padre"]
+    padre_estandar = padres_emparejados(resultado_padre, codigo_padre)
+    filas = filas_por_padre(ruta_estandar, espec["hoja"], espec["col_estandar_codigo"], codigo_padre)
+    return [
+        filas.get(padre_estandar.get(codigo_padre(codigo)))
+        for codigo in prep["df"][prep["col_codigo"]].to_numpy()
+    ]
+
+
+def _resolver_trabajo(ruta_estandar, nombre, espec, prep, indice_estandar, fila_exacta, emb_textos,
+                      umbral, num_candidatos, diferencias_diferidas, resultado_padre=None,
+                      presupuesto=None):
+    """
+    Similitud y tabla de resultados de un trabajo. `emb_textos` son las
+    embeddings de las filas sin coincidencia exacta, en orden (None si no hay).
+    Con `resultado_padre` (y "codigo_padre" en la especificación) cada fila se
+    compara solo con las filas del estándar de su padre (ver _grupos_por_padre);
+    si ninguna alcanza el umbral, la fila se busca en todo el estándar.
+    Con el reordenamiento activo, las filas cercanas al umbral se deciden con
+    el cross-encoder dentro del `presupuesto` del documento (ver
+    modules.reordenamiento).
+    """
+    with tramo("motor.resultado", comparacion=str(nombre)) as traza:
+        textos_estandar_norm, emb_estandar, _ = indice_estandar
+        # La hoja compartida basta: construir no modifica el estándar
+        df_estandar = cargar_hoja_estandar(ruta_estandar, espec["hoja"], copia=False)
+
+        if prep["textos_norm"]:
+            dimension = emb_textos.shape[1] if emb_textos is not None else emb_estandar.shape[1]
+            emb_comparar = np.empty((len(fila_exacta), dimension), dtype=TIPO_EMBEDDINGS)
+            hay_exacta = fila_exacta >= 0
+            emb_comparar[hay_exacta] = emb_estandar[fila_exacta[hay_exacta]]
+            if not hay_exacta.all():
+                emb_comparar[~hay_exacta] = emb_textos
+        else:
+            emb_comparar = np.zeros((0, 0), dtype=TIPO_EMBEDDINGS)
+        # El reordenamiento necesita al menos CANDIDATOS candidatos por fila
+        pedidos = max(num_candidatos, reordenamiento.CANDIDATOS) if reordenamiento.ACTIVO else num_candidatos
+        if PODAR_POR_PADRE and resultado_padre is not None and "codigo_padre" in espec and len(emb_comparar):
+            grupos = _grupos_por_padre(ruta_estandar, espec, prep, resultado_padre)
+            puntajes, indices = emparejar_por_padre(emb_comparar, emb_estandar, grupos, pedidos)
+            # Sin ningún candidato del padre que alcance el umbral, se busca en todo el estándar
+            reintentar = np.flatnonzero(
+                np.array([g is not None for g in grupos]) & ~(puntajes[:, 0] >= umbral)
+            )
+            if reintentar.size:
+                puntajes[reintentar], indices[reintentar] = emparejar(emb_comparar[reintentar], emb_estandar, pedidos)
+            traza.anotar(candidatos_por_fila=round(float(np.mean([
+                len(emb_estandar) if g is None else len(g) for g in grupos
+            ])), 1), busqueda_global=int(reintentar.size))
+        else:
+            puntajes, indices = emparejar(emb_comparar, emb_estandar, pedidos)
+
+        if indices.size:
+            _priorizar_exactas(indices, puntajes, fila_exacta, prep["textos_norm"], textos_estandar_norm)
+        if reordenamiento.ACTIVO and indices.size:
+            with tramo("motor.reordenar") as traza_reorden:
+                traza_reorden.anotar(**reordenamiento.reordenar(
+                    puntajes, indices, fila_exacta, prep["textos_norm"], textos_estandar_norm, umbral, presupuesto
+                ))
+            puntajes, indices = puntajes[:, :max(num_candidatos, 1)], indices[:, :max(num_candidatos, 1)]
+
+        resultado = espec["construir"](
+            prep, espec, df_estandar, textos_estandar_norm, puntajes, indices, umbral,
+            diferencias_diferidas=diferencias_diferidas,
+        )
+        traza.anotar(filas=len(resultado))
+        return resultado
+
+
+def _resultado_padre(padres, resultados, nombre):
+    # Resultado ya calculado del padre de un trabajo (None si no tiene padre o
+    # si el padre falló: entonces se busca en todo el estándar)
+    padre = padres.get(nombre)
+    if padre is None or isinstance(padre, pd.DataFrame):
+        return padre
+    return resultados.get(padre)
+
+
+def _presupuesto_documento(presupuestos, nombre):
+    # Un presupuesto de reordenamiento por documento: en los lotes los trabajos
+    # se llaman (documento, comparación); si no, todo es un mismo documento
+    documento = nombre[0] if isinstance(nombre, tuple) else None
+    if documento not in presupuestos:
+        presupuestos[documento] = reordenamiento.Presupuesto()
+    return presupuestos[documento]
+
+
+@trazar("motor.comparaciones")
+def ejecutar_comparaciones(ruta_estandar, trabajos, umbral=0.75, num_candidatos=1, errores=None,
+                           diferencias_diferidas=False):
+    """
+    Motor común de comparación.
+
+    `trabajos` es un diccionario {nombre: (especificacion, df)}, donde la
+    especificación (definida en compare_oei / compare_aei) indica la hoja y
+    columnas del estándar y las funciones `preparar` y `construir`.
+
+    Las filas del GL cuyo texto normalizado aparece tal cual en el estándar se
+    emparejan directamente con esa fila (sin pasar por el modelo). El resto de
+    textos se deduplican y se codifican en una sola llamada al modelo; las
+    embeddings del estándar se obtienen del índice en disco (las que falten
+    también se codifican en una sola llamada).
+    Con `num_candidatos` > 1 se agrega una columna con los candidatos
+    alternativos y sus similitudes.
+    Un trabajo puede ser (especificacion, df, padre), donde `padre` es el
+    nombre de otro trabajo (p. ej. AEI -> comparación de OEI): se resuelve
+    después del padre y cada fila se busca solo entre las filas del estándar
+    que cuelgan del elemento con que se emparejó su padre. `padre` también
+    puede ser el DataFrame de resultados del padre ya calculado.
+    Si se pasa un diccionario `errores`, los trabajos que fallan (en la
+    preparación, p. ej. columnas no reconocidas, o al emparejar y armar su
+    resultado) se registran en él como {nombre: excepción} y se omiten del
+    resultado en lugar de interrumpir todo el lote.
+    Con diferencias_diferidas=True la columna de diferencias queda vacía y se
+    calcula después, solo para las filas que se revisan (ver modules.diferencias).
+    Las embeddings y tablas intermedias de cada comparación se liberan al
+    terminarla (en modo de baja memoria también se fuerza la recolección).
+    Devuelve {nombre: DataFrame de resultados} (sin estilos).
+    """
+    orden, resultados, trabajos, padres, preparados, indices_estandar, exactas = _preparar_trabajos(
+        ruta_estandar, trabajos, errores
+    )
+
+    # === EMBEDDINGS DEL GL (una sola llamada, textos sin repetir) ===
+    unicos = list(dict.fromkeys(
+        t for nombre, prep in preparados.items()
+        for t, e in zip(prep["textos_norm"], exactas[nombre]) if e < 0
+    ))
+    posicion = {t: i for i, t in enumerate(unicos)}
+    emb_unicos = codificar(unicos) if unicos else None
+    anotar(
+        filas=sum(len(prep["textos_norm"]) for prep in preparados.values()),
+        exactas=int(sum((e >= 0).sum() for e in exactas.values())),
+        codificadas=len(unicos),
+    )
+
+    # === SIMILITUD Y RESULTADOS === (los padres antes que sus hijos; un solo nivel)
+    presupuestos = {}
+    for nombre in sorted(trabajos, key=lambda nombre: nombre in padres):
+        espec = trabajos[nombre][0]
+        prep = preparados.pop(nombre)
+        pendientes = [posicion[t] for t, e in zip(prep["textos_norm"], exactas[nombre]) if e < 0]
+        try:
+            resultados[nombre] = _resolver_trabajo(
+                ruta_estandar, nombre, espec, prep, indices_estandar[nombre], exactas[nombre],
+                emb_unicos[pendientes] if pendientes else None,
+                umbral, num_candidatos, diferencias_diferidas,
+                resultado_padre=_resultado_padre(padres, resultados, nombre),
+                presupuesto=_presupuesto_documento(presupuestos, nombre),
+            )
+        except Exception as e:
+            if errores is None:
+                raise
+            errores[nombre] = e
+            orden.remove(nombre)
+
+    del emb_unicos, indices_estandar
+    if BAJA_MEMORIA:
+        gc.collect()
+    return {nombre: resultados[nombre] for nombre in orden}
+
+
+def _codificar_y_resolver(ruta_estandar, nombre, espec, prep, indice_estandar, fila_exacta,
+                          umbral, num_candidatos, diferencias_diferidas, resultado_padre=None,
+                          presupuesto=None):
+    # Un trabajo completo en un hilo: codifica solo sus propios textos
+    unicos = list(dict.fromkeys(t for t, e in zip(prep["textos_norm"], fila_exacta) if e < 0))
+    emb_textos = None
+    if unicos:
+        posicion = {t: i for i, t in enumerate(unicos)}
+        emb_textos = codificar(unicos)[[posicion[t] for t, e in zip(prep["textos_norm"], fila_exacta) if e < 0]]
+    return _resolver_trabajo(
+        ruta_estandar, nombre, espec, prep, indice_estandar, fila_exacta, emb_textos,
+        umbral, num_candidatos, diferencias_diferidas, resultado_padre, presupuesto,
+    )
+
+
+def iterar_comparaciones(ruta_estandar, trabajos, umbral=0.75, num_candidatos=1, errores=None,
+                         diferencias_diferidas=False, hilos=HILOS_COMPARACION):
+    """
+    Igual que ejecutar_comparaciones, pero cada trabajo (codificación de sus
+    textos, similitud y tabla de resultados) se ejecuta en un pool de `hilos`
+    hilos (torch libera el GIL al codificar) y los resultados se entregan a
+    medida que terminan: generador de (nombre, DataFrame de resultados).
+    Los trabajos más pequeños se envían primero y los trabajos con padre, en
+    cuanto termina su padre. Las tablas no encontradas (resultado vacío) se
+    entregan de inmediato.
+    A diferencia de ejecutar_comparaciones, los textos no se deduplican entre
+    trabajos (cada uno llama al modelo por separado).
+    """
+    orden, resultados, trabajos, padres, preparados, indices_estandar, exactas = _preparar_trabajos(
+        ruta_estandar, trabajos, errores
+    )
+    for nombre in orden:
+        if nombre in resultados:
+            yield nombre, resultados[nombre]
+
+    hijos = {}
+    for hijo, padre in padres.items():
+        if not isinstance(padre, pd.DataFrame):
+            hijos.setdefault(padre, []).append(hijo)
+
+    presupuestos = {}
+    with ThreadPoolExecutor(max_workers=max(1, hilos)) as pool:
+        futuros = {}
+
+        def enviar(nombre, resultado_padre=None):
+            # Cada hilo corre en una copia del contexto (backend activo, trazas en curso)
+            futuro = pool.submit(
+                copy_context().run, _codificar_y_resolver,
+                ruta_estandar, nombre, trabajos[nombre][0], preparados[nombre], indices_estandar[nombre],
+                exactas[nombre], umbral, num_candidatos, diferencias_diferidas, resultado_padre,
+                _presupuesto_documento(presupuestos, nombre),
+            )
+            futuros[futuro] = nombre
+
+        for nombre in sorted(trabajos, key=lambda nombre: int((exactas[nombre] < 0).sum())):
+            if nombre not in padres:
+                enviar(nombre)
+            elif isinstance(padres[nombre], pd.DataFrame):
+                enviar(nombre, padres[nombre])
+        try:
+            while futuros:
+                terminados, _ = wait(futuros, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    nombre = futuros.pop(futuro)
+                    try:
+                        resultado = futuro.result()
+                    except Exception as e:
+                        if errores is None:
+                            raise
+                        errores[nombre] = e
+                        for hijo in hijos.get(nombre, []):
+                            enviar(hijo)  # sin el resultado del padre: todo el estándar
+                        continue
+                    for hijo in hijos.get(nombre, []):
+                        enviar(hijo, resultado)
+                    yield nombre, resultado
+        finally:
+            # Si se deja de consumir el generador, no se inician los trabajos pendientes
+            for futuro in futuros:
+                futuro.cancel()
+
+
+# === COLOR VISUAL ===
+def color_fila(row):
+    if row["Resultado"] == "Coincidencia exacta":
+        color = "background-color: lightgreen"
+    elif row["Resultado"] == "Coincidencia parcial":
+        color = "background-color: khaki"
+    else:
+        color = "background-color: lightcoral"
+    return [color] * len(row)
+
+
+def estilizar_resultado(df_resultado):
+    """
+    Aplica los colores por fila según la columna "Resultado".
+    """
+    if not isinstance(df_resultado, pd.DataFrame):
+        return df_resultado  # ya estilizado
+    return df_resultado.style.apply(color_fila, axis=1)
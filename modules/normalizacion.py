@@ -0,0 +1,70 @@
+import unicodedata
+from functools import lru_cache
+
+import pandas as pd
+
+# Forma parte de la versión de normalización de cada comparación: cambiarla
+# invalida las embeddings del estándar guardadas en disco
+VERSION = "1"
+
+# Signos que se eliminan antes de comparar
+PUNTUACION = ".,;:!?¿¡()\"'”“‘’-–—"
+
+
+def _crear_tabla():
+    """
+    Tabla de str.translate: letras con tilde/diéresis/virgulilla -> letra base
+    y signos de puntuación -> eliminados.
+    """
+    tabla = {ord(c): None for c in PUNTUACION}
+    for codigo in range(0xC0, 0x250):  # Latín-1 y Latín extendido
+        base = unicodedata.normalize("NFD", chr(codigo)).encode("ascii", "ignore").decode("ascii")
+        if base and base != chr(codigo):
+            tabla[codigo] = base
+    return tabla
+
+
+_TABLA = _crear_tabla()
+
+
+# === NORMALIZACIÓN DE UN TEXTO ===
+@lru_cache(maxsize=65536)
+def _normalizar_cadena(texto):
+    texto = texto.lower().translate(_TABLA)
+    if not texto.isascii():
+        # Caracteres fuera de la tabla (símbolos, otras escrituras)
+        texto = unicodedata.normalize("NFD", texto).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.split())
+
+
+def normalizar_texto(texto):
+    """
+    Texto en minúsculas, sin tildes, sin puntuación y con espacios simples.
+    Los valores vacíos (None / NaN) devuelven "". Memoizado: los textos
+    repetidos se normalizan una sola vez.
+    """
+    if texto is None or (not isinstance(texto, str) and pd.isna(texto)):
+        return ""
+    return _normalizar_cadena(str(texto))
+
+
+# === NORMALIZACIÓN DE UNA COLUMNA ===
+def normalizar_serie(serie):
+    """
+    Versión vectorizada de normalizar_texto para una columna completa: cada
+    valor distinto se normaliza una sola vez con operaciones de cadena de pandas.
+    Devuelve una Serie de textos con el mismo índice.
+    """
+    serie = pd.Series(serie, dtype=object)
+    codigos, unicos = pd.factorize(serie.where(serie.notna(), "").astype(str))
+    if not len(unicos):
+        return pd.Series([], index=serie.index, dtype=object)
+
+    unicos = pd.Series(unicos, dtype=object).str.lower().str.translate(_TABLA)
+    no_ascii = ~unicos.map(str.isascii).astype(bool)
+    if no_ascii.any():
+        unicos[no_ascii] = (
+            unicos[no_ascii].str.normalize("NFD").str.encode("ascii", "ignore").str.decode("ascii")
+        )
+    unicos = unicos.str.split().str.join(" ")
+    return pd.Series(unicos.to_numpy()[codigos], index=serie.index, dtype=object)
@@ -0,0 +1,158 @@
+"""
+Chequeo de paridad entre backends de inferencia.
+
+Genera variantes de los textos del libro estándar (originales y con palabras
+omitidas, intercambiadas, truncadas o mezcladas con otra fila), ejecuta las
+cuatro comparaciones con el backend de referencia y con el backend candidato,
+y reporta con qué frecuencia cambia la etiqueta "Resultado" (y el código
+estándar elegido).
+
+Uso:
+    python -m modules.paridad_backend [--referencia torch] [--candidato torch-int8]
+                                      [--tolerancia 0.02] [--json salida.json]
+"""
+import sys
+import json
+import time
+import random
+import argparse
+
+import pandas as pd
+
+from modules.modelo import BACKENDS, usar_backend
+from modules.motor import ejecutar_comparaciones
+from modules.comparador import COMPARACIONES
+from modules.indice_estandar import cargar_hoja_estandar
+
+RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+
+
+# === DATOS DE PRUEBA ===
+def variantes_texto(texto, otro, azar):
+    """
+    Variantes de un texto del estándar que cubren las tres etiquetas:
+    el original (exacta) y perturbaciones de distinta intensidad.
+    """
+    palabras = str(texto).split()
+    variantes = {"original": str(texto)}
+    if len(palabras) > 3:
+        i = azar.randrange(len(palabras))
+        variantes["sin_palabra"] = " ".join(palabras[:i] + palabras[i + 1:])
+        j = azar.randrange(len(palabras) - 1)
+        intercambio = palabras[:]
+        intercambio[j], intercambio[j + 1] = intercambio[j + 1], intercambio[j]
+        variantes["intercambio"] = " ".join(intercambio)
+        variantes["truncado"] = " ".join(palabras[:max(2, int(len(palabras) * 0.6))])
+    otras = str(otro).split()
+    variantes["mezcla"] = " ".join(palabras[:len(palabras) // 2] + otras[len(otras) // 2:])
+    return variantes
+
+
+def construir_trabajos(ruta_estandar=RUTA_ESTANDAR, semilla=0):
+    """
+    Una tabla sintética del GL por comparación, armada a partir de la hoja
+    y columna del estándar que usa cada especificación.
+    """
+    azar = random.Random(semilla)
+    trabajos = {}
+    for nombre, (_, espec) in COMPARACIONES.items():
+        df_estandar = cargar_hoja_estandar(ruta_estandar, espec["hoja"])
+        textos = df_estandar[espec["col_estandar_texto"]].astype(str).tolist()
+        codigos = df_estandar[espec["col_estandar_codigo"]].astype(str).tolist()
+        filas = []
+        for n, (codigo, texto) in enumerate(zip(codigos, textos)):
+            otro = textos[(n + 1) % len(textos)]
+            for tipo, variante in variantes_texto(texto, otro, azar).items():
+                filas.append({"Código": codigo, "Texto": variante, "Variante": tipo})
+        df = pd.DataFrame(filas).rename(columns={
+            "Código": espec["opciones_codigo"][0], "Texto": espec["opciones_texto"][0]
+        })
+        trabajos[nombre] = (espec, df)
+    return trabajos
+
+
+# === PARIDAD ===
+def ejecutar_con_backend(backend, ruta_estandar, trabajos, umbral):
+    """
+    Devuelve (resultados, segundos). La primera ejecución construye el índice
+    del estándar para el backend; solo se mide la segunda.
+    """
+    with usar_backend(backend):
+        ejecutar_comparaciones(ruta_estandar, trabajos, umbral)
+        inicio = time.perf_counter()
+        resultados = ejecutar_comparaciones(ruta_estandar, trabajos, umbral)
+        return resultados, time.perf_counter() - inicio
+
+
+def comparar_backends(referencia="torch", candidato="torch-int8", ruta_estandar=RUTA_ESTANDAR,
+                      umbral=0.75, semilla=0):
+    """
+    Devuelve (df_paridad, tiempos): una fila por comparación con el número y
+    porcentaje de filas cuya etiqueta o código estándar cambia, y los segundos
+    de cada backend.
+    """
+    trabajos = construir_trabajos(ruta_estandar, semilla)
+    res_ref, t_ref = ejecutar_con_backend(referencia, ruta_estandar, trabajos, umbral)
+    res_cand, t_cand = ejecutar_con_backend(candidato, ruta_estandar, trabajos, umbral)
+
+    filas = []
+    for nombre in trabajos:
+        a, b = res_ref[nombre], res_cand[nombre]
+        total = len(a)
+        cambio_resultado = (a["Resultado"] != b["Resultado"]).sum()
+        cambio_codigo = (a["Código estándar más similar"] != b["Código estándar más similar"]).sum()
+        transiciones = (a["Resultado"] + " → " + b["Resultado"])[a["Resultado"] != b["Resultado"]]
+        filas.append({
+            "Comparación": nombre,
+            "Filas": total,
+            "Cambios de resultado": int(cambio_resultado),
+            "% Cambios de resultado": round(cambio_resultado / total * 100, 2) if total else 0,
+            "Cambios de código": int(cambio_codigo),
+            "% Cambios de código": round(cambio_codigo / total * 100, 2) if total else 0,
+            "Transiciones": "; ".join(f"{t} ({c})" for t, c in transiciones.value_counts().items()),
+        })
+    return pd.DataFrame(filas), {referencia: round(t_ref, 3), candidato: round(t_cand, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m modules.paridad_backend",
+                                     description="Paridad de etiquetas entre backends de inferencia")
+    parser.add_argument("--referencia", default="torch", choices=BACKENDS)
+    parser.add_argument("--candidato", default="torch-int8", choices=BACKENDS)
+    parser.add_argument("--estandar", default=RUTA_ESTANDAR, help="Libro Excel de la matriz estándar")
+    parser.add_argument("--umbral", type=float, default=0.75)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--tolerancia", type=float, default=None,
+                        help="Fracción máxima de etiquetas cambiadas; si se supera, termina con código 1")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo JSON")
+    args = parser.parse_args(argv)
+
+    df_paridad, tiempos = comparar_backends(
+        args.referencia, args.candidato, args.estandar, args.umbral, args.semilla
+    )
+    total = int(df_paridad["Filas"].sum())
+    cambios = int(df_paridad["Cambios de resultado"].sum())
+    tasa = cambios / total if total else 0.0
+
+    print(df_paridad.to_string(index=False))
+    print(f"\nTiempo de comparación: " + ", ".join(f"{b} {s:.3f} s" for b, s in tiempos.items()))
+    print(f"Etiquetas cambiadas: {cambios}/{total} ({tasa:.2%})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "referencia": args.referencia,
+                "candidato": args.candidato,
+                "tiempos": tiempos,
+                "tasa_cambio_resultado": tasa,
+                "comparaciones": df_paridad.to_dict(orient="records"),
+            }, f, ensure_ascii=False, indent=2)
+
+    if args.tolerancia is not None and tasa > args.tolerancia:
+        print(f"⚠️ La tasa de cambio supera la tolerancia ({args.tolerancia:.2%})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
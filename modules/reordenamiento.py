@@ -0,0 +1,184 @@
+"""
+Segunda etapa opcional: reordenamiento con un cross-encoder local de las filas
+cuya mejor similitud (bi-encoder) cae en una banda alrededor del umbral.
+
+Para cada fila ambigua se puntúan con el cross-encoder solo sus mejores
+CANDIDATOS candidatos; el mejor según el cross-encoder pasa al primer lugar y
+su probabilidad decide si la fila queda por encima o por debajo del umbral.
+El costo es proporcional al número de filas ambiguas (no al tamaño de la
+tabla) y está acotado por documento con un presupuesto de tiempo y de pares:
+cada lote se dimensiona con el tiempo por par medido en los anteriores para
+no pasarse del tiempo que queda.
+
+Se activa con PEI_REORDENAR=1 (requiere el modelo PEI_MODELO_CRUZADO). Si el
+modelo no se puede cargar (p. ej. sin conexión para descargarlo), se avisa y
+se conserva el orden del bi-encoder.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+from sentence_transformers import CrossEncoder
+
+from modules.modelo import DISPOSITIVO
+from modules.trazas import tramo
+
+# === CONFIGURACIÓN ===
+ACTIVO = os.environ.get("PEI_REORDENAR", "0") != "0"
+MODELO_CRUZADO = os.environ.get("PEI_MODELO_CRUZADO", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+BANDA = float(os.environ.get("PEI_BANDA_REORDEN", "0.05"))  # ± alrededor del umbral
+CANDIDATOS = int(os.environ.get("PEI_CANDIDATOS_REORDEN", "3"))  # candidatos por fila ambigua
+UMBRAL_CRUZADO = float(os.environ.get("PEI_UMBRAL_CRUZADO", "0.5"))  # probabilidad mínima de coincidencia
+PRESUPUESTO_SEGUNDOS = float(os.environ.get("PEI_PRESUPUESTO_REORDEN_S", "2.0"))  # por documento
+MAX_PARES = int(os.environ.get("PEI_MAX_PARES_REORDEN", "300"))  # por documento
+TAMANO_LOTE = 16
+
+_modelo = None
+_error_carga = None  # motivo por el que no se pudo cargar el cross-encoder
+_candado = threading.Lock()
+
+
+def identificador():
+    """
+    Configuración del reordenamiento que afecta a los resultados ("" si está
+    desactivado o si el cross-encoder no se pudo cargar); forma parte de la
+    clave de la caché de resultados.
+    """
+    if not ACTIVO or _error_carga is not None:
+        return ""
+    return f"{MODELO_CRUZADO}|{BANDA}|{CANDIDATOS}|{UMBRAL_CRUZADO}"
+
+
+def obtener_modelo_cruzado():
+    """
+    Cross-encoder compartido por todo el proceso (se carga una sola vez).
+    Devuelve None si no se pudo cargar; no se vuelve a intentar.
+    """
+    global _modelo, _error_carga
+    if _modelo is None and _error_carga is None:
+        with _candado:
+            if _modelo is None and _error_carga is None:
+                with tramo("reordenamiento.carga", modelo=MODELO_CRUZADO) as traza:
+                    try:
+                        _modelo = CrossEncoder(MODELO_CRUZADO, device=DISPOSITIVO, num_labels=1)
+                    except Exception as e:
+                        _error_carga = f"{type(e).__name__}: {e}"
+                        traza.anotar(error=_error_carga)
+                        print(f"⚠️ No se pudo cargar el cross-encoder {MODELO_CRUZADO}; "
+                              f"se conserva el orden del bi-encoder. {_error_carga}")
+    return _modelo
+
+
+class Presupuesto:
+    """
+    Tiempo de cross-encoder y pares puntuados que le quedan a un documento.
+    Se comparte entre las comparaciones del documento (también entre hilos).
+    """
+
+    def __init__(self, segundos=PRESUPUESTO_SEGUNDOS, pares=MAX_PARES):
+        self.segundos = segundos
+        self.pares = pares
+        self.segundos_por_par = None  # medido en el último lote
+        self._candado = threading.Lock()
+
+    def reservar(self, pares):
+        """
+        Reserva hasta `pares` pares; devuelve cuántos se pueden puntuar (0 si
+        se agotó el tiempo o el límite de pares). Antes del primer lote se
+        concede como mucho una fila (CANDIDATOS pares) para medir el tiempo por
+        par; después, solo los que caben en el tiempo restante.
+        """
+        with self._candado:
+            if self.segundos <= 0:
+                return 0
+            if self.segundos_por_par is None:
+                limite = CANDIDATOS
+            else:
+                limite = int(self.segundos / max(self.segundos_por_par, 1e-9))
+            concedidos = min(pares, self.pares, limite)
+            self.pares -= concedidos
+            return concedidos
+
+    def consumir(self, segundos, pares_sin_usar=0, pares_puntuados=0):
+        """
+        Descuenta el tiempo usado, devuelve los pares reservados que no se
+        puntuaron y actualiza el tiempo por par.
+        """
+        with self._candado:
+            self.segundos -= segundos
+            self.pares += pares_sin_usar
+            if pares_puntuados:
+                self.segundos_por_par = segundos / pares_puntuados
+
+
+def filas_ambiguas(puntajes, fila_exacta, umbral, banda=BANDA):
+    """
+    Filas sin coincidencia exacta cuya mejor similitud está a `banda` o menos
+    del umbral, de la más cercana al umbral a la más lejana.
+    """
+    distancia = np.abs(puntajes[:, 0] - umbral)
+    filas = np.flatnonzero((fila_exacta < 0) & (distancia <= banda))
+    return filas[np.argsort(distancia[filas], kind="stable")]
+
+
+def reordenar(puntajes, indices, fila_exacta, textos_norm, textos_estandar_norm, umbral, presupuesto=None):
+    """
+    Reordena con el cross-encoder los candidatos de las filas ambiguas
+    (modifica los arreglos): el candidato con mayor probabilidad pasa al
+    primer lugar y su puntaje se lleva al umbral o justo por debajo según
+    supere o no UMBRAL_CRUZADO. Los demás candidatos conservan su similitud.
+    Devuelve {"ambiguas", "reordenadas", "pares"} (y "sin_modelo" si el
+    cross-encoder no se pudo cargar: entonces no se modifica nada).
+    """
+    presupuesto = presupuesto or Presupuesto()
+    ambiguas = filas_ambiguas(puntajes, fila_exacta, umbral)
+    estadisticas = {"ambiguas": len(ambiguas), "reordenadas": 0, "pares": 0}
+    if not len(ambiguas):
+        return estadisticas
+    modelo = obtener_modelo_cruzado()  # la carga no cuenta para el presupuesto
+    if modelo is None:
+        estadisticas["sin_modelo"] = True
+        return estadisticas
+
+    pendientes = list(ambiguas)
+    while pendientes:
+        # Lote de filas completas (todas sus candidatas) de hasta TAMANO_LOTE pares
+        lote, pares = [], []
+        while pendientes:
+            fila = pendientes[0]
+            candidatas = indices[fila, :CANDIDATOS]
+            candidatas = candidatas[candidatas >= 0]
+            if lote and len(pares) + len(candidatas) > TAMANO_LOTE:
+                break
+            pendientes.pop(0)
+            lote.append((fila, candidatas))
+            pares.extend((textos_norm[fila], textos_estandar_norm[c]) for c in candidatas)
+
+        concedidos = presupuesto.reservar(len(pares))
+        while lote and sum(len(c) for _, c in lote) > concedidos:
+            pendientes.insert(0, lote.pop()[0])  # filas completas que no entran en este lote
+        pares = pares[:sum(len(c) for _, c in lote)]
+        if not pares:
+            presupuesto.consumir(0, concedidos)
+            break
+
+        inicio = time.perf_counter()
+        probabilidades = np.asarray(modelo.predict(pares, batch_size=TAMANO_LOTE, show_progress_bar=False))
+        presupuesto.consumir(time.perf_counter() - inicio, concedidos - len(pares), len(pares))
+        estadisticas["pares"] += len(pares)
+
+        desde = 0
+        for fila, candidatas in lote:
+            prob = probabilidades[desde:desde + len(candidatas)]
+            desde += len(candidatas)
+            orden = np.argsort(-prob, kind="stable")
+            n = len(candidatas)
+            indices[fila, :n] = indices[fila, :n][orden]
+            puntajes[fila, :n] = puntajes[fila, :n][orden]
+            if prob[orden[0]] >= UMBRAL_CRUZADO:
+                puntajes[fila, 0] = max(puntajes[fila, 0], umbral)
+            else:
+                puntajes[fila, 0] = min(puntajes[fila, 0], np.nextafter(np.float32(umbral), np.float32(0)))
+            estadisticas["reordenadas"] += 1
+    return estadisticas
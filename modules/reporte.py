@@ -0,0 +1,226 @@
+from io import BytesIO
+
+import pandas as pd
+
+try:
+    import xlsxwriter  # Escritura de Excel en streaming (constant_memory)
+except ImportError:
+    xlsxwriter = None
+
+# Mismos colores que motor.color_fila (lightgreen, khaki, lightcoral)
+COLORES_RESULTADO = {
+    "Coincidencia exacta": "#90EE90",
+    "Coincidencia parcial": "#F0E68C",
+    "No coincide": "#F08080",
+}
+COLUMNAS_ANCHAS = ("Elemento del GL", "Elemento estándar más similar", "Diferencias",
+                   "Diferencias detectadas", "Otros candidatos (similitud)", "Error",
+                   "Elemento anterior", "Elemento actual")
+
+
+# === ESTADÍSTICAS ===
+def calcular_estadisticas(df):
+    if df is not None and not isinstance(df, pd.DataFrame):
+        df = df.data  # Styler
+    total = 0 if df is None else len(df)
+    if not total:
+        return {"Total": 0, "Exactas": 0, "Parciales": 0, "No coincide": 0,
+                "% Exactas": 0, "% Parciales": 0, "% No coincide": 0}
+    exactas = (df["Resultado"] == "Coincidencia exacta").sum()
+    parciales = (df["Resultado"] == "Coincidencia parcial").sum()
+    no_coincide = (df["Resultado"] == "No coincide").sum()
+    return {
+        "Total": total,
+        "Exactas": exactas,
+        "Parciales": parciales,
+        "No coincide": no_coincide,
+        "% Exactas": round(exactas / total * 100, 1) if total else 0,
+        "% Parciales": round(parciales / total * 100, 1) if total else 0,
+        "% No coincide": round(no_coincide / total * 100, 1) if total else 0,
+    }
+
+
+def resumen_resultados(resultados):
+    """
+    Una fila de estadísticas por comparación.
+    """
+    return pd.DataFrame([
+        {"Comparación": nombre, **calcular_estadisticas(df)}
+        for nombre, df in resultados.items()
+    ])
+
+
+# === EXPORTACIÓN ===
+def nombre_hoja(nombre):
+    # Excel limita los nombres de hoja a 31 caracteres
+    return nombre.replace(" ", "_")[:31]
+
+
+def _columna_excel(n):
+    # 0 -> "A", 27 -> "AB"
+    letras = ""
+    n += 1
+    while n:
+        n, resto = divmod(n - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _escribir_hoja(libro, nombre, partes, formatos):
+    """
+    Escribe en una hoja nueva los DataFrames de `partes` (iterable, mismas
+    columnas), uno a continuación de otro y fila por fila (modo constant_memory:
+    cada fila se vuelca a disco al pasar a la siguiente).
+    Si hay columna "Resultado", los colores se aplican con una regla de formato
+    condicional por categoría para toda la hoja, no con estilos por celda.
+    """
+    hoja = libro.add_worksheet(nombre_hoja(nombre))
+    columnas = None
+    fila = 0
+    for df in partes:
+        if not isinstance(df, pd.DataFrame):
+            df = df.data  # Styler
+        if columnas is None:
+            columnas = list(df.columns)
+            for j, columna in enumerate(columnas):
+                ancho = 60 if columna in COLUMNAS_ANCHAS else max(12, len(str(columna)) + 2)
+                hoja.set_column(j, j, ancho, formatos["texto"] if ancho == 60 else None)
+            hoja.write_row(0, 0, [str(c) for c in columnas], formatos["encabezado"])
+        if list(df.columns) != columnas:
+            df = df.reindex(columns=columnas)
+        valores = df.to_numpy(dtype=object, copy=True)
+        valores[pd.isna(valores)] = None
+        for registro in valores.tolist():
+            fila += 1
+            hoja.write_row(fila, 0, registro)
+
+    if columnas is None:
+        return
+    hoja.freeze_panes(1, 0)
+    hoja.autofilter(0, 0, fila, len(columnas) - 1)
+    if "Resultado" in columnas and fila:
+        letra = _columna_excel(columnas.index("Resultado"))
+        for categoria, formato in formatos["resultado"].items():
+            hoja.conditional_format(1, 0, fila, len(columnas) - 1, {
+                "type": "formula",
+                "criteria": f'=${letra}2="{categoria}"',
+                "format": formato,
+            })
+
+
+def escribir_excel(destino, hojas):
+    """
+    Escribe un libro Excel con xlsxwriter en modo constant_memory.
+    `destino` es una ruta o un archivo binario (p. ej. BytesIO) y `hojas` es
+    {nombre de hoja: DataFrame o iterable de DataFrames con las mismas columnas}.
+    """
+    if xlsxwriter is None:
+        raise ImportError("Falta instalar xlsxwriter: pip install xlsxwriter")
+    libro = xlsxwriter.Workbook(destino, {
+        "constant_memory": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        "strings_to_numbers": False,
+        "nan_inf_to_errors": True,
+    })
+    try:
+        formatos = {
+            "encabezado": libro.add_format({"bold": True, "text_wrap": True, "valign": "top", "border": 1}),
+            "texto": libro.add_format({"text_wrap": True, "valign": "top"}),
+            "resultado": {
+                categoria: libro.add_format({"bg_color": color})
+                for categoria, color in COLORES_RESULTADO.items()
+            },
+        }
+        for nombre, partes in hojas.items():
+            if isinstance(partes, pd.DataFrame) or hasattr(partes, "data"):
+                partes = [partes]
+            _escribir_hoja(libro, nombre, partes, formatos)
+    finally:
+        libro.close()
+
+
+def exportar_excel(df_resumen, resultados, df_cambios=None):
+    """
+    Excel consolidado de un documento: hoja "Resumen" y una hoja por comparación,
+    con los colores de la columna "Resultado" (y la hoja "Cambios" con los
+    cambios respecto de la versión anterior, si se pasa).
+    Devuelve el contenido del archivo (bytes).
+    """
+    hojas = {"Resumen": df_resumen, **resultados}
+    if df_cambios is not None:
+        hojas["Cambios"] = df_cambios
+    output = BytesIO()
+    escribir_excel(output, hojas)
+    return output.getvalue()
+
+
+def _partes_comparacion(resultados_lote, nombre):
+    # Resultados de una comparación, documento por documento, con la columna "Documento" al inicio
+    for documento, resultados in resultados_lote.items():
+        if nombre in resultados:
+            df = resultados[nombre].copy(deep=False)
+            df.insert(0, "Documento", documento)
+            yield df
+
+
+def consolidar_lote(resultados_lote, concatenar=True):
+    """
+    A partir de {documento: {comparación: DataFrame}} arma:
+      - el resumen con una fila por documento y comparación
+      - {comparación: DataFrame con los resultados de todos los documentos},
+        con la columna "Documento" al inicio.
+    Con concatenar=False cada comparación es un generador de DataFrames (uno
+    por documento) que exportar_lote escribe sin unirlos en memoria.
+    """
+    df_resumen = pd.DataFrame([
+        {"Documento": documento, "Comparación": nombre, **calcular_estadisticas(df)}
+        for documento, resultados in resultados_lote.items()
+        for nombre, df in resultados.items()
+    ], columns=["Documento", "Comparación"] + list(calcular_estadisticas(None)))
+
+    nombres = dict.fromkeys(n for resultados in resultados_lote.values() for n in resultados)
+    consolidados = {nombre: _partes_comparacion(resultados_lote, nombre) for nombre in nombres}
+    if concatenar:
+        consolidados = {nombre: pd.concat(list(partes), ignore_index=True)
+                        for nombre, partes in consolidados.items()}
+    return df_resumen, consolidados
+
+
+def _tipos_parquet(df):
+    """
+    Convierte a "string" solo las columnas object con valores de tipos
+    mezclados (p. ej. códigos numéricos y de texto), que pyarrow no puede
+    escribir; los faltantes siguen siendo nulos y el resto conserva su tipo.
+    """
+    mezcladas = [
+        col for col in df.columns
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ("string", "empty")
+    ]
+    return df.astype({col: "string" for col in mezcladas}) if mezcladas else df
+
+
+def exportar_lote(ruta_salida, df_resumen, consolidados, df_errores):
+    """
+    Escribe el reporte consolidado del lote. Con extensión .parquet se genera un
+    archivo con todos los resultados (columnas "Documento" y "Comparación") y,
+    a su lado, <nombre>_resumen.parquet y <nombre>_errores.parquet; en otro caso
+    un Excel con las hojas "Resumen", "Errores" y una hoja por comparación
+    (escrito en streaming, ver escribir_excel).
+    Cada valor de `consolidados` puede ser un DataFrame o un iterable de
+    DataFrames (ver consolidar_lote(..., concatenar=False)).
+    """
+    if ruta_salida.lower().endswith(".parquet"):
+        base = ruta_salida[: -len(".parquet")]
+        frames = [
+            df.assign(**{"Comparación": nombre})
+            for nombre, partes in consolidados.items()
+            for df in ([partes] if isinstance(partes, pd.DataFrame) else partes)
+        ]
+        df_todo = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        _tipos_parquet(df_todo).to_parquet(ruta_salida, index=False)
+        _tipos_parquet(df_resumen).to_parquet(f"{base}_resumen.parquet", index=False)
+        _tipos_parquet(df_errores).to_parquet(f"{base}_errores.parquet", index=False)
+        return
+
+    escribir_excel(ruta_salida, {"Resumen": df_resumen, "Errores": df_errores, **consolidados})
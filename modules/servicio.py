@@ -0,0 +1,356 @@
+"""
+Modo servicio: API HTTP local (sin dependencias externas) para enviar un PEI y
+consultar sus comparaciones como JSON.
+
+    POST /trabajos?nombre=pei.pdf      cuerpo = bytes del archivo  → 202 {"id": ...}
+    GET  /trabajos/<id>                estado y tiempos por etapa
+    GET  /trabajos/<id>/resultados     resumen y las cuatro comparaciones
+                                       (202 mientras procesa, 422 si el trabajo falló)
+    GET  /trabajos/<id>/eventos        flujo NDJSON (una línea JSON por evento)
+    GET  /salud                        estado de la cola y de los trabajadores
+
+Uso:
+    python -m modules.servicio [--puerto 8000] [--trabajadores 2] [--cola 16]
+"""
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from modules.extract_tables import extraer_tablas
+from modules.comparador import comparar_tablas, precargar_estandar
+from modules.modelo import calentar_modelo
+from modules.cache_resultados import clave_resultados, leer_cache, guardar_cache
+from modules.reporte import resumen_resultados
+
+RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+EXTENSIONES = (".docx", ".pdf")
+TAMANO_MAXIMO_ARCHIVO = 50 * 1024 * 1024
+MAX_TRABAJOS_GUARDADOS = 200  # trabajos terminados que se conservan en memoria
+ESPERA_REINTENTO = 5  # segundos sugeridos en Retry-After cuando la cola está llena
+
+EN_COLA, PROCESANDO, TERMINADO, FALLIDO = "en_cola", "procesando", "terminado", "fallido"
+
+
+# === JSON ===
+def _json_defecto(valor):
+    # Tipos numpy (int64, float32, ...) y similares
+    if hasattr(valor, "item"):
+        return valor.item()
+    return str(valor)
+
+
+def _a_json(datos):
+    return json.dumps(datos, ensure_ascii=False, default=_json_defecto).encode("utf-8")
+
+
+def _df_a_registros(df):
+    return json.loads(df.to_json(orient="records", force_ascii=False))
+
+
+# === TRABAJOS ===
+def _nuevo_trabajo(nombre, contenido):
+    return {
+        "id": uuid.uuid4().hex,
+        "nombre": nombre,
+        "contenido": contenido,
+        "estado": EN_COLA,
+        "error": None,
+        "creado": time.time(),
+        "tiempos": {},
+        "resumen": None,
+        "resultados": None,
+        "eventos": [{"evento": "estado", "estado": EN_COLA}],
+    }
+
+
+def _vista_trabajo(trabajo):
+    return {
+        "id": trabajo["id"],
+        "nombre": trabajo["nombre"],
+        "estado": trabajo["estado"],
+        "error": trabajo["error"],
+        "tiempos": trabajo["tiempos"],
+        "resumen": trabajo["resumen"],
+    }
+
+
+class Servicio:
+    """
+    Cola acotada de trabajos atendida por un número fijo de hilos trabajadores
+    que comparten el modelo cargado en memoria. Si la cola está llena, los
+    nuevos envíos se rechazan (el cliente debe reintentar más tarde).
+    """
+
+    def __init__(self, ruta_estandar=RUTA_ESTANDAR, trabajadores=2, tamano_cola=16,
+                 umbral=0.75, num_candidatos=1, usar_cache=True):
+        self.ruta_estandar = ruta_estandar
+        self.umbral = umbral
+        self.num_candidatos = num_candidatos
+        self.usar_cache = usar_cache
+        self.cola = queue.Queue(maxsize=tamano_cola)
+        self.trabajos = {}
+        self.cambios = threading.Condition()
+        self.hilos = [
+            threading.Thread(target=self._trabajador, name=f"trabajador-{n}", daemon=True)
+            for n in range(trabajadores)
+        ]
+
+    def iniciar(self):
+        calentar_modelo()
+        precargar_estandar(self.ruta_estandar)
+        for hilo in self.hilos:
+            hilo.start()
+
+    # --- Registro de trabajos y eventos ---
+    def enviar(self, nombre, contenido):
+        """
+        Encola un trabajo y devuelve su diccionario, o None si la cola está llena.
+        """
+        trabajo = _nuevo_trabajo(nombre, contenido)
+        with self.cambios:
+            self.trabajos[trabajo["id"]] = trabajo
+        try:
+            self.cola.put_nowait(trabajo)
+        except queue.Full:
+            with self.cambios:
+                del self.trabajos[trabajo["id"]]
+            return None
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        with self.cambios:
+            return self.trabajos.get(id_trabajo)
+
+    def _emitir(self, trabajo, **evento):
+        with self.cambios:
+            trabajo["eventos"].append(evento)
+            self.cambios.notify_all()
+
+    def _cambiar_estado(self, trabajo, estado, **extra):
+        with self.cambios:
+            trabajo["estado"] = estado
+            trabajo.update(extra)
+        self._emitir(trabajo, evento="estado", estado=estado, **extra)
+
+    def esperar_eventos(self, trabajo, desde, espera=15.0):
+        """
+        Devuelve los eventos del trabajo a partir de la posición `desde`,
+        esperando hasta `espera` segundos si todavía no hay nuevos.
+        """
+        with self.cambios:
+            self.cambios.wait_for(lambda: len(trabajo["eventos"]) > desde, timeout=espera)
+            return trabajo["eventos"][desde:], trabajo["estado"] in (TERMINADO, FALLIDO)
+
+    def _depurar(self):
+        # Conserva solo los últimos trabajos terminados
+        with self.cambios:
+            terminados = sorted(
+                (t for t in self.trabajos.values() if t["estado"] in (TERMINADO, FALLIDO)),
+                key=lambda t: t["creado"]
+            )
+            for trabajo in terminados[:max(0, len(terminados) - MAX_TRABAJOS_GUARDADOS)]:
+                del self.trabajos[trabajo["id"]]
+
+    # --- Procesamiento ---
+    def _trabajador(self):
+        while True:
+            trabajo = self.cola.get()
+            try:
+                self._procesar(trabajo)
+            except Exception as e:
+                self._cambiar_estado(trabajo, FALLIDO, error=f"{type(e).__name__}: {e}")
+            finally:
+                trabajo["contenido"] = None  # libera los bytes del archivo
+                self.cola.task_done()
+                self._depurar()
+
+    def _procesar(self, trabajo):
+        tiempos = trabajo["tiempos"]
+        inicio = time.perf_counter()
+        tiempos["en_cola"] = round(time.time() - trabajo["creado"], 3)
+        self._cambiar_estado(trabajo, PROCESANDO)
+
+        resultados = None
+        clave = None
+        if self.usar_cache:
+            clave = clave_resultados(trabajo["contenido"], self.ruta_estandar, self.umbral, self.num_candidatos)
+            en_cache = leer_cache(clave)
+            if en_cache is not None:
+                tablas, resultados = en_cache
+                tiempos["cache"] = round(time.perf_counter() - inicio, 3)
+
+        if resultados is None:
+            t0 = time.perf_counter()
+            archivo = BytesIO(trabajo["contenido"])
+            archivo.name = trabajo["nombre"]
+            tablas = extraer_tablas(archivo, trabajadores=1)
+            tiempos["extraccion"] = round(time.perf_counter() - t0, 3)
+            self._emitir(trabajo, evento="tablas", tablas=sorted(tablas))
+
+            t0 = time.perf_counter()
+            resultados = comparar_tablas(self.ruta_estandar, tablas, self.umbral, num_candidatos=self.num_candidatos)
+            tiempos["comparacion"] = round(time.perf_counter() - t0, 3)
+            if clave is not None:
+                guardar_cache(clave, tablas, resultados)
+
+        registros = {}
+        for nombre, df in resultados.items():
+            registros[nombre] = _df_a_registros(df)
+            self._emitir(trabajo, evento="resultado", comparacion=nombre, filas=registros[nombre])
+
+        resumen = _df_a_registros(resumen_resultados(resultados))
+        tiempos["total"] = round(time.perf_counter() - inicio, 3)
+        trabajo["resultados"] = registros
+        trabajo["resumen"] = resumen
+        self._emitir(trabajo, evento="resumen", resumen=resumen, tiempos=tiempos)
+        self._cambiar_estado(trabajo, TERMINADO)
+
+
+# === HTTP ===
+class ManejadorHTTP(BaseHTTPRequestHandler):
+    servicio = None  # se asigna en crear_servidor
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass  # sin registro por petición en la consola
+
+    def _responder(self, codigo, datos, cabeceras=None):
+        cuerpo = _a_json(datos)
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _partes(self):
+        return [p for p in urlparse(self.path).path.split("/") if p]
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if self._partes() != ["trabajos"]:
+            return self._responder(404, {"error": "Ruta no encontrada"})
+
+        nombre = (parse_qs(url.query).get("nombre") or [self.headers.get("X-Nombre-Archivo", "")])[0]
+        if not nombre.lower().endswith(EXTENSIONES):
+            return self._responder(400, {"error": "Indique ?nombre=archivo.docx o archivo.pdf"})
+
+        largo = int(self.headers.get("Content-Length") or 0)
+        if largo <= 0:
+            return self._responder(400, {"error": "El cuerpo de la petición está vacío"})
+        if largo > TAMANO_MAXIMO_ARCHIVO:
+            return self._responder(413, {"error": "Archivo demasiado grande"})
+        contenido = self.rfile.read(largo)
+
+        trabajo = self.servicio.enviar(nombre, contenido)
+        if trabajo is None:
+            return self._responder(
+                503, {"error": "Cola llena, reintente más tarde"},
+                {"Retry-After": str(ESPERA_REINTENTO)}
+            )
+        self._responder(202, {"id": trabajo["id"], "estado": trabajo["estado"]},
+                        {"Location": f"/trabajos/{trabajo['id']}"})
+
+    def do_GET(self):
+        partes = self._partes()
+        if partes == ["salud"]:
+            return self._responder(200, {
+                "estado": "ok",
+                "en_cola": self.servicio.cola.qsize(),
+                "capacidad_cola": self.servicio.cola.maxsize,
+                "trabajadores": len(self.servicio.hilos),
+            })
+        if len(partes) < 2 or partes[0] != "trabajos" or len(partes) > 3:
+            return self._responder(404, {"error": "Ruta no encontrada"})
+
+        trabajo = self.servicio.obtener(partes[1])
+        if trabajo is None:
+            return self._responder(404, {"error": "Trabajo no encontrado"})
+
+        if len(partes) == 2:
+            return self._responder(200, _vista_trabajo(trabajo))
+        if partes[2] == "resultados":
+            if trabajo["estado"] == FALLIDO:
+                # El documento no se pudo procesar (ilegible, sin tablas, ...): no es un error del servidor
+                return self._responder(422, _vista_trabajo(trabajo))
+            if trabajo["estado"] != TERMINADO:
+                return self._responder(202, _vista_trabajo(trabajo))
+            return self._responder(200, {**_vista_trabajo(trabajo), "resultados": trabajo["resultados"]})
+        if partes[2] == "eventos":
+            return self._transmitir_eventos(trabajo)
+        self._responder(404, {"error": "Ruta no encontrada"})
+
+    def _transmitir_eventos(self, trabajo):
+        """
+        Envía los eventos del trabajo como NDJSON (chunked) hasta que termina.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        enviados, fin = 0, False
+        try:
+            while not fin:
+                eventos, fin = self.servicio.esperar_eventos(trabajo, enviados)
+                enviados += len(eventos)
+                for evento in eventos:
+                    linea = _a_json(evento) + b"\n"
+                    self.wfile.write(f"{len(linea):X}\r\n".encode() + linea + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # el cliente cerró la conexión
+
+
+def crear_servidor(host="127.0.0.1", puerto=8000, **opciones):
+    """
+    Crea (sin iniciar el bucle de peticiones) el servidor HTTP y su servicio de
+    trabajos. Con puerto=0 se elige un puerto libre (útil en pruebas de
+    integración: servidor.server_address[1]).
+    """
+    servicio = Servicio(**opciones)
+    servicio.iniciar()
+    manejador = type("Manejador", (ManejadorHTTP,), {"servicio": servicio})
+    servidor = ThreadingHTTPServer((host, puerto), manejador)
+    servidor.daemon_threads = True
+    servidor.servicio = servicio
+    return servidor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m modules.servicio",
+                                     description="API HTTP del comparador PEI-GL")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--trabajadores", type=int, default=2, help="Hilos que procesan trabajos")
+    parser.add_argument("--cola", type=int, default=16, help="Trabajos en espera antes de rechazar (503)")
+    parser.add_argument("--estandar", default=RUTA_ESTANDAR, help="Libro Excel de la matriz estándar")
+    parser.add_argument("--umbral", type=float, default=0.75)
+    parser.add_argument("--candidatos", type=int, default=1)
+    parser.add_argument("--sin-cache", action="store_true", help="No usar la caché de resultados en disco")
+    args = parser.parse_args(argv)
+
+    servidor = crear_servidor(
+        args.host, args.puerto, ruta_estandar=args.estandar, trabajadores=max(1, args.trabajadores),
+        tamano_cola=max(1, args.cola), umbral=args.umbral, num_candidatos=args.candidatos,
+        usar_cache=not args.sin_cache,
+    )
+    print(f"✅ Servicio escuchando en http://{args.host}:{servidor.server_address[1]}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Trazas ligeras por etapa: tiempo, memoria máxima (RSS), filas y aciertos de caché.
+
+    with tramo("motor.codificar", filas=len(textos)) as t:
+        ...
+        t.anotar(cache="fallo")
+
+Cada tramo terminado se escribe como una línea JSON (nivel INFO) en el logger
+"pei.trazas" y, si hay una traza en curso (iniciar_traza), se agrega a su lista
+para mostrarla en la app. Con PEI_TRAZAS_LOG=1 las líneas se envían a stderr y
+con PEI_TRAZAS_ARCHIVO=<ruta> a ese archivo; si no, quedan a cargo de la
+configuración de logging de quien use el módulo.
+Con PEI_TRAZAS=0 los tramos no hacen nada (costo despreciable).
+"""
+import os
+import sys
+import json
+import time
+import logging
+import functools
+from contextvars import ContextVar
+
+try:
+    import resource  # No disponible en Windows
+except ImportError:
+    resource = None
+
+TRAZAS_ACTIVAS = os.environ.get("PEI_TRAZAS", "1") != "0"
+ARCHIVO_TRAZAS = os.environ.get("PEI_TRAZAS_ARCHIVO")
+LOG_TRAZAS = os.environ.get("PEI_TRAZAS_LOG", "0") != "0"
+
+_registros = ContextVar("registros_traza", default=None)
+_tramo_actual = ContextVar("tramo_actual", default=None)
+
+
+def _crear_logger():
+    logger = logging.getLogger("pei.trazas")
+    if (ARCHIVO_TRAZAS or LOG_TRAZAS) and not logger.handlers:
+        manejador = logging.FileHandler(ARCHIVO_TRAZAS, encoding="utf-8") if ARCHIVO_TRAZAS \
+            else logging.StreamHandler(sys.stderr)
+        manejador.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(manejador)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+_logger = _crear_logger() if TRAZAS_ACTIVAS else None
+
+
+def rss_maximo_mb():
+    """
+    Memoria residente máxima del proceso hasta ahora (MB), o None si no se puede medir.
+    """
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB, macOS en bytes
+    return round(maximo / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# === TRAMOS ===
+class _TramoNulo:
+    hijos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def anotar(self, **atributos):
+        pass
+
+
+_TRAMO_NULO = _TramoNulo()
+
+
+class _Tramo:
+    __slots__ = ("datos", "hijos", "_inicio", "_rss_inicio", "_token")
+
+    def __init__(self, nombre, atributos):
+        self.datos = {"tramo": nombre, **atributos}
+        self.hijos = 0
+
+    def anotar(self, **atributos):
+        """
+        Agrega atributos al tramo (p. ej. filas=120, cache="acierto").
+        """
+        self.datos.update(atributos)
+
+    def __enter__(self):
+        padre = _tramo_actual.get()
+        if padre is not None:
+            padre.hijos += 1
+            self.datos["padre"] = padre.datos["tramo"]
+        self._token = _tramo_actual.set(self)
+        self._rss_inicio = rss_maximo_mb()
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_exc, exc, tb):
+        self.datos["segundos"] = round(time.perf_counter() - self._inicio, 6)
+        _tramo_actual.reset(self._token)
+        rss = rss_maximo_mb()
+        if rss is not None:
+            self.datos["rss_max_mb"] = rss
+            self.datos["rss_aumento_mb"] = round(rss - self._rss_inicio, 1)
+        if tipo_exc is not None:
+            self.datos["error"] = f"{tipo_exc.__name__}: {exc}"
+
+        registros = _registros.get()
+        if registros is not None:
+            registros.append(self.datos)
+        if _logger.isEnabledFor(logging.INFO):
+            _logger.info(json.dumps(self.datos, ensure_ascii=False, default=str))
+        return False
+
+
+def tramo(nombre, **atributos):
+    """
+    Context manager que mide una etapa. Devuelve un objeto con `anotar(**atributos)`.
+    """
+    if not TRAZAS_ACTIVAS:
+        return _TRAMO_NULO
+    return _Tramo(nombre, atributos)
+
+
+def trazar(nombre):
+    """
+    Decorador: ejecuta la función dentro de un tramo `nombre`. Con las trazas
+    desactivadas devuelve la función original, sin envoltorio.
+    """
+    def decorador(funcion):
+        if not TRAZAS_ACTIVAS:
+            return funcion
+
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            with _Tramo(nombre, {}):
+                return funcion(*args, **kwargs)
+        return envoltorio
+    return decorador
+
+
+def anotar(**atributos):
+    """
+    Agrega atributos al tramo en curso (si lo hay).
+    """
+    actual = _tramo_actual.get()
+    if actual is not None:
+        actual.anotar(**atributos)
+
+
+def iniciar_traza():
+    """
+    Empieza a reunir los tramos de la ejecución actual (contexto actual) y
+    devuelve la lista donde se irán agregando.
+    """
+    registros = []
+    _registros.set(registros)
+    return registros
@@ -0,0 +1,335 @@
+"""
+Historial de versiones del PEI de cada municipalidad y re-comparación
+incremental entre versiones.
+
+Cada archivo que se compara para una municipalidad se guarda como una versión
+(<carpeta>/<municipalidad>/v0001, v0002, ...: tablas extraídas y resultados en
+Parquet). Al comparar una versión nueva, sus filas se contrastan con las de la
+versión anterior por código y texto normalizado: solo las filas nuevas o
+modificadas se codifican y se emparejan con el estándar; las demás reutilizan
+su resultado. Los resultados llevan la columna "Cambio" y se arma un reporte
+de cambios entre versiones (incluidas las filas eliminadas).
+
+Uso:
+    python -m modules.versiones MUNICIPALIDAD                       # lista las versiones
+    python -m modules.versiones MUNICIPALIDAD ARCHIVO [-o cambios.xlsx] [opciones]
+"""
+import os
+import re
+import sys
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from modules.comparador import COMPARACIONES, PADRES
+from modules.motor import ejecutar_comparaciones, padres_emparejados
+from modules.normalizacion import normalizar_texto
+from modules.cache_resultados import clave_resultados, escribir_tablas, leer_tablas, pyarrow
+from modules.trazas import trazar, anotar
+
+RUTA_ESTANDAR = "Extraer_por_elemento_MEGL.xlsx"
+CARPETA_VERSIONES = os.environ.get("PEI_CARPETA_VERSIONES", ".versiones_pei")
+
+CAMPOS_VERSION = ("version", "fecha", "archivo", "huella", "parametros")
+COLUMNA_CAMBIO = "Cambio"
+NUEVO, MODIFICADO, SIN_CAMBIOS, ELIMINADO = "Nuevo", "Modificado", "Sin cambios", "Eliminado"
+COLUMNAS_CAMBIOS = [
+    "Comparación", "Código del GL", "Cambio",
+    "Elemento anterior", "Elemento actual", "Resultado anterior", "Resultado actual",
+]
+
+
+# === ALMACÉN DE VERSIONES ===
+def carpeta_municipio(municipio, carpeta=CARPETA_VERSIONES):
+    """
+    Carpeta de las versiones de una municipalidad ("Municipalidad de Jesús
+    María" -> <carpeta>/municipalidad_de_jesus_maria).
+    """
+    nombre = re.sub(r"[^a-z0-9]+", "_", normalizar_texto(municipio)).strip("_")
+    if not nombre:
+        raise ValueError("Falta el nombre de la municipalidad.")
+    return os.path.join(carpeta, nombre)
+
+
+def listar_versiones(municipio, carpeta=CARPETA_VERSIONES):
+    """
+    Metadatos de las versiones guardadas de la municipalidad, de la más
+    antigua a la más reciente: [{campo: valor}] con los CAMPOS_VERSION.
+    """
+    ruta = carpeta_municipio(municipio, carpeta)
+    if not os.path.isdir(ruta):
+        return []
+    versiones = []
+    for nombre in sorted(os.listdir(ruta)):
+        indice = os.path.join(ruta, nombre, "indice.json")
+        if re.fullmatch(r"v\d+", nombre) and os.path.isfile(indice):
+            metadatos = leer_tablas(os.path.join(ruta, nombre), ())[0]
+            versiones.append({clave: metadatos.get(clave) for clave in CAMPOS_VERSION})
+    return versiones
+
+
+def leer_version(municipio, version, carpeta=CARPETA_VERSIONES):
+    """
+    (metadatos, tablas, resultados) de una versión guardada.
+    """
+    if pyarrow is None:
+        raise ImportError("Falta instalar pyarrow: pip install pyarrow")
+    ruta = os.path.join(carpeta_municipio(municipio, carpeta), f"v{version:04d}")
+    indice, grupos = leer_tablas(ruta, ("tablas", "resultados"))
+    return indice, grupos["tablas"], grupos["resultados"]
+
+
+def version_anterior(municipio, huella=None, carpeta=CARPETA_VERSIONES):
+    """
+    Versión más reciente distinta del archivo `huella` (si se vuelve a subir la
+    última versión, se compara con la previa): (metadatos, tablas, resultados)
+    o None si no hay ninguna o no se puede leer.
+    """
+    for metadatos in reversed(listar_versiones(municipio, carpeta)):
+        if huella is not None and metadatos.get("huella") == huella:
+            continue
+        try:
+            return leer_version(municipio, metadatos["version"], carpeta)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Versión {metadatos['version']} ilegible, se ignora: {e}")
+            return None
+    return None
+
+
+def guardar_version(municipio, tablas, resultados, parametros, huella=None, archivo=None,
+                    carpeta=CARPETA_VERSIONES):
+    """
+    Guarda las tablas y los resultados (sin la columna "Cambio") como la
+    siguiente versión de la municipalidad y devuelve su número. Si la última
+    versión es el mismo archivo (misma `huella`) no se duplica.
+    """
+    if pyarrow is None:
+        raise ImportError("Falta instalar pyarrow: pip install pyarrow")
+    versiones = listar_versiones(municipio, carpeta)
+    if versiones and huella is not None and versiones[-1].get("huella") == huella:
+        return versiones[-1]["version"]
+
+    version = versiones[-1]["version"] + 1 if versiones else 1
+    escribir_tablas(
+        os.path.join(carpeta_municipio(municipio, carpeta), f"v{version:04d}"),
+        {
+            "tablas": tablas,
+            "resultados": {
+                nombre: df.drop(columns=COLUMNA_CAMBIO, errors="ignore") for nombre, df in resultados.items()
+            },
+        },
+        version=version, fecha=datetime.now().isoformat(timespec="seconds"),
+        archivo=archivo, huella=huella, parametros=parametros,
+    )
+    return version
+
+
+# === DIFERENCIAS ENTRE VERSIONES ===
+def claves_filas(prep):
+    """
+    (código, texto normalizado) de cada fila preparada de una tabla.
+    """
+    codigos = prep["df"][prep["col_codigo"]].astype(str).str.strip().tolist()
+    return list(zip(codigos, prep["textos_norm"]))
+
+
+def clasificar_filas(claves_anteriores, claves_actuales):
+    """
+    Compara las filas de dos versiones de una tabla. Devuelve (cambios,
+    posiciones): el cambio de cada fila actual (Nuevo: código que no existía;
+    Modificado: mismo código con otro texto; Sin cambios) y la fila de la
+    versión anterior con el mismo código y texto (-1 si no hay).
+    """
+    anteriores = {}
+    for i, clave in enumerate(claves_anteriores):
+        anteriores.setdefault(clave, i)
+    codigos_anteriores = {codigo for codigo, _ in claves_anteriores}
+
+    posiciones = np.array([anteriores.get(clave, -1) for clave in claves_actuales], dtype=np.int64)
+    cambios = [
+        SIN_CAMBIOS if p >= 0 else MODIFICADO if codigo in codigos_anteriores else NUEVO
+        for (codigo, _), p in zip(claves_actuales, posiciones)
+    ]
+    return cambios, posiciones
+
+
+def _preparar(df, espec):
+    # Filas preparadas de una tabla de la versión anterior (None si no hay o no se reconoce)
+    if df is None:
+        return None
+    try:
+        return espec["preparar"](df, espec)
+    except Exception:
+        return None
+
+
+def _filas_cambios(nombre, prep, prep_anterior, resultado, resultado_anterior, cambios):
+    """
+    Filas del reporte de cambios de una comparación: filas nuevas y
+    modificadas de la versión actual y filas eliminadas de la anterior.
+    """
+    codigos = [codigo for codigo, _ in claves_filas(prep)] if prep else []
+    textos = prep["df"][prep["col_texto"]].tolist() if prep else []
+    anteriores = {}
+    if prep_anterior is not None:
+        textos_anteriores = prep_anterior["df"][prep_anterior["col_texto"]].tolist()
+        categorias_anteriores = resultado_anterior["Resultado"].tolist() \
+            if resultado_anterior is not None and len(resultado_anterior) == len(textos_anteriores) \
+            else [""] * len(textos_anteriores)
+        for (codigo, _), texto, categoria in zip(
+            claves_filas(prep_anterior), textos_anteriores, categorias_anteriores
+        ):
+            anteriores.setdefault(codigo, (texto, categoria))
+
+    filas = []
+    for codigo, texto, categoria, cambio in zip(codigos, textos, resultado["Resultado"], cambios):
+        if cambio != SIN_CAMBIOS:
+            texto_anterior, categoria_anterior = anteriores.get(codigo, ("", ""))
+            filas.append([nombre, codigo, cambio, texto_anterior, texto, categoria_anterior, categoria])
+    actuales = set(codigos)
+    for codigo in [c for c in anteriores if c not in actuales]:
+        texto_anterior, categoria_anterior = anteriores[codigo]
+        filas.append([nombre, codigo, ELIMINADO, texto_anterior, "", categoria_anterior, ""])
+    return filas
+
+
+# === COMPARACIÓN INCREMENTAL ===
+@trazar("versiones.comparar")
+def comparar_version(ruta_estandar, municipio, tablas, umbral=0.75, num_candidatos=1,
+                     diferencias_diferidas=False, huella=None, archivo=None, carpeta=CARPETA_VERSIONES):
+    """
+    Compara las `tablas` de una nueva versión del PEI de la municipalidad
+    reutilizando los resultados de la versión anterior y la guarda como una
+    versión más. Solo las filas nuevas o modificadas (o cuyo OEI padre se
+    emparejó distinto) pasan por el modelo; si la versión anterior se comparó
+    con otros parámetros, estándar o modelo, se comparan todas las filas.
+    `huella` identifica el archivo (p. ej. clave_resultados) para no duplicar
+    versiones al volver a subirlo.
+
+    Devuelve (resultados, df_cambios, informe): los resultados de cada
+    comparación con la columna "Cambio" al inicio, el reporte de cambios
+    (COLUMNAS_CAMBIOS) y {"version", "anterior", "reutilizadas", "recalculadas"}.
+    """
+    parametros = clave_resultados(b"", ruta_estandar, umbral, num_candidatos, diferencias_diferidas)
+    anterior = version_anterior(municipio, huella, carpeta)
+    metadatos_anteriores, tablas_anteriores, resultados_anteriores = anterior or ({}, {}, {})
+    reutilizable = metadatos_anteriores.get("parametros") == parametros
+
+    resultados, filas_cambios = {}, []
+    reutilizadas = recalculadas = 0
+    # Primero las comparaciones sin padre: los AEI necesitan el resultado final de su OEI
+    fases = [[n for n in COMPARACIONES if n not in PADRES], [n for n in COMPARACIONES if n in PADRES]]
+    for fase in fases:
+        trabajos, estado = {}, {}
+        for nombre in fase:
+            tabla, espec = COMPARACIONES[nombre]
+            prep = espec["preparar"](tablas[tabla], espec) if tablas.get(tabla) is not None else None
+            prep_anterior = _preparar(tablas_anteriores.get(tabla), espec)
+            resultado_anterior = resultados_anteriores.get(nombre)
+            claves = claves_filas(prep) if prep else []
+            cambios, posiciones = clasificar_filas(claves_filas(prep_anterior) if prep_anterior else [], claves)
+
+            if not reutilizable or resultado_anterior is None or prep_anterior is None \
+                    or len(resultado_anterior) != len(prep_anterior["textos_norm"]):
+                posiciones[:] = -1
+            elif nombre in PADRES and PADRES[nombre] in resultados_anteriores:
+                # Las filas cuyo padre se empareja distinto que antes se vuelven a buscar
+                codigo_padre = espec["codigo_padre"]
+                actual = padres_emparejados(resultados[PADRES[nombre]], codigo_padre)
+                previo = padres_emparejados(resultados_anteriores[PADRES[nombre]], codigo_padre)
+                for i, (codigo, _) in enumerate(claves):
+                    if actual.get(codigo_padre(codigo)) != previo.get(codigo_padre(codigo)):
+                        posiciones[i] = -1
+
+            pendientes = np.flatnonzero(posiciones < 0)
+            if prep is None or len(pendientes) or not len(claves):
+                # Solo las filas pendientes (ya preparadas: preparar es idempotente)
+                df = None if prep is None else prep["df"].iloc[pendientes]
+                trabajos[nombre] = (espec, df, resultados.get(PADRES.get(nombre)))
+            estado[nombre] = (prep, prep_anterior, resultado_anterior, cambios, posiciones, pendientes)
+
+        nuevos = ejecutar_comparaciones(
+            ruta_estandar, trabajos, umbral, num_candidatos, diferencias_diferidas=diferencias_diferidas
+        ) if trabajos else {}
+
+        for nombre in fase:
+            prep, prep_anterior, resultado_anterior, cambios, posiciones, pendientes = estado[nombre]
+            reutilizar = np.flatnonzero(posiciones >= 0)
+            partes = [df for df in (
+                resultado_anterior.iloc[posiciones[reutilizar]].set_axis(reutilizar) if len(reutilizar) else None,
+                nuevos[nombre].set_axis(pendientes) if nombre in nuevos and len(pendientes) else None,
+            ) if df is not None]
+            resultado = pd.concat(partes).sort_index().reset_index(drop=True) if partes else nuevos[nombre]
+            resultado.insert(0, COLUMNA_CAMBIO, cambios if len(resultado) else [])
+            resultados[nombre] = resultado
+            reutilizadas += len(reutilizar)
+            recalculadas += len(pendientes)
+            filas_cambios += _filas_cambios(nombre, prep, prep_anterior, resultado, resultado_anterior, cambios)
+
+    resultados = {nombre: resultados[nombre] for nombre in COMPARACIONES}
+    version = guardar_version(municipio, tablas, resultados, parametros, huella, archivo, carpeta)
+    informe = {
+        "version": version,
+        "anterior": metadatos_anteriores.get("version"),
+        "reutilizadas": reutilizadas,
+        "recalculadas": recalculadas,
+    }
+    anotar(**informe)
+    return resultados, pd.DataFrame(filas_cambios, columns=COLUMNAS_CAMBIOS), informe
+
+
+# === LÍNEA DE COMANDOS ===
+def main(argv=None):
+    from modules.extract_tables import extraer_tablas
+    from modules.reporte import exportar_excel, resumen_resultados
+
+    parser = argparse.ArgumentParser(
+        prog="python -m modules.versiones",
+        description="Historial de versiones del PEI de una municipalidad y comparación incremental."
+    )
+    parser.add_argument("municipio", help="Nombre de la municipalidad")
+    parser.add_argument("archivo", nargs="?", help="Nueva versión del PEI (.docx / .pdf); sin él se listan las versiones")
+    parser.add_argument("-o", "--salida", default="Comparativo_PEIGL_Version.xlsx", help="Reporte Excel")
+    parser.add_argument("--estandar", default=RUTA_ESTANDAR, help="Libro Excel de la matriz estándar")
+    parser.add_argument("--umbral", type=float, default=0.75)
+    parser.add_argument("--candidatos", type=int, default=1, help="Candidatos del estándar por fila")
+    parser.add_argument("--carpeta", default=CARPETA_VERSIONES, help="Carpeta del historial de versiones")
+    args = parser.parse_args(argv)
+
+    if args.archivo is None:
+        versiones = listar_versiones(args.municipio, args.carpeta)
+        if not versiones:
+            print(f"ℹ️ No hay versiones guardadas de {args.municipio}")
+        for v in versiones:
+            print(f"v{v['version']:04d}  {v['fecha']}  {v.get('archivo') or ''}")
+        return 0
+
+    with open(args.archivo, "rb") as archivo:
+        huella = clave_resultados(archivo, args.estandar, args.umbral, args.candidatos)
+        tablas = extraer_tablas(archivo)
+    if not tablas:
+        print("❌ No se encontraron tablas OEI o AEI en el documento.")
+        return 1
+
+    resultados, df_cambios, informe = comparar_version(
+        args.estandar, args.municipio, tablas, args.umbral, args.candidatos,
+        huella=huella, archivo=os.path.basename(args.archivo), carpeta=args.carpeta,
+    )
+    if informe["anterior"] is None:
+        print(f"✅ Versión {informe['version']} guardada (primera versión: {informe['recalculadas']} filas comparadas)")
+    else:
+        print(f"✅ Versión {informe['version']} guardada: {informe['recalculadas']} filas comparadas, "
+              f"{informe['reutilizadas']} reutilizadas de la versión {informe['anterior']}")
+    for cambio, cantidad in df_cambios["Cambio"].value_counts().items():
+        print(f"  {cambio}: {cantidad}")
+
+    with open(args.salida, "wb") as f:
+        f.write(exportar_excel(resumen_resultados(resultados), resultados, df_cambios))
+    print(f"✅ Reporte guardado en {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Un documento que falla al emparejarse o al armar su resultado no debe
+interrumpir el lote: se registra como error y el resto termina.
+
+El modelo y el libro estándar se reemplazan por dobles mínimos.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules import comparador, lote, motor, reporte
+
+COLUMNAS = ["Código del GL", "Resultado"]
+
+
+def _preparar(df, espec):
+    return {"df": df, "col_texto": "texto", "col_codigo": "codigo", "textos_norm": df["texto"].tolist()}
+
+
+def _construir(prep, espec, df_estandar, textos_estandar_norm, puntajes, indices, umbral,
+               diferencias_diferidas=False):
+    if (prep["df"]["texto"] == "falla").any():
+        raise RuntimeError("fallo al armar el resultado")
+    return pd.DataFrame({"Código del GL": prep["df"]["codigo"].to_numpy(), "Resultado": "Coincidencia exacta"},
+                        columns=COLUMNAS)
+
+
+ESPEC = {
+    "hoja": "OEI", "col_estandar_texto": "texto", "col_estandar_codigo": "codigo",
+    "normalizador": None, "version_normalizacion": "prueba", "columnas_resultado": COLUMNAS,
+    "preparar": _preparar, "construir": _construir,
+}
+
+
+def _tablas(*textos):
+    return {"OEI": pd.DataFrame({"codigo": [f"OEI.{i + 1:02d}" for i in range(len(textos))], "texto": list(textos)})}
+
+
+@pytest.fixture(autouse=True)
+def motor_simulado(monkeypatch):
+    estandar = pd.DataFrame({"codigo": ["OEI.01", "OEI.02"], "texto": ["a", "b"]})
+    monkeypatch.setattr(comparador, "COMPARACIONES", {"OEI": ("OEI", ESPEC)})
+    monkeypatch.setattr(comparador, "PADRES", {})
+    monkeypatch.setattr(motor, "obtener_embeddings_estandar_lote", lambda ruta, solicitudes: [
+        (["a", "b"], np.eye(2, dtype=np.float32), {"a": 0, "b": 1}) for _ in solicitudes
+    ])
+    monkeypatch.setattr(motor, "cargar_hoja_estandar", lambda *args, **kwargs: estandar)
+    monkeypatch.setattr(motor, "codificar", lambda textos: np.ones((len(textos), 2), dtype=np.float32))
+
+
+def test_comparar_documentos_aisla_el_documento_que_falla():
+    errores = {}
+    resultados = comparador.comparar_documentos("estandar.xlsx", {
+        "uno.docx": _tablas("a", "b"),
+        "malo.docx": _tablas("a", "falla"),
+        "dos.docx": _tablas("b", "otro"),
+    }, errores=errores)
+
+    assert list(resultados) == ["uno.docx", "dos.docx"]
+    assert list(resultados["dos.docx"]["OEI"]["Código del GL"]) == ["OEI.01", "OEI.02"]
+    assert list(errores) == ["malo.docx"]
+    assert "fallo al armar el resultado" in errores["malo.docx"]
+
+
+def test_procesar_lote_termina_con_un_documento_fallido(monkeypatch):
+    documentos = {"uno.pdf": _tablas("a"), "malo.pdf": _tablas("falla"), "dos.pdf": _tablas("b")}
+    # Extracción en hilos y sin leer archivos (los procesos no ven los dobles)
+    monkeypatch.setattr(lote, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(lote, "_extraer_documento", lambda ruta: (documentos[ruta], None))
+
+    resultados, errores = lote.procesar_lote(list(documentos), "estandar.xlsx", usar_cache=False)
+
+    assert list(resultados) == ["uno.pdf", "dos.pdf"]
+    assert [(e["Documento"], e["Etapa"]) for e in errores] == [("malo.pdf", "comparación")]
+
+
+def test_procesar_lote_aisla_errores_comunes_del_grupo(monkeypatch):
+    documentos = {"uno.pdf": _tablas("x"), "malo.pdf": _tablas("rompe-codificacion"), "dos.pdf": _tablas("y")}
+    monkeypatch.setattr(lote, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(lote, "_extraer_documento", lambda ruta: (documentos[ruta], None))
+
+    def codificar(textos):
+        if "rompe-codificacion" in textos:
+            raise RuntimeError("fallo al codificar")
+        return np.ones((len(textos), 2), dtype=np.float32)
+    monkeypatch.setattr(motor, "codificar", codificar)
+
+    resultados, errores = lote.procesar_lote(list(documentos), "estandar.xlsx", usar_cache=False)
+
+    assert list(resultados) == ["uno.pdf", "dos.pdf"]
+    assert errores == [{"Documento": "malo.pdf", "Etapa": "comparación", "Error": "RuntimeError: fallo al codificar"}]
+
+
+def test_exportar_lote_parquet_conserva_nulos_y_tipos(tmp_path):
+    resultados_lote = {
+        "uno.pdf": {"OEI": pd.DataFrame({
+            "Código del GL": ["OEI.01", 2],  # tipos mezclados
+            "Resultado": ["Coincidencia exacta", "No coincide"],
+            "Diferencias detectadas": [None, "+ falta"],
+            "Similitud": [1.0, np.nan],
+        })},
+        "dos.pdf": {"OEI": pd.DataFrame({
+            "Código del GL": ["OEI.02"], "Resultado": ["Coincidencia parcial"],
+            "Diferencias detectadas": ["– sobra"], "Similitud": [0.8],
+        })},
+    }
+    df_resumen, consolidados = reporte.consolidar_lote(resultados_lote, concatenar=False)
+    ruta = str(tmp_path / "lote.parquet")
+    reporte.exportar_lote(ruta, df_resumen, consolidados, pd.DataFrame(columns=lote.COLUMNAS_ERRORES))
+
+    df = pd.read_parquet(ruta)
+    assert df["Diferencias detectadas"].isna().tolist() == [True, False, False]
+    assert df["Similitud"].isna().tolist() == [False, True, False]
+    assert pd.api.types.is_float_dtype(df["Similitud"])
+    assert df["Código del GL"].tolist() == ["OEI.01", "2", "OEI.02"]
+    assert pd.api.types.is_integer_dtype(pd.read_parquet(str(tmp_path / "lote_resumen.parquet"))["Total"])
@@ -0,0 +1,130 @@
+"""
+Prueba de integración del modo servicio: servidor HTTP real en un puerto libre
+con la extracción y la comparación reemplazadas por dobles.
+"""
+import json
+import threading
+import time
+from http.client import HTTPConnection
+
+import pandas as pd
+import pytest
+
+from modules import servicio
+
+RESULTADO = pd.DataFrame({"Código del GL": ["OEI.01"], "Resultado": ["Coincidencia exacta"]})
+
+
+@pytest.fixture
+def liberar():
+    evento = threading.Event()
+    evento.set()
+    return evento
+
+
+@pytest.fixture
+def servidor(monkeypatch, liberar):
+    procesando = threading.Event()
+
+    def extraer_tablas(archivo, trabajadores=None):
+        if archivo.name == "sin_tablas.pdf":
+            raise ValueError("No se encontraron las tablas OEI/AEI")
+        return {"OEI": pd.DataFrame({"codigo": ["OEI.01"]})}
+
+    def comparar_tablas(ruta_estandar, tablas, umbral, num_candidatos=1):
+        procesando.set()
+        liberar.wait(10)
+        return {"OEI (Denominación)": RESULTADO}
+
+    monkeypatch.setattr(servicio, "calentar_modelo", lambda: None)
+    monkeypatch.setattr(servicio, "precargar_estandar", lambda ruta: None)
+    monkeypatch.setattr(servicio, "extraer_tablas", extraer_tablas)
+    monkeypatch.setattr(servicio, "comparar_tablas", comparar_tablas)
+
+    srv = servicio.crear_servidor(puerto=0, trabajadores=1, tamano_cola=1, usar_cache=False)
+    srv.procesando = procesando
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    yield srv
+    liberar.set()
+    srv.shutdown()
+    srv.server_close()
+
+
+def _pedir(srv, metodo, ruta, cuerpo=None):
+    conexion = HTTPConnection("127.0.0.1", srv.server_address[1], timeout=10)
+    try:
+        conexion.request(metodo, ruta, body=cuerpo)
+        respuesta = conexion.getresponse()
+        return respuesta.status, dict(respuesta.getheaders()), respuesta.read()
+    finally:
+        conexion.close()
+
+
+def _enviar(srv, nombre="pei.pdf"):
+    return _pedir(srv, "POST", f"/trabajos?nombre={nombre}", b"%PDF-")
+
+
+def _esperar(srv, id_trabajo, estados=(servicio.TERMINADO, servicio.FALLIDO)):
+    limite = time.time() + 10
+    while time.time() < limite:
+        estado, _, cuerpo = _pedir(srv, "GET", f"/trabajos/{id_trabajo}")
+        assert estado == 200
+        vista = json.loads(cuerpo)
+        if vista["estado"] in estados:
+            return vista
+        time.sleep(0.02)
+    raise AssertionError(f"el trabajo {id_trabajo} no terminó")
+
+
+def test_trabajo_completo(servidor):
+    estado, cabeceras, cuerpo = _enviar(servidor)
+    assert estado == 202
+    id_trabajo = json.loads(cuerpo)["id"]
+    assert cabeceras["Location"] == f"/trabajos/{id_trabajo}"
+
+    assert _esperar(servidor, id_trabajo)["estado"] == servicio.TERMINADO
+
+    estado, _, cuerpo = _pedir(servidor, "GET", f"/trabajos/{id_trabajo}/resultados")
+    assert estado == 200
+    datos = json.loads(cuerpo)
+    assert datos["resultados"] == {"OEI (Denominación)": [{"Código del GL": "OEI.01", "Resultado": "Coincidencia exacta"}]}
+    assert datos["resumen"][0]["Exactas"] == 1
+
+    estado, cabeceras, cuerpo = _pedir(servidor, "GET", f"/trabajos/{id_trabajo}/eventos")
+    assert estado == 200
+    assert cabeceras["Content-Type"].startswith("application/x-ndjson")
+    eventos = [json.loads(linea) for linea in cuerpo.decode("utf-8").splitlines()]
+    assert [e["evento"] for e in eventos] == ["estado", "estado", "tablas", "resultado", "resumen", "estado"]
+    assert eventos[-1]["estado"] == servicio.TERMINADO
+
+
+def test_trabajo_fallido_por_el_documento(servidor):
+    _, _, cuerpo = _enviar(servidor, "sin_tablas.pdf")
+    id_trabajo = json.loads(cuerpo)["id"]
+    assert _esperar(servidor, id_trabajo)["estado"] == servicio.FALLIDO
+
+    estado, _, cuerpo = _pedir(servidor, "GET", f"/trabajos/{id_trabajo}/resultados")
+    assert estado == 422
+    datos = json.loads(cuerpo)
+    assert datos["estado"] == servicio.FALLIDO
+    assert "No se encontraron las tablas" in datos["error"]
+
+
+def test_cola_llena_responde_503(servidor, liberar):
+    liberar.clear()
+    estado, _, cuerpo = _enviar(servidor)  # lo toma el único trabajador y queda bloqueado
+    assert estado == 202
+    assert servidor.procesando.wait(10)
+    id_en_curso = json.loads(cuerpo)["id"]
+
+    estado, _, cuerpo = _pedir(servidor, "GET", f"/trabajos/{id_en_curso}/resultados")
+    assert estado == 202 and json.loads(cuerpo)["estado"] == servicio.PROCESANDO
+
+    assert _enviar(servidor)[0] == 202  # ocupa la cola (capacidad 1)
+    estado, cabeceras, _ = _enviar(servidor)
+    assert estado == 503
+    assert cabeceras["Retry-After"] == str(servicio.ESPERA_REINTENTO)
+
+    liberar.set()
+    assert _esperar(servidor, id_en_curso)["estado"] == servicio.TERMINADO